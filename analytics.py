@@ -0,0 +1,169 @@
+"""
+Registro de búsquedas fuera del camino de lectura.
+
+Las búsquedas del listado se acumulan en memoria y un hilo las escribe por
+lotes en `busquedas_frecuentes`, de modo que atender una búsqueda no toma el
+bloqueo de escritura de la base de datos.
+
+Además de la frecuencia histórica, cada término guarda una puntuación de
+tendencia con decaimiento exponencial (vida media `SEARCH_TRENDING_HALF_LIFE`):
+cada búsqueda aporta 1 y su aporte se reduce a la mitad con cada vida media.
+Se guarda como log2(Σ 2^(t / vida_media)), que no cambia con el paso del
+tiempo: el orden por esa columna indexada es directamente el orden por
+tendencia actual y los top-k salen del índice sin recalcular nada.
+"""
+import math
+import threading
+import time
+import logging
+from datetime import datetime
+from config import config
+from database import connection
+
+logger = logging.getLogger(__name__)
+
+def log2_add(a, b):
+    """log2(2^a + 2^b) sin desbordamiento; None actúa como log2(0)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    mayor, menor = max(a, b), min(a, b)
+    return mayor + math.log2(1 + 2 ** (menor - mayor))
+
+def trending_score(tendencia, ahora=None, half_life=None):
+    """Puntuación actual (búsquedas con decaimiento) a partir de la columna `tendencia`."""
+    if tendencia is None:
+        return 0.0
+    half_life = half_life or config.SEARCH_TRENDING_HALF_LIFE
+    ahora = time.time() if ahora is None else ahora
+    return 2 ** (tendencia - ahora / half_life)
+
+def normalize_term(termino):
+    """Agrupa las variantes de un término que solo difieren en mayúsculas o espacios."""
+    return ' '.join(termino.lower().split())
+
+class SearchLog:
+    """
+    Acumulador de búsquedas con escritura diferida por lotes.
+
+    `record` solo actualiza un dict en memoria. Un hilo en segundo plano
+    escribe lo pendiente cada `SEARCH_LOG_FLUSH_INTERVAL` segundos, o antes
+    si se acumulan `SEARCH_LOG_MAX_PENDING` términos distintos.
+    """
+
+    def __init__(self, db_name=None, flush_interval=None, max_pending=None, half_life=None):
+        self.db_name = db_name
+        self.flush_interval = flush_interval or config.SEARCH_LOG_FLUSH_INTERVAL
+        self.max_pending = max_pending or config.SEARCH_LOG_MAX_PENDING
+        self.half_life = half_life or config.SEARCH_TRENDING_HALF_LIFE
+        # termino -> [búsquedas, log2 del aporte a la tendencia, último instante]
+        self._pendientes = {}
+        self._lock = threading.Lock()
+        self._despertar = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self.registradas = 0
+        self.escrituras = 0
+
+    def record(self, termino, instante=None):
+        """Registra una búsqueda; no accede a la base de datos."""
+        termino = normalize_term(termino)
+        if not termino:
+            return
+        instante = time.time() if instante is None else instante
+        aporte = instante / self.half_life
+        with self._lock:
+            pendiente = self._pendientes.get(termino)
+            if pendiente is None:
+                self._pendientes[termino] = [1, aporte, instante]
+            else:
+                pendiente[0] += 1
+                pendiente[1] = log2_add(pendiente[1], aporte)
+                pendiente[2] = max(pendiente[2], instante)
+            self.registradas += 1
+            lleno = len(self._pendientes) >= self.max_pending
+        self._ensure_started()
+        if lleno:
+            self._despertar.set()
+
+    def flush(self):
+        """Escribe las búsquedas pendientes en una transacción. Retorna cuántos términos escribió."""
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        if not pendientes:
+            return 0
+
+        try:
+            with connection(self.db_name) as conn:
+                # Tomar el bloqueo de escritura antes de leer las tendencias que se combinan
+                conn.execute("BEGIN IMMEDIATE")
+                guardadas = {}
+                terminos = list(pendientes)
+                for i in range(0, len(terminos), 500):
+                    bloque = terminos[i:i + 500]
+                    placeholders = ','.join('?' * len(bloque))
+                    guardadas.update(conn.execute(
+                        f"SELECT termino, tendencia FROM busquedas_frecuentes WHERE termino IN ({placeholders})",
+                        bloque
+                    ).fetchall())
+                conn.executemany('''
+                    INSERT INTO busquedas_frecuentes (termino, frecuencia, ultima_busqueda, tendencia)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(termino) DO UPDATE SET
+                        frecuencia = frecuencia + excluded.frecuencia,
+                        ultima_busqueda = MAX(COALESCE(ultima_busqueda, ''), excluded.ultima_busqueda),
+                        tendencia = excluded.tendencia
+                ''', [
+                    (termino, cantidad, datetime.fromtimestamp(ultimo).strftime('%Y-%m-%d %H:%M:%S'),
+                     log2_add(guardadas.get(termino), aporte))
+                    for termino, (cantidad, aporte, ultimo) in pendientes.items()
+                ])
+        except Exception as e:
+            logger.error(f"Error al registrar {len(pendientes)} búsquedas: {e}")
+            self._restore(pendientes)
+            return 0
+
+        self.escrituras += 1
+        return len(pendientes)
+
+    def _restore(self, pendientes):
+        """Devuelve al acumulador un lote que no se pudo escribir."""
+        with self._lock:
+            for termino, (cantidad, aporte, ultimo) in pendientes.items():
+                actual = self._pendientes.get(termino)
+                if actual is None:
+                    self._pendientes[termino] = [cantidad, aporte, ultimo]
+                else:
+                    actual[0] += cantidad
+                    actual[1] = log2_add(actual[1], aporte)
+                    actual[2] = max(actual[2], ultimo)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pendientes)
+
+    def _ensure_started(self):
+        if self._hilo is not None:
+            return
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._run, daemon=True)
+                self._hilo.start()
+
+    def _run(self):
+        while not self._detener.is_set():
+            self._despertar.wait(self.flush_interval)
+            self._despertar.clear()
+            self.flush()
+
+    def stop(self):
+        """Detiene el hilo y escribe lo pendiente."""
+        self._detener.set()
+        self._despertar.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        return {'pendientes': self.pending(), 'registradas': self.registradas, 'escrituras': self.escrituras}
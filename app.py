@@ -1,20 +1,29 @@
 import sqlite3
-import requests
-from flask import Flask, render_template, jsonify, request, send_file, Response
+import asyncio
+from flask import Flask, render_template, jsonify, request, send_file, Response, stream_with_context, make_response
 from datetime import datetime, timedelta
 import json
+import hashlib
+import base64
 import csv
 import io
+import html
 import threading
 import time
-from collections import Counter
 import re
-from functools import lru_cache
+from functools import lru_cache, wraps
 import logging
 from config import config
-from utils import TextAnalyzer, ReportGenerator, FavoritesManager, ComparisonTool, clean_legal_text
+from utils import (TextAnalyzer, ReportGenerator, FavoritesManager, ComparisonTool, EnrichmentPool,
+                   clean_legal_text)
+from fetcher import fetch_all, iter_pages, parse_stop_date, date_key, rate_controller
+from jobs import UpdateJobManager
+from analytics import SearchLog, trending_score
+from cache import VersionedCache, CachedBody
+from database import connection, data_version, bump_data_version, compress_text, strip_accents
 import tempfile
 import os
+import atexit
 
 # Configuración de logging
 logging.basicConfig(
@@ -33,292 +42,1114 @@ app.config['SECRET_KEY'] = config.SECRET_KEY
 # Variables globales
 last_update = None
 update_thread = None
-cache = {}
+response_cache = VersionedCache(config.RESPONSE_CACHE_SIZE, config.CACHE_TIMEOUT)
 text_analyzer = TextAnalyzer()
 report_generator = ReportGenerator()
 favorites_manager = FavoritesManager()
+enrichment_pool = EnrichmentPool()
+update_jobs = UpdateJobManager()
+search_log = SearchLog()
+atexit.register(search_log.stop)
+fts_disponible = False
+trigram_disponible = False
 
-def init_db():
-    """Inicializa la base de datos con tablas mejoradas."""
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    cursor = conn.cursor()
+def _ensure_column(cursor, tabla, columna, definicion):
+    """Agrega una columna a una tabla existente si todavía no existe."""
+    cursor.execute(f"PRAGMA table_info({tabla})")
+    if columna not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}")
+
+# Columnas indexadas en la búsqueda de texto completo y su peso en bm25
+FTS_COLUMNS = ('numero_sentencia', 'nombre_demandante', 'nombre_demandado',
+               'numero_expediente', 'fundamentos', 'palabras_clave')
+FTS_WEIGHTS = (10.0, 5.0, 5.0, 10.0, 1.0, 3.0)
+
+# Campos cortos de identificación con búsqueda por subcadena (índice de trigramas)
+TRIGRAM_COLUMNS = ('numero_sentencia', 'nombre_demandante', 'nombre_demandado', 'numero_expediente')
+TRIGRAM_FIELDS = {
+    'numero': ('numero_sentencia',),
+    'demandante': ('nombre_demandante',),
+    'demandado': ('nombre_demandado',),
+    'partes': ('nombre_demandante', 'nombre_demandado'),
+    'expediente': ('numero_expediente',),
+}
+
+def _create_fts_index(cursor, tabla, columnas, tokenizadores, contenido='sentencias', funcion=None):
+    """
+    Crea un índice FTS5 de contenido externo y lo llena si es nuevo. Si el
+    contenido es la tabla `sentencias` (o una vista que le aplica `funcion`),
+    crea también los triggers que lo mantienen al día.
     
-    # Tabla principal de sentencias
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sentencias (
-            id INTEGER PRIMARY KEY,
-            numero_sentencia TEXT UNIQUE,
-            fecha_publicacion TEXT,
-            nombre_demandante TEXT,
-            nombre_demandado TEXT,
-            numero_expediente TEXT,
-            fundamentos TEXT,
-            url_archivo TEXT,
-            fecha_scraping TEXT,
-            palabras_clave TEXT,
-            resumen TEXT
+    :param tokenizadores: Opciones de tokenize a intentar en orden (la primera
+                          que la versión de SQLite acepte).
+    :param contenido: Tabla o vista con una columna `id` y las `columnas`.
+    :param funcion: Opcional. Función SQL que la vista `contenido` aplica a
+                    cada columna de `sentencias`; los triggers la aplican igual.
+    :return: False si esta compilación de SQLite no soporta el índice.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (tabla,))
+    existia = cursor.fetchone() is not None
+    lista = ', '.join(columnas)
+    valor = f'{funcion}({{}})' if funcion else '{}'
+    nuevos = ', '.join(valor.format(f'new.{c}') for c in columnas)
+    viejos = ', '.join(valor.format(f'old.{c}') for c in columnas)
+    
+    for tokenize in tokenizadores:
+        try:
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {tabla} USING fts5(
+                    {lista},
+                    content='{contenido}', content_rowid='id',
+                    tokenize='{tokenize}'
+                )
+            ''')
+            break
+        except sqlite3.OperationalError as e:
+            error = e
+    else:
+        logger.warning(f"Índice {tabla} no disponible, la búsqueda usará LIKE: {error}")
+        return False
+    
+    if contenido == 'sentencias' or funcion:
+        _create_fts_triggers(cursor, tabla, lista, nuevos, viejos)
+    
+    if not existia:
+        logger.info(f"Construyendo el índice {tabla}")
+        cursor.execute(f"INSERT INTO {tabla} ({tabla}) VALUES ('rebuild')")
+    return True
+
+def _create_fts_triggers(cursor, tabla, lista, nuevos, viejos):
+    """Triggers que sincronizan un índice FTS5 con las columnas de `sentencias`."""
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {tabla}_ai AFTER INSERT ON sentencias BEGIN
+            INSERT INTO {tabla} (rowid, {lista}) VALUES (new.id, {nuevos});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {tabla}_ad AFTER DELETE ON sentencias BEGIN
+            INSERT INTO {tabla} ({tabla}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {tabla}_au AFTER UPDATE OF {lista} ON sentencias BEGIN
+            INSERT INTO {tabla} ({tabla}, rowid, {lista}) VALUES ('delete', old.id, {viejos});
+            INSERT INTO {tabla} (rowid, {lista}) VALUES (new.id, {nuevos});
+        END
+    ''')
+
+def _create_fts_texto_triggers(cursor):
+    """
+    Triggers que sincronizan `sentencias_fts`, cuyas columnas vienen de dos
+    tablas: los metadatos de `sentencias` y los fundamentos comprimidos de
+    `sentencias_texto`.
+    
+    Cada trigger toma de la otra tabla su estado actual, que es el que el
+    índice tiene registrado para esa sentencia; así los 'delete' de FTS5
+    siempre reciben los valores indexados, sin importar en qué orden se
+    escriban las dos tablas.
+    """
+    lista = ', '.join(FTS_COLUMNS)
+    
+    def valores(meta, fundamentos):
+        return ', '.join(fundamentos if c == 'fundamentos' else f'{meta}{c}' for c in FTS_COLUMNS)
+    
+    texto_actual = "(SELECT descomprimir(fundamentos) FROM sentencias_texto WHERE id = {}.id)"
+    columnas_meta = ', '.join(c for c in FTS_COLUMNS if c != 'fundamentos')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_fts_ai AFTER INSERT ON sentencias BEGIN
+            INSERT INTO sentencias_fts (rowid, {lista})
+            VALUES (new.id, {valores('new.', texto_actual.format('new'))});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_fts_ad AFTER DELETE ON sentencias BEGIN
+            INSERT INTO sentencias_fts (sentencias_fts, rowid, {lista})
+            VALUES ('delete', old.id, {valores('old.', texto_actual.format('old'))});
+            DELETE FROM sentencias_texto WHERE id = old.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_fts_au AFTER UPDATE OF {columnas_meta} ON sentencias BEGIN
+            INSERT INTO sentencias_fts (sentencias_fts, rowid, {lista})
+            VALUES ('delete', old.id, {valores('old.', texto_actual.format('old'))});
+            INSERT INTO sentencias_fts (rowid, {lista})
+            VALUES (new.id, {valores('new.', texto_actual.format('new'))});
+        END
+    ''')
+    # Si la sentencia aún no existe (o ya se borró) estos no hacen nada
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_texto_fts_ai AFTER INSERT ON sentencias_texto BEGIN
+            INSERT INTO sentencias_fts (sentencias_fts, rowid, {lista})
+            SELECT 'delete', id, {valores('', 'NULL')} FROM sentencias WHERE id = new.id;
+            INSERT INTO sentencias_fts (rowid, {lista})
+            SELECT id, {valores('', 'descomprimir(new.fundamentos)')} FROM sentencias WHERE id = new.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_texto_fts_au AFTER UPDATE ON sentencias_texto BEGIN
+            INSERT INTO sentencias_fts (sentencias_fts, rowid, {lista})
+            SELECT 'delete', id, {valores('', 'descomprimir(old.fundamentos)')} FROM sentencias WHERE id = old.id;
+            INSERT INTO sentencias_fts (rowid, {lista})
+            SELECT id, {valores('', 'descomprimir(new.fundamentos)')} FROM sentencias WHERE id = new.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencias_texto_fts_ad AFTER DELETE ON sentencias_texto BEGIN
+            INSERT INTO sentencias_fts (sentencias_fts, rowid, {lista})
+            SELECT 'delete', id, {valores('', 'descomprimir(old.fundamentos)')} FROM sentencias WHERE id = old.id;
+            INSERT INTO sentencias_fts (rowid, {lista})
+            SELECT id, {valores('', 'NULL')} FROM sentencias WHERE id = old.id;
+        END
+    ''')
+
+def _migrate_trigram_index(cursor):
+    """
+    Elimina el índice de trigramas del esquema anterior, que indexaba las
+    columnas de `sentencias` con sus acentos; `init_db` lo recrea sobre
+    `sentencias_trigram_contenido`.
+    """
+    cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'sentencias_trigram'")
+    row = cursor.fetchone()
+    if row is None or 'sentencias_trigram_contenido' in row[0]:
+        return
+    logger.info("Recreando el índice de trigramas sin acentos")
+    cursor.execute("DROP TABLE sentencias_trigram")
+    for sufijo in ('ai', 'ad', 'au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS sentencias_trigram_{sufijo}")
+
+def _migrate_fundamentos(cursor):
+    """
+    Mueve `sentencias.fundamentos` (texto plano, esquema anterior) a
+    `sentencias_texto` comprimido y elimina la columna.
+    
+    :return: True si hubo que migrar.
+    """
+    cursor.execute("PRAGMA table_info(sentencias)")
+    if 'fundamentos' not in {row[1] for row in cursor.fetchall()}:
+        return False
+    
+    logger.info("Migrando fundamentos a sentencias_texto comprimido")
+    # El índice de texto completo anterior lee la columna directamente: se recrea después
+    cursor.execute("DROP TABLE IF EXISTS sentencias_fts")
+    for sufijo in ('ai', 'ad', 'au'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS sentencias_fts_{sufijo}")
+    
+    lector = cursor.connection.execute("SELECT id, fundamentos FROM sentencias WHERE fundamentos IS NOT NULL")
+    while True:
+        filas = lector.fetchmany(config.UPSERT_BATCH_SIZE)
+        if not filas:
+            break
+        cursor.executemany(
+            "INSERT OR REPLACE INTO sentencias_texto (id, fundamentos) VALUES (?, ?)",
+            [(id_, compress_text(fundamentos)) for id_, fundamentos in filas]
         )
+    
+    try:
+        cursor.execute("ALTER TABLE sentencias DROP COLUMN fundamentos")
+    except sqlite3.OperationalError as e:
+        # SQLite < 3.35: la columna queda, pero vacía
+        logger.warning(f"No se pudo eliminar la columna fundamentos: {e}")
+        cursor.execute("UPDATE sentencias SET fundamentos = NULL")
+    return True
+
+def _fts_query(search):
+    """
+    Convierte el texto del usuario en una consulta FTS5.
+    
+    Cada palabra se busca como prefijo y todas deben aparecer; los términos
+    con separadores (p. ej. '00123-2024-AA') se buscan como frase. Retorna
+    None si no queda ningún término.
+    """
+    terminos = []
+    for palabra in search.split():
+        tokens = re.findall(r'\w+', palabra)
+        if tokens:
+            terminos.append('"' + ' '.join(tokens) + '"*')
+    return ' '.join(terminos) or None
+
+def _trigram_query(search, columnas):
+    """
+    Construye la consulta del índice de trigramas para buscar cada palabra como
+    subcadena de las columnas indicadas. El índice guarda el texto sin acentos
+    (ver `strip_accents`), así que las palabras también se buscan sin ellos.
+    
+    :return: tupla (consulta, cortas) con la consulta MATCH (None si no hay
+             palabras de al menos 3 caracteres) y las palabras más cortas, que
+             el índice no puede resolver y se filtran con LIKE.
+    """
+    palabras = strip_accents(search).split()
+    largas = [p for p in palabras if len(p) >= 3]
+    cortas = [p for p in palabras if len(p) < 3]
+    if not largas:
+        return None, cortas
+    frases = ' AND '.join('"' + p.replace('"', '""') + '"' for p in largas)
+    return f"{{{' '.join(columnas)}}} : ({frases})", cortas
+
+def _highlight(fragmento):
+    """Escapa un fragmento de FTS5 y convierte sus marcas en <mark>."""
+    return html.escape(fragmento).replace('\x02', '<mark>').replace('\x03', '</mark>')
+
+def _palabras_json(columna):
+    """
+    Expresión SQL que convierte `palabras_clave` ('a, b, c') en un arreglo JSON
+    para recorrerlo con json_each. Las palabras clave solo contienen letras,
+    así que no hace falta escapar comillas.
+    """
+    return f"""'["' || replace({columna}, ', ', '","') || '"]'"""
+
+def _create_keyword_index(cursor):
+    """
+    Crea `sentencia_palabras`, índice invertido de `palabras_clave` con una
+    fila por sentencia y palabra, y los triggers que lo mantienen al día.
+    
+    `peso` es 1 / (posición + 1) de la palabra en `palabras_clave`, que viene
+    ordenada de más a menos frecuente en los fundamentos.
+    
+    :return: True si la tabla es nueva (en ese caso ya se llenó).
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sentencia_palabras'")
+    existia = cursor.fetchone() is not None
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sentencia_palabras (
+            sentencia_id INTEGER NOT NULL,
+            palabra TEXT NOT NULL,
+            peso REAL NOT NULL,
+            PRIMARY KEY (sentencia_id, palabra)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_sentencia_palabras_palabra
+        ON sentencia_palabras(palabra, sentencia_id)
     ''')
     
-    # Tabla de estadísticas
+    def insertar(prefijo):
+        return f'''
+            INSERT OR IGNORE INTO sentencia_palabras (sentencia_id, palabra, peso)
+            SELECT {prefijo}.id, value, 1.0 / (key + 1)
+            FROM json_each({_palabras_json(prefijo + '.palabras_clave')}) WHERE value != '';
+        '''
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencia_palabras_ai AFTER INSERT ON sentencias BEGIN
+            {insertar('new')}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS sentencia_palabras_ad AFTER DELETE ON sentencias BEGIN
+            DELETE FROM sentencia_palabras WHERE sentencia_id = old.id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sentencia_palabras_au AFTER UPDATE OF palabras_clave ON sentencias
+        WHEN old.palabras_clave IS NOT new.palabras_clave BEGIN
+            DELETE FROM sentencia_palabras WHERE sentencia_id = old.id;
+            {insertar('new')}
+        END
+    ''')
+    
+    if not existia:
+        logger.info("Construyendo el índice sentencia_palabras")
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO sentencia_palabras (sentencia_id, palabra, peso)
+            SELECT s.id, p.value, 1.0 / (p.key + 1)
+            FROM sentencias s, json_each({_palabras_json('s.palabras_clave')}) p WHERE p.value != ''
+        ''')
+    return not existia
+
+def _create_stats_tables(cursor):
+    """
+    Crea las tablas de estadísticas materializadas y los triggers que las
+    mantienen al día en la misma transacción que cada escritura en `sentencias`
+    (y en `sentencia_palabras` para los conteos por palabra clave).
+    
+    :return: True si las tablas son nuevas y hay que llenarlas.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'estadisticas_total'")
+    existian = cursor.fetchone() is not None
+    
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS estadisticas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha TEXT,
-            total_sentencias INTEGER,
-            nuevas_sentencias INTEGER,
-            ultima_actualizacion TEXT
+        CREATE TABLE IF NOT EXISTS estadisticas_total (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total INTEGER NOT NULL
         )
     ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_dia (
+            fecha TEXT PRIMARY KEY,
+            cantidad INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_mes (
+            mes TEXT PRIMARY KEY,
+            cantidad INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS estadisticas_palabras (
+            palabra TEXT PRIMARY KEY,
+            cantidad INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_estadisticas_palabras_cantidad
+        ON estadisticas_palabras(cantidad DESC)
+    ''')
+    
+    def sumar(prefijo, signo):
+        """Sentencias que suman (+1) o restan (-1) una sentencia de los conteos por fecha."""
+        return f'''
+            INSERT INTO estadisticas_dia (fecha, cantidad)
+            SELECT {prefijo}.fecha_publicacion, {signo} WHERE {prefijo}.fecha_publicacion IS NOT NULL
+            ON CONFLICT(fecha) DO UPDATE SET cantidad = cantidad + {signo};
+            DELETE FROM estadisticas_dia WHERE fecha = {prefijo}.fecha_publicacion AND cantidad <= 0;
+            INSERT INTO estadisticas_mes (mes, cantidad)
+            SELECT strftime('%Y-%m', {prefijo}.fecha_publicacion), {signo}
+            WHERE strftime('%Y-%m', {prefijo}.fecha_publicacion) IS NOT NULL
+            ON CONFLICT(mes) DO UPDATE SET cantidad = cantidad + {signo};
+            DELETE FROM estadisticas_mes
+            WHERE mes = strftime('%Y-%m', {prefijo}.fecha_publicacion) AND cantidad <= 0;
+        '''
+    
+    # Se recrean en cada inicio para que una base existente tome la definición
+    # actual (las palabras clave pasaron a contarse desde sentencia_palabras)
+    for trigger in ('sentencias_stats_ai', 'sentencias_stats_ad', 'sentencias_stats_au_fecha',
+                    'sentencias_stats_au_palabras', 'sentencia_palabras_stats_ai', 'sentencia_palabras_stats_ad'):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    
+    cursor.execute(f'''
+        CREATE TRIGGER sentencias_stats_ai AFTER INSERT ON sentencias BEGIN
+            UPDATE estadisticas_total SET total = total + 1;
+            {sumar('new', 1)}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER sentencias_stats_ad AFTER DELETE ON sentencias BEGIN
+            UPDATE estadisticas_total SET total = total - 1;
+            {sumar('old', -1)}
+        END
+    ''')
+    # El upsert reescribe todas las columnas: solo actualizar si el valor cambió
+    cursor.execute(f'''
+        CREATE TRIGGER sentencias_stats_au_fecha AFTER UPDATE OF fecha_publicacion ON sentencias
+        WHEN old.fecha_publicacion IS NOT new.fecha_publicacion BEGIN
+            {sumar('old', -1)}
+            {sumar('new', 1)}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER sentencia_palabras_stats_ai AFTER INSERT ON sentencia_palabras BEGIN
+            INSERT INTO estadisticas_palabras (palabra, cantidad) VALUES (new.palabra, 1)
+            ON CONFLICT(palabra) DO UPDATE SET cantidad = cantidad + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER sentencia_palabras_stats_ad AFTER DELETE ON sentencia_palabras BEGIN
+            UPDATE estadisticas_palabras SET cantidad = cantidad - 1 WHERE palabra = old.palabra;
+            DELETE FROM estadisticas_palabras WHERE palabra = old.palabra AND cantidad <= 0;
+        END
+    ''')
+    return not existian
+
+def rebuild_statistics(cursor=None):
+    """
+    Recalcula desde cero las tablas de estadísticas materializadas a partir
+    de `sentencias` (p. ej. tras cargar datos con los triggers desactivados o
+    si se sospecha que se desincronizaron).
+    """
+    if cursor is None:
+        with connection() as conn:
+            rebuild_statistics(conn.cursor())
+        bump_data_version()
+        return
+    
+    logger.info("Recalculando las estadísticas materializadas")
+    for tabla in ('estadisticas_total', 'estadisticas_dia', 'estadisticas_mes', 'estadisticas_palabras'):
+        cursor.execute(f"DELETE FROM {tabla}")
+    cursor.execute("INSERT INTO estadisticas_total (id, total) SELECT 1, COUNT(*) FROM sentencias")
+    cursor.execute('''
+        INSERT INTO estadisticas_dia (fecha, cantidad)
+        SELECT fecha_publicacion, COUNT(*) FROM sentencias
+        WHERE fecha_publicacion IS NOT NULL
+        GROUP BY fecha_publicacion
+    ''')
+    cursor.execute('''
+        INSERT INTO estadisticas_mes (mes, cantidad)
+        SELECT strftime('%Y-%m', fecha_publicacion) AS mes, COUNT(*) FROM sentencias
+        WHERE mes IS NOT NULL
+        GROUP BY mes
+    ''')
+    cursor.execute('''
+        INSERT INTO estadisticas_palabras (palabra, cantidad)
+        SELECT palabra, COUNT(*) FROM sentencia_palabras GROUP BY palabra
+    ''')
+
+def _migrate_fecha_dia(cursor):
+    """
+    Agrega `sentencias.fecha_dia` (fecha de publicación como entero YYYYMMDD,
+    NULL si no es una fecha) a una base existente y la llena.
+    """
+    cursor.execute("PRAGMA table_info(sentencias)")
+    if 'fecha_dia' in {row[1] for row in cursor.fetchall()}:
+        return
     
-    # Tabla de búsquedas frecuentes
+    logger.info("Agregando la columna fecha_dia")
+    cursor.execute("ALTER TABLE sentencias ADD COLUMN fecha_dia INTEGER")
+    lector = cursor.connection.execute("SELECT id, fecha_publicacion FROM sentencias")
+    while True:
+        filas = lector.fetchmany(config.UPSERT_BATCH_SIZE)
+        if not filas:
+            break
+        cursor.executemany("UPDATE sentencias SET fecha_dia = ? WHERE id = ?",
+                           [(date_key(fecha), id_) for id_, fecha in filas if date_key(fecha)])
+
+def _create_change_log(cursor):
+    """
+    Crea `sentencias_cambios`, el registro de las sentencias insertadas,
+    modificadas o eliminadas que llenan los triggers sobre `sentencias`.
+    
+    El número de la última fila registrada (`stored_data_version`) sirve como
+    versión de los datos persistente y común a todos los procesos, a
+    diferencia de `database.data_version()`, que es local a cada proceso.
+    """
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS busquedas_frecuentes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            termino TEXT UNIQUE,
-            frecuencia INTEGER DEFAULT 1,
-            ultima_busqueda TEXT
+        CREATE TABLE IF NOT EXISTS sentencias_cambios (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER NOT NULL
         )
     ''')
+    for evento, fila in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS sentencias_cambios_{evento.lower()} AFTER {evento} ON sentencias BEGIN
+                INSERT INTO sentencias_cambios (id) VALUES ({fila}.id);
+            END
+        ''')
+
+def stored_data_version(cursor):
+    """Versión persistente de los datos: último cambio registrado en `sentencias_cambios`."""
+    cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'sentencias_cambios'")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def _total_sentencias(cursor):
+    """Total de sentencias según la tabla de estadísticas materializada."""
+    cursor.execute("SELECT total FROM estadisticas_total WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def init_db():
+    """Inicializa la base de datos con tablas mejoradas."""
+    global fts_disponible, trigram_disponible
+    with connection() as conn:
+        cursor = conn.cursor()
+        
+        # Tabla principal de sentencias
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentencias (
+                id INTEGER PRIMARY KEY,
+                numero_sentencia TEXT UNIQUE,
+                fecha_publicacion TEXT,
+                fecha_dia INTEGER,
+                nombre_demandante TEXT,
+                nombre_demandado TEXT,
+                numero_expediente TEXT,
+                url_archivo TEXT,
+                fecha_scraping TEXT,
+                palabras_clave TEXT,
+                resumen TEXT,
+                entidades TEXT,
+                hash_contenido TEXT
+            )
+        ''')
+        
+        # Fundamentos comprimidos, fuera de la tabla principal para que los
+        # listados y recorridos de metadatos no los arrastren por la caché
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sentencias_texto (
+                id INTEGER PRIMARY KEY,
+                fundamentos BLOB
+            )
+        ''')
+        migrado = _migrate_fundamentos(cursor)
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS sentencias_fts_contenido AS
+            SELECT s.id, {', '.join('descomprimir(t.fundamentos) AS fundamentos' if c == 'fundamentos' else f's.{c}' for c in FTS_COLUMNS)}
+            FROM sentencias s LEFT JOIN sentencias_texto t ON t.id = s.id
+        ''')
+        
+        # Tabla de estadísticas
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS estadisticas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fecha TEXT,
+                total_sentencias INTEGER,
+                nuevas_sentencias INTEGER,
+                actualizadas_sentencias INTEGER DEFAULT 0,
+                sin_cambios_sentencias INTEGER DEFAULT 0,
+                ultima_actualizacion TEXT
+            )
+        ''')
+        
+        # Columnas agregadas después de la versión inicial del esquema
+        _ensure_column(cursor, 'sentencias', 'hash_contenido', 'TEXT')
+        _ensure_column(cursor, 'sentencias', 'entidades', 'TEXT')
+        _ensure_column(cursor, 'estadisticas', 'actualizadas_sentencias', 'INTEGER DEFAULT 0')
+        _ensure_column(cursor, 'estadisticas', 'sin_cambios_sentencias', 'INTEGER DEFAULT 0')
+        _migrate_fecha_dia(cursor)
+        
+        # Tabla de búsquedas frecuentes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS busquedas_frecuentes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                termino TEXT UNIQUE,
+                frecuencia INTEGER DEFAULT 1,
+                ultima_busqueda TEXT
+            )
+        ''')
+        # log2 de la tendencia con decaimiento (ver analytics.py)
+        _ensure_column(cursor, 'busquedas_frecuentes', 'tendencia', 'REAL')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_busquedas_frecuencia ON busquedas_frecuentes(frecuencia)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_busquedas_tendencia ON busquedas_frecuentes(tendencia)')
+        
+        # Tabla de estado de sincronización (checkpoint por modo)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS sync_state (
+                modo TEXT PRIMARY KEY,
+                ultima_pagina INTEGER DEFAULT 0,
+                max_fecha_publicacion TEXT,
+                max_id INTEGER,
+                completado INTEGER DEFAULT 0,
+                actualizado TEXT
+            )
+        ''')
+        
+        # Índices para mejorar rendimiento
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fecha ON sentencias(fecha_publicacion)')
+        # Cubre los filtros por rango y los histogramas (el rowid va implícito)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_fecha_dia ON sentencias(fecha_dia)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_demandante ON sentencias(nombre_demandante)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_demandado ON sentencias(nombre_demandado)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expediente ON sentencias(numero_expediente)')
+        # Reemplazado por sentencia_palabras: no sirve para buscar una palabra clave
+        cursor.execute('DROP INDEX IF EXISTS idx_palabras')
+        
+        # Índices de texto completo y de subcadenas (trigramas)
+        fts_disponible = _create_fts_index(cursor, 'sentencias_fts', FTS_COLUMNS,
+                                           ['unicode61 remove_diacritics 2'],
+                                           contenido='sentencias_fts_contenido')
+        if fts_disponible:
+            _create_fts_texto_triggers(cursor)
+        # Sin acentos en el índice y en la consulta: 'trigram remove_diacritics'
+        # solo existe desde SQLite 3.45
+        _migrate_trigram_index(cursor)
+        cursor.execute(f'''
+            CREATE VIEW IF NOT EXISTS sentencias_trigram_contenido AS
+            SELECT id, {', '.join(f'sin_acentos({c}) AS {c}' for c in TRIGRAM_COLUMNS)} FROM sentencias
+        ''')
+        trigram_disponible = _create_fts_index(cursor, 'sentencias_trigram', TRIGRAM_COLUMNS, ['trigram'],
+                                               contenido='sentencias_trigram_contenido', funcion='sin_acentos')
+        
+        # Índice invertido de palabras clave y estadísticas materializadas
+        # (conteos por día, mes y palabra clave)
+        _create_keyword_index(cursor)
+        if _create_stats_tables(cursor):
+            rebuild_statistics(cursor)
+        
+        # Registro de cambios (versión persistente de los datos)
+        _create_change_log(cursor)
+        
+        # Vecinos más similares precalculados (ver rebuild_similar_table)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS similares (
+                sentencia_id INTEGER NOT NULL,
+                posicion INTEGER NOT NULL,
+                similar_id INTEGER NOT NULL,
+                similitud REAL NOT NULL,
+                PRIMARY KEY (sentencia_id, posicion)
+            ) WITHOUT ROWID
+        ''')
     
-    # Índices para mejorar rendimiento
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_fecha ON sentencias(fecha_publicacion)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_demandante ON sentencias(nombre_demandante)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_demandado ON sentencias(nombre_demandado)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_expediente ON sentencias(numero_expediente)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_palabras ON sentencias(palabras_clave)')
+    if migrado:
+        # Recuperar en el archivo el espacio que ocupaba el texto sin comprimir
+        logger.info("Compactando la base de datos")
+        with connection() as conn:
+            conn.execute("VACUUM")
     
-    conn.commit()
-    conn.close()
     logger.info("Base de datos inicializada correctamente")
 
-def extract_keywords(fundamentos):
-    """Extrae palabras clave de los fundamentos."""
-    if isinstance(fundamentos, list):
-        texto = ' '.join(fundamentos)
-    else:
-        texto = fundamentos
-    
-    # Extraer palabras relevantes
-    palabras = re.findall(r'\b[a-záéíóúñ]{' + str(config.MIN_WORD_LENGTH) + ',}\b', texto.lower())
-    palabras_filtradas = [p for p in palabras if p not in config.STOPWORDS]
+# Campos de origen que determinan si una sentencia cambió en la API
+CONTENT_FIELDS = (
+    'numero_sentencia', 'fecha_publicacion', 'nombre_demandante',
+    'nombre_demandado', 'numero_expediente', 'fundamentos', 'url_archivo'
+)
+
+UPSERT_SQL = '''
+    INSERT INTO sentencias (
+        id, numero_sentencia, fecha_publicacion, fecha_dia, nombre_demandante,
+        nombre_demandado, numero_expediente, url_archivo,
+        fecha_scraping, palabras_clave, resumen, entidades, hash_contenido
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        fecha_publicacion = excluded.fecha_publicacion,
+        fecha_dia = excluded.fecha_dia,
+        nombre_demandante = excluded.nombre_demandante,
+        nombre_demandado = excluded.nombre_demandado,
+        numero_expediente = excluded.numero_expediente,
+        url_archivo = excluded.url_archivo,
+        fecha_scraping = excluded.fecha_scraping,
+        palabras_clave = excluded.palabras_clave,
+        resumen = excluded.resumen,
+        entidades = excluded.entidades,
+        hash_contenido = excluded.hash_contenido
+    ON CONFLICT(numero_sentencia) DO UPDATE SET
+        fecha_publicacion = excluded.fecha_publicacion,
+        fecha_dia = excluded.fecha_dia,
+        nombre_demandante = excluded.nombre_demandante,
+        nombre_demandado = excluded.nombre_demandado,
+        numero_expediente = excluded.numero_expediente,
+        url_archivo = excluded.url_archivo,
+        fecha_scraping = excluded.fecha_scraping,
+        palabras_clave = excluded.palabras_clave,
+        resumen = excluded.resumen,
+        entidades = excluded.entidades,
+        hash_contenido = excluded.hash_contenido
+'''
+
+# Los fundamentos se guardan comprimidos en `sentencias_texto`, con el id que
+# la sentencia haya recibido en `sentencias`
+UPSERT_TEXTO_SQL = '''
+    INSERT INTO sentencias_texto (id, fundamentos)
+    SELECT id, ? FROM sentencias WHERE numero_sentencia = ?
+    ON CONFLICT(id) DO UPDATE SET fundamentos = excluded.fundamentos
+'''
+
+# Columnas de `sentencias` que necesitan los listados (sin columnas pesadas)
+COLUMNAS_LISTADO = (
+    's.id, s.numero_sentencia, s.fecha_publicacion, s.nombre_demandante, '
+    's.nombre_demandado, s.numero_expediente, s.url_archivo, s.palabras_clave, s.resumen'
+)
+
+# Sentencia completa, con los fundamentos descomprimidos
+SENTENCIA_COMPLETA_SQL = '''
+    SELECT s.*, descomprimir(t.fundamentos) AS fundamentos
+    FROM sentencias s LEFT JOIN sentencias_texto t ON t.id = s.id
+'''
+
+def content_hash(item):
+    """Calcula un hash estable del contenido de origen de una sentencia."""
+    contenido = {campo: item.get(campo) for campo in CONTENT_FIELDS}
+    serializado = json.dumps(contenido, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(serializado.encode('utf-8')).hexdigest()
+
+def _chunks(seq, size):
+    """Divide una secuencia en bloques de tamaño fijo."""
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+def _existing_hashes(cursor, items):
+    """Retorna los hashes guardados indexados por id y por número de sentencia."""
+    por_id = {}
+    por_numero = {}
+    ids = [i['id'] for i in items if i['id'] is not None]
+    numeros = [i['numero_sentencia'] for i in items]
     
-    # Contar frecuencia
-    contador = Counter(palabras_filtradas)
+    for bloque in _chunks(ids, 500):
+        placeholders = ','.join('?' * len(bloque))
+        cursor.execute(f"SELECT id, hash_contenido FROM sentencias WHERE id IN ({placeholders})", bloque)
+        por_id.update(cursor.fetchall())
+    for bloque in _chunks(numeros, 500):
+        placeholders = ','.join('?' * len(bloque))
+        cursor.execute(f"SELECT numero_sentencia, hash_contenido FROM sentencias WHERE numero_sentencia IN ({placeholders})", bloque)
+        por_numero.update(cursor.fetchall())
     
-    # Retornar las palabras más comunes
-    palabras_clave = [palabra for palabra, _ in contador.most_common(config.MAX_KEYWORDS)]
-    return ', '.join(palabras_clave)
+    return por_id, por_numero
 
-def generate_summary(fundamentos):
-    """Genera un resumen de los fundamentos."""
-    if isinstance(fundamentos, list):
-        texto = ' '.join(fundamentos[:3])  # Primeros 3 fundamentos
-    else:
-        texto = fundamentos
+def _build_row(item, enriquecido, hash_contenido, fecha_actual):
+    """Construye la fila a guardar a partir del registro y su enriquecimiento."""
+    palabras_clave, resumen, entidades = enriquecido
+    # Los registros de la API ya traen la fecha convertida (fetcher.parse_item)
+    fecha_dia = item['fecha_dia'] if 'fecha_dia' in item else date_key(item['fecha_publicacion'])
+    return (
+        item['id'], item['numero_sentencia'], item['fecha_publicacion'], fecha_dia,
+        item['nombre_demandante'], item['nombre_demandado'],
+        item['numero_expediente'], item['url_archivo'],
+        fecha_actual, palabras_clave, resumen, entidades, hash_contenido
+    )
+
+def _build_texto_row(item):
+    """Fila para `UPSERT_TEXTO_SQL`: fundamentos comprimidos y número de sentencia."""
+    fundamentos_texto = '\n'.join(item['fundamentos']) if isinstance(item['fundamentos'], list) else item['fundamentos']
+    return compress_text(fundamentos_texto), item['numero_sentencia']
+
+def _row_to_sentencia(row):
+    """Convierte una fila de `sentencias` al formato de respuesta de la API."""
+    sentencia = dict(row)
+    if 'fundamentos' in sentencia:
+        sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
+    if 'entidades' in sentencia:
+        sentencia['entidades'] = json.loads(sentencia['entidades']) if sentencia['entidades'] else {}
+    return sentencia
+
+def _upsert_sentencias(cursor, data, fecha_actual):
+    """
+    Inserta/actualiza un lote de registros con un único `executemany`.
+    
+    Los registros cuyo hash de contenido coincide con el guardado no se
+    enriquecen ni se escriben.
     
-    # Limpiar texto
-    texto = re.sub(r'\s+', ' ', texto).strip()
+    :return: tupla (nuevas, actualizadas, sin_cambios).
+    """
+    # Quedarse con la última aparición de cada sentencia dentro del lote
+    lote = list({(item['id'], item['numero_sentencia']): item for item in data}.values())
+    por_id, por_numero = _existing_hashes(cursor, lote)
     
-    # Limitar longitud
-    if len(texto) > config.SUMMARY_LENGTH:
-        texto = texto[:config.SUMMARY_LENGTH-3] + '...'
+    pendientes = []
+    nuevas = 0
+    actualizadas = 0
+    sin_cambios = 0
+    for item in lote:
+        hash_contenido = content_hash(item)
+        if item['id'] in por_id:
+            hash_guardado, existe = por_id[item['id']], True
+        elif item['numero_sentencia'] in por_numero:
+            hash_guardado, existe = por_numero[item['numero_sentencia']], True
+        else:
+            hash_guardado, existe = None, False
+        
+        if existe and hash_guardado == hash_contenido:
+            sin_cambios += 1
+            continue
+        
+        if existe:
+            actualizadas += 1
+        else:
+            nuevas += 1
+        pendientes.append((item, hash_contenido))
+    
+    if pendientes:
+        enriquecidos = enrichment_pool.map([item['fundamentos'] for item, _ in pendientes])
+        filas = [
+            _build_row(item, enriquecido, hash_contenido, fecha_actual)
+            for (item, hash_contenido), enriquecido in zip(pendientes, enriquecidos)
+        ]
+        cursor.executemany(UPSERT_SQL, filas)
+        cursor.executemany(UPSERT_TEXTO_SQL, [_build_texto_row(item) for item, _ in pendientes])
+    
+    return nuevas, actualizadas, sin_cambios
+
+def _record_update_stats(cursor, nuevas, actualizadas, sin_cambios, fecha_actual):
+    """Registra una fila en la tabla de estadísticas de actualización."""
+    total = _total_sentencias(cursor)
     
-    return texto
+    cursor.execute('''
+        INSERT INTO estadisticas (
+            fecha, total_sentencias, nuevas_sentencias, actualizadas_sentencias,
+            sin_cambios_sentencias, ultima_actualizacion
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    ''', (fecha_actual, total, nuevas, actualizadas, sin_cambios, fecha_actual))
 
 def save_to_db(data):
-    """Guarda las sentencias en la base de datos con información adicional."""
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    cursor = conn.cursor()
+    """
+    Guarda las sentencias en la base de datos con información adicional.
     
+    Los registros se escriben en lotes de `UPSERT_BATCH_SIZE`, cada uno en su
+    propia transacción.
+    """
     nuevas = 0
     actualizadas = 0
+    sin_cambios = 0
     fecha_actual = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     
-    for item in data:
-        fundamentos_texto = '\n'.join(item['fundamentos']) if isinstance(item['fundamentos'], list) else item['fundamentos']
-        palabras_clave = extract_keywords(item['fundamentos'])
-        resumen = generate_summary(item['fundamentos'])
+    with connection() as conn:
+        cursor = conn.cursor()
+        for lote in _chunks(data, config.UPSERT_BATCH_SIZE):
+            n, a, u = _upsert_sentencias(cursor, lote, fecha_actual)
+            conn.commit()
+            if n or a:
+                bump_data_version()
+            nuevas += n
+            actualizadas += a
+            sin_cambios += u
         
-        try:
-            cursor.execute('''
-                INSERT INTO sentencias (
-                    id, numero_sentencia, fecha_publicacion, nombre_demandante,
-                    nombre_demandado, numero_expediente, fundamentos, url_archivo,
-                    fecha_scraping, palabras_clave, resumen
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                item['id'], item['numero_sentencia'], item['fecha_publicacion'],
-                item['nombre_demandante'], item['nombre_demandado'],
-                item['numero_expediente'], fundamentos_texto,
-                item['url_archivo'], fecha_actual, palabras_clave, resumen
-            ))
-            nuevas += 1
-        except sqlite3.IntegrityError:
-            # Actualizar si ya existe
-            cursor.execute('''
-                UPDATE sentencias 
-                SET fecha_publicacion = ?, nombre_demandante = ?, nombre_demandado = ?,
-                    numero_expediente = ?, fundamentos = ?, url_archivo = ?,
-                    fecha_scraping = ?, palabras_clave = ?, resumen = ?
-                WHERE numero_sentencia = ?
-            ''', (
-                item['fecha_publicacion'], item['nombre_demandante'], 
-                item['nombre_demandado'], item['numero_expediente'],
-                fundamentos_texto, item['url_archivo'], fecha_actual,
-                palabras_clave, resumen, item['numero_sentencia']
-            ))
-            if cursor.rowcount > 0:
-                actualizadas += 1
-    
-    # Actualizar estadísticas
-    cursor.execute('SELECT COUNT(*) FROM sentencias')
-    total = cursor.fetchone()[0]
+        # Actualizar estadísticas
+        _record_update_stats(cursor, nuevas, actualizadas, sin_cambios, fecha_actual)
     
-    cursor.execute('''
-        INSERT INTO estadisticas (fecha, total_sentencias, nuevas_sentencias, ultima_actualizacion)
-        VALUES (?, ?, ?, ?)
-    ''', (fecha_actual, total, nuevas, fecha_actual))
+    logger.info(f"Guardadas {nuevas} nuevas sentencias, {actualizadas} actualizadas, {sin_cambios} sin cambios")
+    if nuevas or actualizadas:
+        _refresh_similarity_index()
+    return nuevas
+
+def rebuild_derived_columns(batch_size=None, on_progress=None):
+    """
+    Recalcula `palabras_clave`, `resumen` y `entidades` de toda la base de datos.
     
+    Recorre las sentencias por id en lotes, las enriquece con el pool de
+    procesos y confirma cada lote en su propia transacción.
+    
+    :param on_progress: Opcional. Callback que recibe el total procesado.
+    :return: número de sentencias recalculadas.
+    """
+    batch_size = batch_size or config.UPSERT_BATCH_SIZE
+    procesadas = 0
+    ultimo_id = None
+    with connection() as conn:
+        cursor = conn.cursor()
+        while True:
+            if ultimo_id is None:
+                cursor.execute('''
+                    SELECT s.id, descomprimir(t.fundamentos) FROM sentencias s
+                    LEFT JOIN sentencias_texto t ON t.id = s.id ORDER BY s.id LIMIT ?
+                ''', (batch_size,))
+            else:
+                cursor.execute('''
+                    SELECT s.id, descomprimir(t.fundamentos) FROM sentencias s
+                    LEFT JOIN sentencias_texto t ON t.id = s.id WHERE s.id > ? ORDER BY s.id LIMIT ?
+                ''', (ultimo_id, batch_size))
+            filas = cursor.fetchall()
+            if not filas:
+                break
+            
+            enriquecidos = enrichment_pool.map([
+                fundamentos.split('\n') if fundamentos else [] for _, fundamentos in filas
+            ])
+            cursor.executemany(
+                'UPDATE sentencias SET palabras_clave = ?, resumen = ?, entidades = ? WHERE id = ?',
+                [(*enriquecido, id_) for (id_, _), enriquecido in zip(filas, enriquecidos)]
+            )
+            conn.commit()
+            bump_data_version()
+            
+            procesadas += len(filas)
+            ultimo_id = filas[-1][0]
+            if on_progress:
+                on_progress(procesadas)
+    
+    logger.info(f"Columnas derivadas recalculadas para {procesadas} sentencias")
+    if procesadas:
+        _refresh_similarity_index()
+    return procesadas
+
+def get_sync_state(cursor, modo):
+    """Obtiene el checkpoint de sincronización de un modo como dict."""
+    cursor.execute('''
+        SELECT ultima_pagina, max_fecha_publicacion, max_id, completado, actualizado
+        FROM sync_state WHERE modo = ?
+    ''', (modo,))
+    row = cursor.fetchone()
+    if not row:
+        return {'modo': modo, 'ultima_pagina': 0, 'max_fecha_publicacion': None,
+                'max_id': None, 'completado': False, 'actualizado': None}
+    return {'modo': modo, 'ultima_pagina': row[0], 'max_fecha_publicacion': row[1],
+            'max_id': row[2], 'completado': bool(row[3]), 'actualizado': row[4]}
+
+def _save_sync_state(cursor, modo, page, items, completado=False):
+    """Guarda el checkpoint de un modo tras completar una página."""
+    fechas = [i['fecha_publicacion'] for i in items if i.get('fecha_dia')]
+    ids = [i['id'] for i in items if i['id'] is not None]
+    cursor.execute('''
+        INSERT INTO sync_state (modo, ultima_pagina, max_fecha_publicacion, max_id, completado, actualizado)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(modo) DO UPDATE SET
+            ultima_pagina = excluded.ultima_pagina,
+            max_fecha_publicacion = NULLIF(MAX(COALESCE(max_fecha_publicacion, ''), COALESCE(excluded.max_fecha_publicacion, '')), ''),
+            max_id = MAX(COALESCE(max_id, 0), COALESCE(excluded.max_id, 0)),
+            completado = excluded.completado,
+            actualizado = excluded.actualizado
+    ''', (modo, page, max(fechas) if fechas else None, max(ids) if ids else None,
+          int(completado), datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+def _all_known(cursor, items):
+    """Indica si todas las sentencias de una página ya están en la base de datos."""
+    ids = [i['id'] for i in items if i['id'] is not None]
+    if not ids or len(ids) != len(items):
+        return False
+    placeholders = ','.join('?' * len(ids))
+    cursor.execute(f"SELECT COUNT(*) FROM sentencias WHERE id IN ({placeholders})", ids)
+    return cursor.fetchone()[0] == len(set(ids))
+
+def _save_page_group(conn, grupo, checkpoint, resultado, on_progress=None):
+    """
+    Enriquece y guarda en una transacción un grupo de páginas consecutivas
+    (tuplas de `iter_pages`), con el checkpoint en la última, y acumula los
+    conteos en `resultado`.
+    """
+    cursor = conn.cursor()
+    items = [item for _, items_pagina, _ in grupo for item in items_pagina]
+    fecha_actual = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    nuevas, actualizadas, sin_cambios = _upsert_sentencias(cursor, items, fecha_actual)
+    primera, ultima_pagina, ultima = grupo[0][0], grupo[-1][0], grupo[-1][2]
+    if checkpoint:
+        _save_sync_state(cursor, checkpoint, ultima_pagina, items)
     conn.commit()
-    conn.close()
+    if nuevas or actualizadas:
+        bump_data_version()
     
-    logger.info(f"Guardadas {nuevas} nuevas sentencias, {actualizadas} actualizadas")
-    return nuevas
+    resultado['paginas'] += len(grupo)
+    resultado['nuevas'] += nuevas
+    resultado['actualizadas'] += actualizadas
+    resultado['sin_cambios'] += sin_cambios
+    resultado['ultima_pagina'] = ultima_pagina
+    resultado['agotado'] = ultima
+    paginas = f"Página {primera} guardada" if len(grupo) == 1 else f"Páginas {primera}-{ultima_pagina} guardadas"
+    logger.info(f"{paginas}: {nuevas} nuevas, {actualizadas} actualizadas, {sin_cambios} sin cambios")
+    if on_progress:
+        on_progress(resultado)
+
+def ingest_pages(api_url=None, start_page=1, max_pages_fetch=None, stop_date_str=None,
+                 checkpoint=None, stop_when_known=False, on_progress=None):
+    """
+    Descarga y guarda sentencias página por página.
+    
+    Las páginas se agrupan hasta reunir `ENRICHMENT_MIN_BATCH` registros, para
+    que el enriquecimiento use el pool de procesos, y cada grupo se confirma en
+    su propia transacción; así la memoria queda acotada a unas pocas páginas y
+    el progreso parcial sobrevive a una interrupción.
+    
+    :param checkpoint: Opcional. Modo de `sync_state` donde registrar cada página
+                       completada, en la misma transacción que sus datos. Con
+                       checkpoint la ingesta se detiene en la primera página que
+                       no se pudo obtener, así el checkpoint nunca la salta.
+    :param stop_when_known: Detenerse tras la primera página cuyas sentencias ya
+                            estaban todas en la base de datos.
+    :param on_progress: Opcional. Callback que recibe el dict de resultado
+                        acumulado tras cada grupo de páginas guardado.
+    :return: dict con páginas procesadas, sentencias nuevas y actualizadas, y si
+             se alcanzó la última página disponible en la API.
+    """
+    stop_date = parse_stop_date(stop_date_str)
+    resultado = {'paginas': 0, 'nuevas': 0, 'actualizadas': 0, 'sin_cambios': 0,
+                 'ultima_pagina': None, 'agotado': False}
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        pages = iter_pages(api_url, start_page, max_pages_fetch, stop_date, slow_start=stop_when_known,
+                           stop_on_skip=checkpoint is not None)
+        try:
+            grupo = []
+            for page, items, ultima in pages:
+                conocidas = stop_when_known and _all_known(cursor, items)
+                grupo.append((page, items, ultima))
+                
+                if conocidas or ultima or sum(len(p[1]) for p in grupo) >= config.ENRICHMENT_MIN_BATCH:
+                    _save_page_group(conn, grupo, checkpoint, resultado, on_progress)
+                    grupo = []
+                
+                if conocidas:
+                    logger.info(f"Página {page} sin sentencias nuevas. Deteniendo la sincronización incremental.")
+                    break
+            if grupo:
+                _save_page_group(conn, grupo, checkpoint, resultado, on_progress)
+        finally:
+            pages.close()
+            conn.rollback()
+            if resultado['paginas']:
+                _record_update_stats(cursor, resultado['nuevas'], resultado['actualizadas'],
+                                     resultado['sin_cambios'], datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+                conn.commit()
+    
+    logger.info(f"Ingesta finalizada: {resultado['paginas']} páginas, {resultado['nuevas']} nuevas, "
+                f"{resultado['actualizadas']} actualizadas, {resultado['sin_cambios']} sin cambios")
+    if resultado['nuevas'] or resultado['actualizadas']:
+        _refresh_similarity_index()
+    return resultado
+
+def sync_sentencias(modo='incremental', max_pages_fetch=None, api_url=None, reiniciar=False,
+                    on_progress=None):
+    """
+    Sincroniza con la API usando un checkpoint persistente en `sync_state`.
+    
+    - 'incremental': recorre desde la página 1 y se detiene en la primera página
+      cuyas sentencias ya estaban todas guardadas.
+    - 'backfill': continúa desde la última página completada en la ejecución
+      anterior, de modo que un reinicio no vuelve a empezar desde cero.
+    
+    :param reiniciar: En modo 'backfill', vuelve a empezar desde la página 1.
+    """
+    if modo not in ('incremental', 'backfill'):
+        raise ValueError(f"Modo de sincronización no soportado: {modo}")
+    
+    if modo == 'incremental':
+        return ingest_pages(api_url, 1, max_pages_fetch, checkpoint='incremental',
+                            stop_when_known=True, on_progress=on_progress)
+    
+    with connection() as conn:
+        estado = get_sync_state(conn.cursor(), 'backfill')
+    
+    if estado['completado'] and not reiniciar:
+        logger.info("Backfill histórico ya completado; nada que hacer")
+        return {'paginas': 0, 'nuevas': 0, 'actualizadas': 0, 'sin_cambios': 0,
+                'ultima_pagina': estado['ultima_pagina'], 'agotado': True}
+    
+    start_page = 1 if reiniciar else estado['ultima_pagina'] + 1
+    logger.info(f"Reanudando backfill desde la página {start_page}")
+    resultado = ingest_pages(api_url, start_page, max_pages_fetch, checkpoint='backfill',
+                             on_progress=on_progress)
+    
+    if resultado['agotado'] and resultado['paginas']:
+        with connection() as conn:
+            conn.execute("UPDATE sync_state SET completado = 1 WHERE modo = 'backfill'")
+        logger.info("Backfill histórico completado")
+    return resultado
 
 def fetch_data(api_url=None, start_page=1, max_pages_fetch=None, stop_date_str=None):
     """
-    Realiza solicitud GET a la API con manejo mejorado de errores y reintentos.
+    Obtiene sentencias de la API con descarga concurrente, límite de tasa y reintentos.
     
     :param api_url: URL base de la API.
     :param start_page: Página desde la cual comenzar a obtener datos.
     :param max_pages_fetch: Número máximo de páginas a obtener en esta ejecución.
     :param stop_date_str: Opcional. Fecha de corte en formato 'YYYY-MM-DD'.
     """
-    if api_url is None:
-        api_url = config.API_URL
+    stop_date = parse_stop_date(stop_date_str)
+    all_data = asyncio.run(fetch_all(api_url, start_page, max_pages_fetch, stop_date))
+    logger.info(f"Total de registros obtenidos en esta ejecución: {len(all_data)}")
+    return all_data
 
-    all_data = []
-    page = start_page
-    pages_processed = 0
+def run_update(max_pages_fetch, backfill=False, on_progress=None):
+    """
+    Ejecuta una actualización: sincronización incremental y, opcionalmente,
+    avance del backfill histórico con el resto del presupuesto de páginas.
+    """
+    global last_update
+    resultado = sync_sentencias('incremental', max_pages_fetch=max_pages_fetch, on_progress=on_progress)
     
-    stop_date = None
-    if stop_date_str:
-        try:
-            stop_date = datetime.strptime(stop_date_str, '%Y-%m-%d').date()
-        except ValueError:
-            logger.error(f"Formato de fecha inválido para stop_date_str: {stop_date_str}. Debe ser YYYY-MM-DD.")
-            stop_date = None
-
-    while True:
-        if max_pages_fetch is not None and pages_processed >= max_pages_fetch:
-            logger.info(f"Alcanzado límite de páginas para esta ejecución: {max_pages_fetch}")
-            break
-
-        # --- INICIO DE LA LÓGICA DE REINTENTOS ---
-        retries = 3
-        delay = 5  # Empezar con una espera de 5 segundos
-        for i in range(retries):
-            try:
-                logger.info(f"Obteniendo página {page} (Intento {i+1}/{retries})")
-                response = requests.get(
-                    f"{api_url}?page={page}", 
-                    headers=config.API_HEADERS, 
-                    timeout=config.API_TIMEOUT
-                )
-                
-                # Si el servidor nos pide que esperemos (Error 429)
-                if response.status_code == 429:
-                    logger.warning(f"Error 429: Límite de solicitudes alcanzado. Esperando {delay} segundos para reintentar.")
-                    time.sleep(delay)
-                    delay *= 2  # Duplicar la espera para el siguiente reintento
-                    continue # Vuelve a intentar en el bucle 'for'
-
-                # Si el servidor tiene otros problemas temporales
-                if response.status_code >= 500:
-                    logger.warning(f"Error del servidor ({response.status_code}). Esperando {delay} segundos para reintentar.")
-                    time.sleep(delay)
-                    delay *= 2
-                    continue
-
-                # Si hay otro error del cliente o el intento fue exitoso, salimos del bucle de reintentos
-                break
-
-            except requests.exceptions.RequestException as e:
-                logger.error(f"Error de red al obtener página {page}: {e}. Reintentando en {delay} segundos...")
-                time.sleep(delay)
-                delay *= 2
-        else:
-            # Si el bucle 'for' de reintentos termina sin éxito
-            logger.error(f"No se pudo obtener la página {page} después de {retries} intentos. Saltando a la siguiente página.")
-            page += 1
-            pages_processed += 1
-            continue # Pasa a la siguiente página en el bucle 'while'
-        # --- FIN DE LA LÓGICA DE REINTENTOS ---
-
-        # Procesar la respuesta si fue exitosa
-        try:
-            if response.status_code == 200:
-                data = response.json()
-                if not data.get('error') and 'data' in data and data['data']:
-                    stop_fetching = False
-                    for item in data['data']:
-                        source = item.get('_source', {})
-                        if stop_date:
-                            item_date_str = source.get('fecha_publicacion')
-                            if item_date_str and item_date_str != 'N/A':
-                                try:
-                                    item_date = datetime.strptime(item_date_str, '%Y-%m-%d').date()
-                                    if item_date < stop_date:
-                                        logger.info(f"Se alcanzó un registro ({item_date_str}) más antiguo que la fecha de corte ({stop_date_str}). Deteniendo la descarga.")
-                                        stop_fetching = True
-                                        break
-                                except ValueError:
-                                    pass
-                        all_data.append({
-                            'id': source.get('id'),
-                            'numero_sentencia': source.get('numero_sentencia', 'N/A'),
-                            'fecha_publicacion': source.get('fecha_publicacion', 'N/A'),
-                            'nombre_demandante': source.get('nombre_demandante', 'N/A'),
-                            'nombre_demandado': source.get('nombre_demandado', 'N/A'),
-                            'numero_expediente': source.get('numero_expediente', 'N/A'),
-                            'fundamentos': source.get('fundamentos', []),
-                            'url_archivo': source.get('url_archivo', 'N/A'),
-                        })
-                    if stop_fetching:
-                        break
-                    pagination = data.get('pagination', {})
-                    if page >= pagination.get('num_pages', page):
-                        logger.info("Se obtuvieron todas las páginas disponibles de la API.")
-                        break
-                else:
-                    logger.warning(f"Respuesta de API sin datos o con error en página {page}: {data.get('message', 'Sin mensaje')}")
-                    break
-            else:
-                logger.error(f"Error HTTP {response.status_code} no manejado al obtener la página {page}. Contenido: {response.text}")
-                break
-        except Exception as e:
-            logger.error(f"Error inesperado al procesar la página {page}: {e}")
-            break
+    restantes = max_pages_fetch - resultado['paginas']
+    if backfill and restantes > 0:
+        base = dict(resultado)
         
-        page += 1
-        pages_processed += 1
-        time.sleep(config.API_DELAY)
+        def progreso_backfill(parcial):
+            if on_progress:
+                on_progress({clave: base[clave] + parcial[clave]
+                             for clave in ('paginas', 'nuevas', 'actualizadas', 'sin_cambios')})
+        
+        parcial = sync_sentencias('backfill', max_pages_fetch=restantes, on_progress=progreso_backfill)
+        for clave in ('paginas', 'nuevas', 'actualizadas', 'sin_cambios'):
+            resultado[clave] += parcial[clave]
     
-    logger.info(f"Total de registros obtenidos en esta ejecución: {len(all_data)}")
-    return all_data
+    if resultado['paginas']:
+        last_update = datetime.now()
+    return resultado
+
+def start_update_job(tipo='manual'):
+    """Inicia un trabajo de actualización o se adjunta al que está en curso."""
+    if tipo == 'manual':
+        paginas = config.MAX_PAGES_MANUAL_UPDATE
+        return update_jobs.start(lambda progreso: run_update(paginas, backfill=True, on_progress=progreso),
+                                 tipo, paginas)
+    paginas = config.MAX_PAGES_AUTO_UPDATE
+    return update_jobs.start(lambda progreso: run_update(paginas, on_progress=progreso), tipo, paginas)
 
 def background_update():
     """Actualización automática en segundo plano."""
-    global last_update
     while True:
         try:
             logger.info("Iniciando actualización automática")
-            data = fetch_data(max_pages_fetch=config.MAX_PAGES_AUTO_UPDATE)
-            if data:
-                nuevas = save_to_db(data)
-                last_update = datetime.now()
-                logger.info(f"Actualización completada: {nuevas} nuevas sentencias")
+            job, _ = start_update_job('automatica')
+            update_jobs.wait(job)
+            if job.estado == 'completado':
+                logger.info(f"Actualización completada: {job.nuevas} nuevas sentencias")
         except Exception as e:
             logger.error(f"Error en actualización automática: {e}")
         
@@ -329,166 +1160,516 @@ def index():
     """Ruta principal con interfaz mejorada."""
     return render_template("index.html")
 
-@app.route("/api/sentencias")
-def api_sentencias():
-    """API REST para obtener sentencias con filtros y paginación."""
-    # Obtener parámetros
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', config.ITEMS_PER_PAGE))
-    search = request.args.get('search', '').strip()
-    fecha_desde = request.args.get('fecha_desde', '')
-    fecha_hasta = request.args.get('fecha_hasta', '')
-    ordenar = request.args.get('ordenar', 'fecha_publicacion DESC')
+# Órdenes admitidos en el listado: (columna, dirección). El id desempata y, como
+# es el rowid, cada índice de una sola columna ya es compuesto (columna, id) y
+# sirve tanto para ordenar como para la búsqueda por cursor.
+ORDENES = {
+    'fecha_publicacion DESC': ('fecha_publicacion', 'DESC'),
+    'fecha_publicacion ASC': ('fecha_publicacion', 'ASC'),
+    'numero_sentencia ASC': ('numero_sentencia', 'ASC'),
+    'numero_sentencia DESC': ('numero_sentencia', 'DESC'),
+    'nombre_demandante ASC': ('nombre_demandante', 'ASC'),
+    'nombre_demandante DESC': ('nombre_demandante', 'DESC'),
+}
+
+# Totales del listado por conjunto de filtros
+total_cache = VersionedCache(config.TOTAL_CACHE_SIZE, config.CACHE_TIMEOUT)
+
+def _send_body(cuerpo):
+    """
+    Responde con un `CachedBody`: gzip si el cliente lo acepta y el cuerpo lo
+    amerita, ETag por representación y 304 si `If-None-Match` (o
+    `If-Modified-Since`) coincide.
+    """
+    usar_gzip = len(cuerpo.datos) >= config.GZIP_MIN_SIZE and request.accept_encodings['gzip'] > 0
+    if usar_gzip:
+        respuesta = Response(cuerpo.gzip(config.GZIP_LEVEL), mimetype=cuerpo.mimetype, headers=cuerpo.headers)
+        respuesta.headers['Content-Encoding'] = 'gzip'
+        respuesta.set_etag(f"{cuerpo.etag}-gz")
+    else:
+        respuesta = Response(cuerpo.datos, mimetype=cuerpo.mimetype, headers=cuerpo.headers)
+        respuesta.set_etag(cuerpo.etag)
+    respuesta.vary.add('Accept-Encoding')
+    # El navegador guarda la respuesta pero la revalida siempre con el ETag
+    respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
+
+def cached_response(func):
+    """
+    Cachea las respuestas 200 a GET de un endpoint en `response_cache`, por ruta
+    y parámetros de consulta normalizados (sin vacíos, sin espacios sobrantes
+    y en orden). Las escrituras que aumentan `data_version` las invalidan.
     
-    # Validar orden para evitar SQL injection
-    ordenes_validos = {
-        'fecha_publicacion DESC': 'fecha_publicacion DESC',
-        'fecha_publicacion ASC': 'fecha_publicacion ASC',
-        'numero_sentencia ASC': 'numero_sentencia ASC',
-        'numero_sentencia DESC': 'numero_sentencia DESC',
-        'nombre_demandante ASC': 'nombre_demandante ASC',
-        'nombre_demandante DESC': 'nombre_demandante DESC'
-    }
-    ordenar = ordenes_validos.get(ordenar, 'fecha_publicacion DESC')
-    
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    Las respuestas se envían con ETag, 304 y gzip (ver `_send_body`); las que
+    superan `RESPONSE_CACHE_MAX_BYTES` se envían igual pero no se guardan.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return func(*args, **kwargs)
+        parametros = sorted((k, v.strip()) for k, v in request.args.items(multi=True) if v.strip())
+        clave = (request.path, tuple(parametros))
+        # Versión leída antes de calcular: si los datos cambian mientras tanto,
+        # la entrada nace vencida
+        version = data_version()
+        cuerpo = response_cache.get(clave, version)
+        if cuerpo is None:
+            respuesta = make_response(func(*args, **kwargs))
+            if respuesta.status_code != 200 or respuesta.is_streamed:
+                return respuesta
+            headers = [(nombre, valor) for nombre, valor in respuesta.headers.items()
+                       if nombre not in ('Content-Type', 'Content-Length')]
+            cuerpo = CachedBody(respuesta.get_data(), respuesta.mimetype, headers)
+            if len(cuerpo.datos) <= config.RESPONSE_CACHE_MAX_BYTES:
+                response_cache.set(clave, version, cuerpo)
+        return _send_body(cuerpo)
+    return wrapper
+
+def _encode_cursor(orden, posicion):
+    """Codifica la posición de la última fila entregada como token opaco."""
+    datos = json.dumps({'o': orden, 'p': posicion}, separators=(',', ':'), ensure_ascii=False)
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii').rstrip('=')
+
+def _decode_cursor(token, orden):
+    """
+    Decodifica un token de `_encode_cursor`.
     
-    # Construir query con filtros
-    query = "SELECT * FROM sentencias WHERE 1=1"
+    :return: tupla (valor, id) para órdenes por columna o desplazamiento (int)
+             para 'relevancia'.
+    :raises ValueError: si el token es inválido o corresponde a otro orden.
+    """
+    try:
+        relleno = '=' * (-len(token) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(token + relleno).decode('utf-8'))
+        orden_token, posicion = datos['o'], datos['p']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Cursor inválido: {e}")
+    if orden_token != orden:
+        raise ValueError("El cursor corresponde a otro orden")
+    if orden == 'relevancia':
+        if not isinstance(posicion, int) or posicion < 0:
+            raise ValueError("Cursor inválido")
+        return posicion
+    if not isinstance(posicion, list) or len(posicion) != 2:
+        raise ValueError("Cursor inválido")
+    return tuple(posicion)
+
+def _cached_total(clave, contar, estimado=False):
+    """
+    Total de resultados de un conjunto de filtros, reutilizando el último
+    conteo mientras no cambien los datos (y dentro de `CACHE_TIMEOUT`, por si
+    escribió otro proceso).
+    
+    :param contar: Callable `contar(limite=None)` que ejecuta el conteo.
+    :param estimado: Aceptar un total cacheado desactualizado o, si no hay,
+                     contar solo hasta `COUNT_ESTIMATE_LIMIT`.
+    :return: tupla (total, exacto).
+    """
+    version = data_version()
+    total = total_cache.get(clave, version)
+    if total is not None:
+        return total, True
+    
+    if estimado:
+        total = total_cache.get_stale(clave)
+        if total is not None:
+            return total, False
+        total = contar(config.COUNT_ESTIMATE_LIMIT)
+        if total >= config.COUNT_ESTIMATE_LIMIT:
+            return total, False
+    else:
+        total = contar()
+    
+    total_cache.set(clave, version, total)
+    return total, True
+
+def _parse_palabras(valor):
+    """Normaliza el filtro `palabras` ('a, b,c') a una tupla ordenada sin repetidos."""
+    return tuple(sorted({p.strip().lower() for p in valor.split(',') if p.strip()}))
+
+def _parse_fecha_filtro(valor, fin=False):
+    """
+    Convierte un filtro de fecha ('YYYY-MM-DD', 'YYYY-MM' o 'YYYY') en una
+    cota YYYYMMDD comparable con `fecha_dia`. Con `fin` se obtiene la cota
+    superior del mes o año indicado.
+    
+    :return: None si el filtro está vacío.
+    :raises ValueError: si el valor no tiene ninguno de esos formatos.
+    """
+    if not valor:
+        return None
+    if re.fullmatch(r'\d{4}-\d{2}-\d{2}', valor):
+        clave = date_key(valor)
+        if clave is None:
+            raise ValueError(f"Fecha inválida: {valor}")
+        return clave
+    if re.fullmatch(r'\d{4}-\d{2}', valor) and 1 <= int(valor[5:]) <= 12:
+        return int(valor[:4]) * 10000 + int(valor[5:]) * 100 + (99 if fin else 0)
+    if re.fullmatch(r'\d{4}', valor):
+        return int(valor) * 10000 + (9999 if fin else 0)
+    raise ValueError(f"Fecha inválida: {valor}")
+
+def _request_fechas():
+    """Lee `fecha_desde` y `fecha_hasta` de la consulta como cotas YYYYMMDD."""
+    return (_parse_fecha_filtro(request.args.get('fecha_desde', '')),
+            _parse_fecha_filtro(request.args.get('fecha_hasta', ''), fin=True))
+
+def _filter_sentencias(search, campo, palabras, fecha_desde, fecha_hasta):
+    """
+    Traduce los filtros del listado a SQL sobre `sentencias s`.
+    
+    :param palabras: Palabras clave que deben tener todas las sentencias.
+    :param fecha_desde: Cota YYYYMMDD (ver `_parse_fecha_filtro`) o None.
+    :return: tupla (desde, where, params, consulta_fts), donde `desde` es la
+             cláusula FROM y `consulta_fts` la consulta MATCH de
+             `sentencias_fts` si la búsqueda usa el índice de texto completo.
+    """
+    desde = "FROM sentencias s"
+    query = " WHERE 1=1"
     params = []
+    columnas_campo = TRIGRAM_FIELDS.get(campo)
+    consulta_fts = _fts_query(search) if search and fts_disponible and not columnas_campo else None
     
-    if search:
-        query += """ AND (numero_sentencia LIKE ? OR nombre_demandante LIKE ? 
-                    OR nombre_demandado LIKE ? OR numero_expediente LIKE ? 
-                    OR fundamentos LIKE ? OR palabras_clave LIKE ?)"""
+    if search and columnas_campo:
+        # Búsqueda por subcadena limitada a un campo de identificación
+        consulta_trigram, cortas = _trigram_query(search, columnas_campo)
+        if consulta_trigram and trigram_disponible:
+            desde = "FROM sentencias_trigram JOIN sentencias s ON s.id = sentencias_trigram.rowid"
+            query += " AND sentencias_trigram MATCH ?"
+            params.append(consulta_trigram)
+        else:
+            cortas = strip_accents(search).split()
+        for palabra in cortas:
+            query += " AND (" + " OR ".join(f"sin_acentos(s.{c}) LIKE ?" for c in columnas_campo) + ")"
+            params.extend([f"%{palabra}%"] * len(columnas_campo))
+    elif consulta_fts:
+        desde = "FROM sentencias_fts JOIN sentencias s ON s.id = sentencias_fts.rowid"
+        query += " AND sentencias_fts MATCH ?"
+        params.append(consulta_fts)
+    elif search:
+        query += """ AND (s.numero_sentencia LIKE ? OR s.nombre_demandante LIKE ? 
+                    OR s.nombre_demandado LIKE ? OR s.numero_expediente LIKE ? 
+                    OR s.palabras_clave LIKE ? OR s.id IN (
+                        SELECT id FROM sentencias_texto WHERE descomprimir(fundamentos) LIKE ?))"""
         search_param = f"%{search}%"
         params.extend([search_param] * 6)
-        
-        # Registrar búsqueda
-        try:
-            cursor.execute('''
-                INSERT INTO busquedas_frecuentes (termino, ultima_busqueda)
-                VALUES (?, ?)
-                ON CONFLICT(termino) DO UPDATE SET
-                frecuencia = frecuencia + 1,
-                ultima_busqueda = ?
-            ''', (search, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 
-                  datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
-            conn.commit()
-        except Exception as e:
-            logger.error(f"Error al registrar búsqueda: {e}")
+    
+    if palabras:
+        # Intersección de las listas de sentencias de cada palabra (índice palabra, sentencia_id)
+        query += " AND s.id IN (" + " INTERSECT ".join(
+            ["SELECT sentencia_id FROM sentencia_palabras WHERE palabra = ?"] * len(palabras)
+        ) + ")"
+        params.extend(palabras)
     
     if fecha_desde:
-        query += " AND fecha_publicacion >= ?"
+        query += " AND s.fecha_dia >= ?"
         params.append(fecha_desde)
     
     if fecha_hasta:
-        query += " AND fecha_publicacion <= ?"
+        query += " AND s.fecha_dia <= ?"
         params.append(fecha_hasta)
     
-    # Contar total
-    count_query = query.replace("SELECT *", "SELECT COUNT(*)")
-    cursor.execute(count_query, params)
-    total = cursor.fetchone()[0]
-    
-    # Aplicar orden y paginación
-    query += f" ORDER BY {ordenar} LIMIT ? OFFSET ?"
-    params.extend([per_page, (page - 1) * per_page])
-    
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    return desde, query, params, consulta_fts
+
+@app.route("/api/sentencias")
+def api_sentencias():
+    """API REST para obtener sentencias con filtros y paginación."""
+    search = request.args.get('search', '').strip()
+    if search and not request.args.get('cursor') and request.args.get('page', '1') == '1':
+        # Registrar búsqueda (en memoria; se escribe por lotes en segundo plano),
+        # también cuando la respuesta sale de la caché
+        search_log.record(search)
+    return _listar_sentencias()
+
+@cached_response
+def _listar_sentencias():
+    """Listado de `api_sentencias`."""
+    # Obtener parámetros
+    page = int(request.args.get('page', 1))
+    per_page = int(request.args.get('per_page', config.ITEMS_PER_PAGE))
+    search = request.args.get('search', '').strip()
+    ordenar = request.args.get('ordenar', 'fecha_publicacion DESC')
+    campo = request.args.get('campo', '')
+    palabras = _parse_palabras(request.args.get('palabras', ''))
+    cursor_token = request.args.get('cursor', '')
+    conteo_estimado = request.args.get('conteo') == 'estimado'
     
-    sentencias = []
-    for row in rows:
-        sentencia = dict(row)
-        sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
-        sentencias.append(sentencia)
+    try:
+        fecha_desde, fecha_hasta = _request_fechas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    conn.close()
+    # Validar orden para evitar SQL injection
+    if ordenar not in ORDENES and ordenar != 'relevancia':
+        ordenar = 'fecha_publicacion DESC'
     
-    # Limpiar caché si es necesario
-    global cache
-    cache_key = f"sentencias_{page}_{per_page}_{search}_{fecha_desde}_{fecha_hasta}_{ordenar}"
+    with connection(row_factory=sqlite3.Row) as conn:
+        cursor = conn.cursor()
+        
+        # Construir query con filtros
+        select = f"SELECT {COLUMNAS_LISTADO}"
+        desde, query, params, consulta_fts = _filter_sentencias(search, campo, palabras,
+                                                                fecha_desde, fecha_hasta)
+        
+        # Sin consulta de texto completo (listado o búsqueda por campo) no hay
+        # relevancia que calcular: se ordena por fecha, y el cursor es de ese orden
+        orden = ordenar
+        if ordenar == 'relevancia' and not consulta_fts:
+            orden = 'fecha_publicacion DESC'
+        
+        posicion = None
+        if cursor_token:
+            try:
+                posicion = _decode_cursor(cursor_token, orden)
+            except ValueError:
+                return jsonify({'error': 'Cursor inválido para este orden'}), 400
+        if consulta_fts:
+            # Índice de texto completo: fragmento resaltado con marcas que se escapan después
+            select += ", snippet(sentencias_fts, -1, char(2), char(3), '…', 24) AS fragmento"
+        
+        # Contar total (sin otros filtros basta con el índice de texto completo)
+        if consulta_fts and not (fecha_desde or fecha_hasta or palabras):
+            sql_conteo, params_conteo = "FROM sentencias_fts WHERE sentencias_fts MATCH ?", [consulta_fts]
+        else:
+            sql_conteo, params_conteo = f"{desde}{query}", list(params)
+        
+        def contar(limite=None):
+            if limite is None:
+                cursor.execute(f"SELECT COUNT(*) {sql_conteo}", params_conteo)
+            else:
+                cursor.execute(f"SELECT COUNT(*) FROM (SELECT 1 {sql_conteo} LIMIT ?)", params_conteo + [limite])
+            return cursor.fetchone()[0]
+        
+        clave_total = (search, campo, palabras, fecha_desde, fecha_hasta)
+        total, total_exacto = _cached_total(clave_total, contar, conteo_estimado)
+        
+        # Aplicar orden y paginación
+        if orden == 'relevancia':
+            # bm25 no admite búsqueda por cursor: se pagina por desplazamiento
+            pesos = ', '.join(str(p) for p in FTS_WEIGHTS)
+            query += f" ORDER BY bm25(sentencias_fts, {pesos}), s.fecha_publicacion DESC, s.id DESC LIMIT ? OFFSET ?"
+            params.extend([per_page + 1, (page - 1) * per_page if posicion is None else posicion])
+        else:
+            columna, direccion = ORDENES[orden]
+            if isinstance(posicion, tuple):
+                # Paginación por cursor: continuar después de la última fila entregada
+                comparador = '<' if direccion == 'DESC' else '>'
+                query += f" AND (s.{columna}, s.id) {comparador} (?, ?)"
+                params.extend(posicion)
+                query += f" ORDER BY s.{columna} {direccion}, s.id {direccion} LIMIT ?"
+                params.append(per_page + 1)
+            else:
+                query += f" ORDER BY s.{columna} {direccion}, s.id {direccion} LIMIT ? OFFSET ?"
+                params.extend([per_page + 1, (page - 1) * per_page])
+        
+        cursor.execute(f"{select} {desde}{query}", params)
+        rows = cursor.fetchall()
+        
+        # Se pidió una fila de más para saber si hay página siguiente
+        hay_mas = len(rows) > per_page
+        rows = rows[:per_page]
+        siguiente = None
+        if hay_mas and rows:
+            if orden == 'relevancia':
+                desplazamiento = (page - 1) * per_page if posicion is None else posicion
+                siguiente = _encode_cursor('relevancia', desplazamiento + per_page)
+            else:
+                columna = ORDENES[orden][0]
+                siguiente = _encode_cursor(orden, [rows[-1][columna], rows[-1]['id']])
+        
+        sentencias = []
+        for row in rows:
+            sentencia = _row_to_sentencia(row)
+            if sentencia.get('fragmento'):
+                sentencia['fragmento'] = _highlight(sentencia['fragmento'])
+            sentencias.append(sentencia)
     
     return jsonify({
         'sentencias': sentencias,
         'total': total,
-        'page': page,
+        'total_exacto': total_exacto,
+        'page': page if not cursor_token else None,
         'per_page': per_page,
-        'pages': (total + per_page - 1) // per_page if per_page > 0 else 0
+        'pages': (total + per_page - 1) // per_page if per_page > 0 else 0,
+        'next_cursor': siguiente
     })
 
+@app.route("/api/sentencias/facetas")
+@cached_response
+def api_facetas():
+    """
+    Conteo de palabras clave de las sentencias que cumplen los filtros del
+    listado (mismos parámetros que /api/sentencias), desde `sentencia_palabras`.
+    """
+    search = request.args.get('search', '').strip()
+    campo = request.args.get('campo', '')
+    palabras = _parse_palabras(request.args.get('palabras', ''))
+    try:
+        limite = min(max(int(request.args.get('limite') or config.MAX_FACETS), 1), 100)
+        fecha_desde, fecha_hasta = _request_fechas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        if not (search or palabras or fecha_desde or fecha_hasta):
+            # Sin filtros el resultado es todo el corpus: conteos materializados
+            cursor.execute(
+                "SELECT palabra, cantidad FROM estadisticas_palabras ORDER BY cantidad DESC LIMIT ?",
+                (limite,)
+            )
+        else:
+            desde, query, params, _ = _filter_sentencias(search, campo, palabras, fecha_desde, fecha_hasta)
+            # Las palabras ya filtradas aparecen en todos los resultados
+            excluidas = ','.join('?' * len(palabras))
+            cursor.execute(f'''
+                SELECT sp.palabra, COUNT(*) AS cantidad FROM sentencia_palabras sp
+                WHERE sp.sentencia_id IN (SELECT s.id {desde}{query})
+                AND sp.palabra NOT IN ({excluidas})
+                GROUP BY sp.palabra
+                ORDER BY cantidad DESC, sp.palabra
+                LIMIT ?
+            ''', params + list(palabras) + [limite])
+        facetas = [{'palabra': palabra, 'cantidad': cantidad} for palabra, cantidad in cursor.fetchall()]
+    
+    return jsonify({'palabras': facetas, 'filtro': list(palabras)})
+
+# Intervalos del histograma: expresión SQL que lleva una fecha YYYYMMDD al
+# primer día de su intervalo. Las semanas se agrupan por día en SQL y se
+# acumulan (lunes a domingo) después.
+INTERVALOS_HISTOGRAMA = {
+    'dia': '{}',
+    'semana': '{}',
+    'mes': '{} / 100 * 100 + 1',
+    'anio': '{} / 10000 * 10000 + 101',
+}
+
+def _key_to_date(clave):
+    """Entero YYYYMMDD a date."""
+    return datetime(clave // 10000, clave // 100 % 100, clave % 100).date()
+
+@app.route("/api/sentencias/histograma")
+@cached_response
+def api_histograma():
+    """
+    Cantidad de sentencias por día, semana, mes o año para los filtros del
+    listado (mismos parámetros que /api/sentencias).
+    
+    Con filtros se agrupa por `fecha_dia` sobre el índice `idx_fecha_dia`; sin
+    filtros, sobre los conteos por día materializados en `estadisticas_dia`.
+    """
+    intervalo = request.args.get('intervalo', 'mes')
+    if intervalo not in INTERVALOS_HISTOGRAMA:
+        return jsonify({'error': f"Intervalo no soportado, use: {', '.join(INTERVALOS_HISTOGRAMA)}"}), 400
+    search = request.args.get('search', '').strip()
+    campo = request.args.get('campo', '')
+    palabras = _parse_palabras(request.args.get('palabras', ''))
+    try:
+        fecha_desde, fecha_hasta = _request_fechas()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    with connection() as conn:
+        cursor = conn.cursor()
+        if not (search or palabras or fecha_desde or fecha_hasta):
+            cursor.execute(f'''
+                SELECT {INTERVALOS_HISTOGRAMA[intervalo].format('dia')} AS bucket, SUM(cantidad)
+                FROM (
+                    SELECT CAST(replace(fecha, '-', '') AS INTEGER) AS dia, cantidad FROM estadisticas_dia
+                    WHERE fecha GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+                )
+                GROUP BY bucket ORDER BY bucket
+            ''')
+        else:
+            desde, query, params, _ = _filter_sentencias(search, campo, palabras, fecha_desde, fecha_hasta)
+            cursor.execute(f"SELECT {INTERVALOS_HISTOGRAMA[intervalo].format('s.fecha_dia')} AS bucket, COUNT(*) "
+                           f"{desde}{query} AND s.fecha_dia IS NOT NULL GROUP BY bucket ORDER BY bucket", params)
+        filas = cursor.fetchall()
+    
+    if intervalo == 'semana':
+        semanas = {}
+        for clave, cantidad in filas:
+            dia = _key_to_date(clave)
+            lunes = dia - timedelta(days=dia.weekday())
+            semanas[lunes] = semanas.get(lunes, 0) + cantidad
+        buckets = [{'inicio': lunes.isoformat(), 'cantidad': cantidad} for lunes, cantidad in sorted(semanas.items())]
+    else:
+        buckets = [{'inicio': f"{clave // 10000:04d}-{clave // 100 % 100:02d}-{clave % 100:02d}", 'cantidad': cantidad}
+                   for clave, cantidad in filas]
+    
+    return jsonify({'intervalo': intervalo, 'buckets': buckets})
+
 @app.route("/api/estadisticas")
+@cached_response
 def api_estadisticas():
     """API para obtener estadísticas del sistema."""
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    cursor = conn.cursor()
-    
     try:
-        # Estadísticas generales
-        cursor.execute("SELECT COUNT(*) FROM sentencias")
-        total_sentencias = cursor.fetchone()[0]
-        
-        # Sentencias por fecha (últimos 30 días)
-        cursor.execute("""
-            SELECT fecha_publicacion, COUNT(*) as cantidad 
-            FROM sentencias 
-            WHERE fecha_publicacion >= date('now', '-30 days')
-            GROUP BY fecha_publicacion 
-            ORDER BY fecha_publicacion DESC
-        """)
-        sentencias_por_fecha = cursor.fetchall()
-        
-        # Palabras clave más comunes
-        cursor.execute("""
-            SELECT palabras_clave FROM sentencias 
-            WHERE palabras_clave IS NOT NULL AND palabras_clave != ''
-            LIMIT 1000
-        """)
-        todas_palabras = []
-        for row in cursor.fetchall():
-            if row[0]:
-                todas_palabras.extend(row[0].split(', '))
-        
-        palabras_contador = Counter(todas_palabras)
-        top_palabras = palabras_contador.most_common(20)
-        
-        # Búsquedas frecuentes
-        cursor.execute("""
-            SELECT termino, frecuencia 
-            FROM busquedas_frecuentes 
-            ORDER BY frecuencia DESC 
-            LIMIT 10
-        """)
-        busquedas_frecuentes = cursor.fetchall()
-        
-        # Última actualización
-        cursor.execute("""
-            SELECT ultima_actualizacion, nuevas_sentencias 
-            FROM estadisticas 
-            ORDER BY id DESC 
-            LIMIT 1
-        """)
-        ultima_actualizacion = cursor.fetchone()
-        
-        # Estadísticas por mes
-        cursor.execute("""
-            SELECT strftime('%Y-%m', fecha_publicacion) as mes, COUNT(*) as cantidad
-            FROM sentencias
-            WHERE fecha_publicacion IS NOT NULL
-            GROUP BY mes
-            ORDER BY mes DESC
-            LIMIT 12
-        """)
-        sentencias_por_mes = cursor.fetchall()
+        with connection() as conn:
+            cursor = conn.cursor()
+            
+            # Estadísticas generales (tablas materializadas, ver _create_stats_tables)
+            total_sentencias = _total_sentencias(cursor)
+            
+            # Sentencias por fecha (últimos 30 días)
+            cursor.execute("""
+                SELECT fecha, cantidad 
+                FROM estadisticas_dia 
+                WHERE fecha >= date('now', '-30 days')
+                ORDER BY fecha DESC
+            """)
+            sentencias_por_fecha = cursor.fetchall()
+            
+            # Palabras clave más comunes en todo el corpus
+            cursor.execute("""
+                SELECT palabra, cantidad 
+                FROM estadisticas_palabras 
+                ORDER BY cantidad DESC 
+                LIMIT 20
+            """)
+            top_palabras = cursor.fetchall()
+            
+            # Búsquedas frecuentes
+            cursor.execute("""
+                SELECT termino, frecuencia 
+                FROM busquedas_frecuentes 
+                ORDER BY frecuencia DESC 
+                LIMIT 10
+            """)
+            busquedas_frecuentes = cursor.fetchall()
+            
+            # Búsquedas en tendencia (frecuencia con decaimiento exponencial)
+            cursor.execute("""
+                SELECT termino, tendencia 
+                FROM busquedas_frecuentes 
+                WHERE tendencia IS NOT NULL 
+                ORDER BY tendencia DESC 
+                LIMIT 10
+            """)
+            ahora = time.time()
+            busquedas_tendencia = [(termino, round(trending_score(tendencia, ahora), 2))
+                                   for termino, tendencia in cursor.fetchall()]
+            
+            # Última actualización
+            cursor.execute("""
+                SELECT ultima_actualizacion, nuevas_sentencias 
+                FROM estadisticas 
+                ORDER BY id DESC 
+                LIMIT 1
+            """)
+            ultima_actualizacion = cursor.fetchone()
+            
+            # Estadísticas por mes
+            cursor.execute("""
+                SELECT mes, cantidad
+                FROM estadisticas_mes
+                ORDER BY mes DESC
+                LIMIT 12
+            """)
+            sentencias_por_mes = cursor.fetchall()
         
     except Exception as e:
         logger.error(f"Error al obtener estadísticas: {e}")
         return jsonify({'error': 'Error al obtener estadísticas'}), 500
-    finally:
-        conn.close()
     
     return jsonify({
         'total_sentencias': total_sentencias,
@@ -496,35 +1677,39 @@ def api_estadisticas():
         'sentencias_por_mes': sentencias_por_mes,
         'top_palabras': top_palabras,
         'busquedas_frecuentes': busquedas_frecuentes,
+        'busquedas_tendencia': busquedas_tendencia,
         'ultima_actualizacion': ultima_actualizacion,
         'estado_sistema': 'activo' if update_thread and update_thread.is_alive() else 'pausado'
     })
 
 @app.route("/api/exportar/<formato>")
 def exportar(formato):
-    """Exportar datos en diferentes formatos."""
+    """
+    Exportar datos en diferentes formatos.
+    
+    Fuera de `cached_response`: cada descarga lee los datos actuales y lleva
+    en `Content-Disposition` la fecha en que se generó. Aun así se envía por
+    `_send_body` (gzip, ETag y 304) sin guardarse en `response_cache`.
+    """
     if formato not in ['csv', 'json']:
         return jsonify({'error': 'Formato no soportado'}), 400
         
     search = request.args.get('search', '')
     
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM sentencias"
+    # El CSV no incluye los fundamentos: no hace falta descomprimirlos
+    query = SENTENCIA_COMPLETA_SQL if formato == 'json' else f"SELECT {COLUMNAS_LISTADO} FROM sentencias s"
     params = []
     
     if search:
-        query += """ WHERE numero_sentencia LIKE ? OR nombre_demandante LIKE ? 
-                    OR nombre_demandado LIKE ? OR numero_expediente LIKE ?"""
+        query += """ WHERE s.numero_sentencia LIKE ? OR s.nombre_demandante LIKE ? 
+                    OR s.nombre_demandado LIKE ? OR s.numero_expediente LIKE ?"""
         search_param = f"%{search}%"
         params = [search_param] * 4
     
     query += f" LIMIT {config.MAX_EXPORT_RECORDS}"
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    with connection(row_factory=sqlite3.Row) as conn:
+        rows = conn.execute(query, params).fetchall()
     
     if formato == 'csv':
         output = io.StringIO()
@@ -542,52 +1727,35 @@ def exportar(formato):
                 row['palabras_clave'], row['resumen']
             ])
         
-        output.seek(0)
-        conn.close()
-        
-        return Response(
-            output.getvalue(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment;filename=sentencias_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-            }
-        )
+        datos = output.getvalue()
+        mimetype = 'text/csv'
     
     elif formato == 'json':
         sentencias = []
         for row in rows:
-            sentencia = dict(row)
-            sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
+            sentencia = _row_to_sentencia(row)
             sentencias.append(sentencia)
         
-        conn.close()
-        
-        return Response(
-            json.dumps(sentencias, indent=2, ensure_ascii=False),
-            mimetype='application/json',
-            headers={
-                'Content-Disposition': f'attachment;filename=sentencias_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-            }
-        )
+        datos = json.dumps(sentencias, indent=2, ensure_ascii=False)
+        mimetype = 'application/json'
+    
+    nombre = f'sentencias_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{formato}'
+    return _send_body(CachedBody(datos.encode('utf-8'), mimetype,
+                                 [('Content-Disposition', f'attachment;filename={nombre}')]))
 
 @app.route("/api/actualizar", methods=['POST'])
 def actualizar_manual():
-    """Endpoint para actualización manual de datos."""
+    """Inicia una actualización manual en segundo plano y retorna su id de trabajo."""
     try:
         logger.info("Iniciando actualización manual")
-        data = fetch_data(max_pages_fetch=config.MAX_PAGES_MANUAL_UPDATE)
-        if data:
-            nuevas = save_to_db(data)
-            return jsonify({
-                'success': True,
-                'nuevas_sentencias': nuevas,
-                'mensaje': f'Se agregaron {nuevas} nuevas sentencias'
-            })
+        job, creado = start_update_job('manual')
         return jsonify({
             'success': True,
-            'nuevas_sentencias': 0,
-            'mensaje': 'No se encontraron nuevas sentencias.'
-        })
+            'job_id': job.id,
+            'adjuntado': not creado,
+            'mensaje': 'Actualización iniciada' if creado else 'Ya hay una actualización en curso',
+            'progreso': job.snapshot()
+        }), 202
     except Exception as e:
         logger.error(f"Error en actualización manual: {e}")
         return jsonify({
@@ -595,23 +1763,52 @@ def actualizar_manual():
             'error': str(e)
         }), 500
 
+@app.route("/api/actualizar/<job_id>")
+def estado_actualizacion(job_id):
+    """Progreso de un trabajo de actualización ('actual' = el último trabajo)."""
+    job = update_jobs.current() if job_id == 'actual' else update_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(job.snapshot())
+
+@app.route("/api/actualizar/<job_id>/eventos")
+def eventos_actualizacion(job_id):
+    """Transmite el progreso de un trabajo como Server-Sent Events."""
+    job = update_jobs.current() if job_id == 'actual' else update_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    def generar():
+        version = -1
+        while True:
+            if version != job.version:
+                version = job.version
+                yield f"event: progreso\ndata: {json.dumps(job.snapshot())}\n\n"
+            if job.terminado:
+                yield f"event: fin\ndata: {json.dumps(job.snapshot())}\n\n"
+                return
+            if update_jobs.wait(job, version, timeout=15) == version and not job.terminado:
+                # Comentario de keep-alive para proxies
+                yield ": ping\n\n"
+    
+    return Response(stream_with_context(generar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route("/api/detalle/<int:sentencia_id>")
+@cached_response
 def detalle_sentencia(sentencia_id):
     """Obtener detalles completos de una sentencia."""
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM sentencias WHERE id = ?", (sentencia_id,))
-    row = cursor.fetchone()
+    with connection(row_factory=sqlite3.Row) as conn:
+        row = conn.execute(f"{SENTENCIA_COMPLETA_SQL} WHERE s.id = ?", (sentencia_id,)).fetchone()
     
     if row:
-        sentencia = dict(row)
-        sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
-        conn.close()
-        return jsonify(sentencia)
+        sentencia = _row_to_sentencia(row)
+        respuesta = jsonify(sentencia)
+        if sentencia.get('fecha_scraping'):
+            # Hora local del servidor al guardar la sentencia
+            respuesta.last_modified = datetime.strptime(sentencia['fecha_scraping'], '%Y-%m-%d %H:%M:%S').astimezone()
+        return respuesta
     
-    conn.close()
     return jsonify({'error': 'Sentencia no encontrada'}), 404
 
 @app.route("/api/health")
@@ -619,11 +1816,10 @@ def health_check():
     """Endpoint para verificar el estado del sistema."""
     try:
         # Verificar base de datos
-        conn = sqlite3.connect(config.DATABASE_NAME)
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM sentencias")
-        total = cursor.fetchone()[0]
-        conn.close()
+        with connection() as conn:
+            cursor = conn.cursor()
+            total = _total_sentencias(cursor)
+            sincronizacion = {modo: get_sync_state(cursor, modo) for modo in ('incremental', 'backfill')}
         
         # Estado del sistema
         status = {
@@ -632,6 +1828,13 @@ def health_check():
             'total_records': total,
             'update_thread': 'running' if update_thread and update_thread.is_alive() else 'stopped',
             'last_update': last_update.isoformat() if last_update else None,
+            'sync': sincronizacion,
+            'fetcher': rate_controller.snapshot(),
+            'busquedas': search_log.stats(),
+            'cache': {'respuestas': response_cache.stats(), 'totales': total_cache.stats()},
+            'similitud': {'documentos': len(text_analyzer.sentencias_ids), 'version': text_analyzer.version,
+                          'deriva': round(text_analyzer.drift, 3)},
+            'actualizacion': update_jobs.current().snapshot() if update_jobs.current() else None,
             'version': '2.0.0'
         }
         
@@ -643,50 +1846,382 @@ def health_check():
             'error': str(e)
         }), 500
 
+# Texto de cada sentencia que entra en el índice de similitud
+SIMILARITY_CORPUS_SQL = '''
+    SELECT s.id, s.numero_sentencia, s.palabras_clave, s.fecha_dia, descomprimir(t.fundamentos) AS fundamentos
+    FROM sentencias s LEFT JOIN sentencias_texto t ON t.id = s.id
+'''
+
+# Reentrante: update_similarity_index puede llamar a rebuild_similarity_index
+_similarity_lock = threading.RLock()
+# Puesta al día del índice en segundo plano (ver start_similarity_update)
+_similarity_thread = None
+_similarity_thread_lock = threading.Lock()
+
+def _save_similarity_index():
+    """
+    Guarda el índice de `text_analyzer` y poda del registro de cambios lo que
+    ya quedó incorporado en él.
+    """
+    if not text_analyzer.save(config.SIMILARITY_INDEX_DIR):
+        return
+    with connection() as conn:
+        conn.execute("DELETE FROM sentencias_cambios WHERE version <= ?", (text_analyzer.version,))
+
+def _iter_similarity_corpus(batch_size=None):
+    """Recorre el texto de las sentencias del índice de similitud en lotes de `fetchmany`."""
+    batch_size = batch_size or config.SIMILARITY_BUILD_BATCH
+    with connection(row_factory=sqlite3.Row) as conn:
+        cursor = conn.execute(SIMILARITY_CORPUS_SQL)
+        while True:
+            filas = cursor.fetchmany(batch_size)
+            if not filas:
+                break
+            yield [dict(row) for row in filas]
+
+def rebuild_similarity_index():
+    """
+    Reconstruye el índice TF-IDF de `text_analyzer` desde la base de datos y lo
+    guarda en `SIMILARITY_INDEX_DIR` para los demás procesos y reinicios.
+    
+    Desde `SIMILARITY_CHUNKED_MIN` sentencias el corpus se lee por lotes que
+    se vectorizan en procesos aparte (ver `TextAnalyzer.build_index_chunked`),
+    así que la memoria no crece con el texto total. Por debajo se vectoriza en
+    memoria en una sola pasada y sin procesos, que cuesta menos que arrancarlos.
+    """
+    with _similarity_lock:
+        with connection() as conn:
+            # Las pasadas y la versión leen la misma instantánea
+            conn.execute("BEGIN")
+            version = stored_data_version(conn.cursor())
+            total = conn.execute("SELECT COUNT(*) FROM sentencias").fetchone()[0]
+            if total < config.SIMILARITY_CHUNKED_MIN:
+                text_analyzer.build_index([s for lote in _iter_similarity_corpus() for s in lote], version)
+            else:
+                pool = EnrichmentPool(workers=config.SIMILARITY_BUILD_WORKERS)
+                try:
+                    text_analyzer.build_index_chunked(_iter_similarity_corpus, version, pool)
+                finally:
+                    pool.shutdown()
+        _save_similarity_index()
+
+def _changed_since(cursor, desde, hasta):
+    """
+    Ids de las sentencias con cambios registrados entre las versiones `desde`
+    (excluida) y `hasta`, o None si el registro ya se podó más allá de `desde`.
+    """
+    cursor.execute("SELECT MIN(version) FROM sentencias_cambios")
+    minima = cursor.fetchone()[0]
+    if minima is None or minima > desde + 1:
+        return None
+    cursor.execute("SELECT DISTINCT id FROM sentencias_cambios WHERE version > ? AND version <= ?",
+                   (desde, hasta))
+    return [row[0] for row in cursor.fetchall()]
+
+def _similarity_index_current(version):
+    return text_analyzer.version is not None and text_analyzer.version >= version
+
+def update_similarity_index():
+    """
+    Lleva el índice de similitud a la versión actual de los datos.
+    
+    Si otro proceso guardó en disco un índice más nuevo que el de memoria, lo
+    carga. Si aún faltan cambios, vectoriza solo las sentencias modificadas
+    desde la versión del índice con el vocabulario/IDF ya ajustados y guarda
+    el resultado. Reajusta todo desde cero si no hay índice, si el registro de
+    cambios ya no cubre la versión del índice o si la fracción de sentencias
+    vectorizadas sin reajuste superaría `SIMILARITY_REFIT_RATIO`.
+    
+    :return: 'vigente', 'cargado', 'incremental' o 'completo' según lo que hizo.
+    """
+    with _similarity_lock:
+        guardado = TextAnalyzer()
+        cargado = (guardado.load(config.SIMILARITY_INDEX_DIR)
+                   and (text_analyzer.version is None or guardado.version > text_analyzer.version))
+        if cargado:
+            text_analyzer.state = guardado.state
+        
+        desde = text_analyzer.version
+        if desde is None:
+            logger.info("Construyendo el índice de similitud")
+            rebuild_similarity_index()
+            return 'completo'
+        
+        with connection(row_factory=sqlite3.Row) as conn:
+            cursor = conn.cursor()
+            # Versión, registro de cambios y textos leídos de la misma instantánea
+            cursor.execute("BEGIN")
+            version = stored_data_version(cursor)
+            if version <= desde:
+                return 'cargado' if cargado else 'vigente'
+            
+            cambiadas = _changed_since(cursor, desde, version)
+            sentencias = []
+            if cambiadas is not None:
+                for lote in _chunks(cambiadas, 500):
+                    placeholders = ','.join('?' * len(lote))
+                    cursor.execute(f"{SIMILARITY_CORPUS_SQL} WHERE s.id IN ({placeholders})", lote)
+                    sentencias.extend(dict(row) for row in cursor.fetchall())
+        
+        if cambiadas is None:
+            logger.info(f"El registro de cambios no cubre la versión {desde} del índice de similitud; reconstruyendo")
+            rebuild_similarity_index()
+            return 'completo'
+        
+        ajustadas = max(text_analyzer.state.ajustadas, 1)
+        if (text_analyzer.state.agregadas + len(sentencias)) / ajustadas > config.SIMILARITY_REFIT_RATIO:
+            logger.info("El índice de similitud acumuló demasiadas sentencias sin reajustar el IDF; reconstruyendo")
+            rebuild_similarity_index()
+            return 'completo'
+        
+        encontradas = {s['id'] for s in sentencias}
+        text_analyzer.update_index(sentencias, [i for i in cambiadas if i not in encontradas], version)
+        _save_similarity_index()
+        _update_similar_table(cambiadas)
+        return 'incremental'
+
+def _store_neighbors(conn, bloque):
+    """Reemplaza en `similares` los vecinos de las sentencias de un bloque de `iter_neighbors`."""
+    conn.executemany("DELETE FROM similares WHERE sentencia_id = ?", [(sentencia_id,) for sentencia_id, _ in bloque])
+    conn.executemany(
+        "INSERT INTO similares (sentencia_id, posicion, similar_id, similitud) VALUES (?, ?, ?, ?)",
+        [(sentencia_id, posicion, vecino, similitud)
+         for sentencia_id, vecinos in bloque
+         for posicion, (vecino, similitud) in enumerate(vecinos)]
+    )
+
+def rebuild_similar_table(on_progress=None):
+    """
+    Recalcula la tabla `similares` con los `SIMILARITY_NEIGHBORS` vecinos de
+    cada sentencia del índice de similitud, por bloques de filas confirmados
+    uno a uno. Es un trabajo por lotes (ver `bulk_downloader.py
+    --rebuild-similares`); mientras corre, las sentencias aún sin vecinos
+    guardados se responden con el índice en memoria.
+    
+    :param on_progress: Opcional. Callback que recibe el total procesado.
+    :return: número de sentencias procesadas.
+    """
+    ensure_similarity_index()
+    procesadas = 0
+    with connection() as conn:
+        for bloque in text_analyzer.iter_neighbors(config.SIMILARITY_NEIGHBORS):
+            _store_neighbors(conn, bloque)
+            conn.commit()
+            procesadas += len(bloque)
+            if on_progress:
+                on_progress(procesadas)
+        # Sentencias que ya no están en el índice
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS indice_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM indice_ids")
+        conn.executemany("INSERT INTO indice_ids (id) VALUES (?)",
+                         [(int(i),) for i in text_analyzer.sentencias_ids])
+        conn.execute("DELETE FROM similares WHERE sentencia_id NOT IN (SELECT id FROM indice_ids)")
+        conn.execute("DROP TABLE indice_ids")
+    logger.info(f"Vecinos similares recalculados para {procesadas} sentencias")
+    return procesadas
+
+def _update_similar_table(cambiadas):
+    """
+    Recalcula los vecinos guardados de las sentencias `cambiadas` tras una
+    actualización incremental del índice, si la tabla `similares` está en uso.
+    Las sentencias eliminadas dejan de aparecer como vecinas al consultarlas
+    (se unen con `sentencias`); las nuevas aparecerán como vecinas de las
+    demás en la próxima ejecución de `rebuild_similar_table`.
+    """
+    with connection() as conn:
+        if conn.execute("SELECT 1 FROM similares LIMIT 1").fetchone() is None:
+            return
+        estado = text_analyzer.state
+        filas = [estado.posiciones[i] for i in cambiadas if i in estado.posiciones]
+        conn.executemany("DELETE FROM similares WHERE sentencia_id = ?",
+                         [(i,) for i in cambiadas if i not in estado.posiciones])
+        for bloque in text_analyzer.iter_neighbors(config.SIMILARITY_NEIGHBORS, filas):
+            _store_neighbors(conn, bloque)
+
+def _run_similarity_update():
+    try:
+        update_similarity_index()
+    except Exception as e:
+        logger.error(f"Error al actualizar el índice de similitud: {e}")
+
+def start_similarity_update():
+    """Pone al día el índice de similitud en un hilo aparte, si no hay uno ya en curso."""
+    global _similarity_thread
+    with _similarity_thread_lock:
+        if _similarity_thread is None or not _similarity_thread.is_alive():
+            _similarity_thread = threading.Thread(target=_run_similarity_update, daemon=True)
+            _similarity_thread.start()
+
+def ensure_similarity_index(bloquear=True):
+    """
+    Deja `text_analyzer` al día con la versión persistente de los datos (ver
+    `update_similarity_index`).
+    
+    Con `bloquear=False` (rutas HTTP) nunca construye el índice en el hilo que
+    llama: como mucho mapea el índice guardado en disco, deja la puesta al día
+    en segundo plano y sigue con el índice que haya en memoria.
+    
+    :return: True si hay un índice en memoria con que responder.
+    """
+    with connection() as conn:
+        version = stored_data_version(conn.cursor())
+    if _similarity_index_current(version):
+        return True
+    if bloquear:
+        update_similarity_index()
+        return True
+    
+    # Cargar el índice guardado es barato (mapeo en memoria); no pisar una construcción en curso
+    if text_analyzer.version is None and _similarity_lock.acquire(blocking=False):
+        try:
+            text_analyzer.load(config.SIMILARITY_INDEX_DIR)
+        finally:
+            _similarity_lock.release()
+    if not _similarity_index_current(version):
+        start_similarity_update()
+    return text_analyzer.vectors is not None
+
+def _refresh_similarity_index():
+    """
+    Tras escribir sentencias: las incorpora al índice de similitud, si este
+    proceso ya tiene uno (así la próxima búsqueda de similares no espera), y
+    poda el registro de cambios.
+    """
+    if text_analyzer.version is not None:
+        try:
+            update_similarity_index()
+        except Exception as e:
+            logger.error(f"Error al actualizar el índice de similitud: {e}")
+    prune_change_log()
+
+def prune_change_log():
+    """
+    Poda `sentencias_cambios`, que solo sirve para poner al día el índice de
+    similitud guardado sin reconstruirlo. Borra lo que el índice en disco ya
+    incorpora, y todo si no hay índice guardado o si los cambios pendientes ya
+    superan lo que `update_similarity_index` aplicaría sin un reajuste completo.
+    Así el registro no crece aunque nunca se use el índice; la versión
+    persistente (`stored_data_version`) no depende de las filas que queden.
+    """
+    manifiesto = text_analyzer.read_manifest(config.SIMILARITY_INDEX_DIR)
+    with connection() as conn:
+        if manifiesto is None:
+            conn.execute("DELETE FROM sentencias_cambios")
+            return
+        conn.execute("DELETE FROM sentencias_cambios WHERE version <= ?", (manifiesto['version'] or 0,))
+        pendientes = conn.execute("SELECT COUNT(DISTINCT id) FROM sentencias_cambios").fetchone()[0]
+        margen = config.SIMILARITY_REFIT_RATIO * max(manifiesto.get('ajustadas', 1), 1) - manifiesto.get('agregadas', 0)
+        if pendientes > margen:
+            # El índice se reconstruirá entero (ver _changed_since); el registro ya no sirve
+            conn.execute("DELETE FROM sentencias_cambios")
+
+# Vecinos precalculados de una sentencia, ya con las columnas del listado
+SIMILARES_SQL = f'''
+    SELECT {COLUMNAS_LISTADO}, m.similitud AS similarity_score
+    FROM similares m JOIN sentencias s ON s.id = m.similar_id
+    WHERE m.sentencia_id = ? AND m.similitud >= ?
+    ORDER BY m.posicion
+    LIMIT ?
+'''
+
+def _similarity_index_building():
+    """Respuesta mientras el índice de similitud se construye por primera vez."""
+    mensaje = 'El índice de similitud se está construyendo; intente de nuevo en unos momentos'
+    return jsonify({'error': mensaje}), 503, {'Retry-After': '30'}
+
+def _similar_details(similares):
+    """Columnas del listado de cada resultado de `find_similar*`, en el mismo orden y con `similarity_score`."""
+    if not similares:
+        return []
+    
+    ids = [s['id'] for s in similares]
+    placeholders = ','.join('?' * len(ids))
+    with connection(row_factory=sqlite3.Row) as conn:
+        por_id = {row['id']: dict(row) for row in conn.execute(
+            f"SELECT {COLUMNAS_LISTADO} FROM sentencias s WHERE s.id IN ({placeholders})", ids
+        )}
+    
+    sentencias_similares = []
+    for s in similares:
+        sentencia = por_id.get(s['id'])
+        if sentencia:
+            # Agregar score de similitud
+            sentencia['similarity_score'] = s['similarity']
+            sentencias_similares.append(sentencia)
+    return sentencias_similares
+
 @app.route("/api/sentencias/similares/<int:sentencia_id>")
 def sentencias_similares(sentencia_id):
-    """Encuentra sentencias similares a una dada."""
+    """
+    Encuentra sentencias similares a una dada.
+    
+    Usa los vecinos precalculados en `similares` si los hay (una consulta
+    por índice); si no, los calcula con el índice de similitud en memoria.
+    """
+    umbral = config.SIMILARITY_THRESHOLD
+    limite = config.SIMILARITY_LIMIT
     try:
-        # Reconstruir índice si es necesario
-        if not text_analyzer.vectors:
-            conn = sqlite3.connect(config.DATABASE_NAME)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM sentencias")
-            sentencias = [dict(row) for row in cursor.fetchall()]
-            conn.close()
-            text_analyzer.build_index(sentencias)
+        with connection(row_factory=sqlite3.Row) as conn:
+            rows = conn.execute(SIMILARES_SQL, (sentencia_id, umbral, limite)).fetchall()
+        if rows:
+            return jsonify([dict(row) for row in rows])
+        
+        if not ensure_similarity_index(bloquear=False):
+            return _similarity_index_building()
         
         # Buscar similares
-        similares = text_analyzer.find_similar(sentencia_id)
+        similares = text_analyzer.find_similar(sentencia_id, umbral, limite)
+        return jsonify(_similar_details(similares))
+    
+    except Exception as e:
+        logger.error(f"Error al buscar sentencias similares: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route("/api/sentencias/similares/texto", methods=['POST'])
+def sentencias_similares_texto():
+    """
+    Encuentra sentencias parecidas a un texto libre ("sentencias como este párrafo").
+    
+    Recibe JSON con `texto` y, opcionalmente, `limite`, `fecha_desde`,
+    `fecha_hasta` (mismos formatos que el listado) y `palabras` (lista o
+    'a, b'). Los filtros se aplican sobre las filas del índice antes de
+    ordenar por similitud.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        texto = (data.get('texto') or '').strip()[:config.SIMILARITY_QUERY_MAX_CHARS]
+        if not texto:
+            return jsonify({'error': 'Debe indicar el texto a comparar'}), 400
         
-        # Obtener detalles de las sentencias similares
-        if similares:
-            conn = sqlite3.connect(config.DATABASE_NAME)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            ids = [s['id'] for s in similares]
-            placeholders = ','.join('?' * len(ids))
-            cursor.execute(f"SELECT * FROM sentencias WHERE id IN ({placeholders})", ids)
-            
-            sentencias_similares = []
-            for row in cursor.fetchall():
-                sentencia = dict(row)
-                # Agregar score de similitud
-                for s in similares:
-                    if s['id'] == sentencia['id']:
-                        sentencia['similarity_score'] = s['similarity']
-                        break
-                sentencias_similares.append(sentencia)
-            
-            conn.close()
-            return jsonify(sentencias_similares)
+        try:
+            limite = min(max(int(data.get('limite') or config.SIMILARITY_TEXT_LIMIT), 1),
+                         config.SIMILARITY_TEXT_MAX_LIMIT)
+            fecha_desde = _parse_fecha_filtro(data.get('fecha_desde') or '')
+            fecha_hasta = _parse_fecha_filtro(data.get('fecha_hasta') or '', fin=True)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        palabras = data.get('palabras') or ''
+        palabras = _parse_palabras(palabras if isinstance(palabras, str) else ','.join(map(str, palabras)))
+        
+        ids = None
+        if palabras:
+            # Sentencias con todas las palabras clave (índice palabra, sentencia_id)
+            with connection() as conn:
+                ids = [row[0] for row in conn.execute(" INTERSECT ".join(
+                    ["SELECT sentencia_id FROM sentencia_palabras WHERE palabra = ?"] * len(palabras)
+                ), palabras)]
+            if not ids:
+                return jsonify([])
         
-        return jsonify([])
+        if not ensure_similarity_index(bloquear=False):
+            return _similarity_index_building()
         
+        similares = text_analyzer.find_similar_text(texto, config.SIMILARITY_TEXT_THRESHOLD, limite,
+                                                    fecha_desde, fecha_hasta, ids)
+        return jsonify(_similar_details(similares))
+    
     except Exception as e:
-        logger.error(f"Error al buscar sentencias similares: {e}")
+        logger.error(f"Error al buscar sentencias similares a un texto: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route("/api/reporte/sentencia/<int:sentencia_id>")
@@ -694,19 +2229,13 @@ def generar_reporte_sentencia(sentencia_id):
     """Genera reporte PDF de una sentencia."""
     try:
         # Obtener datos de la sentencia
-        conn = sqlite3.connect(config.DATABASE_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM sentencias WHERE id = ?", (sentencia_id,))
-        row = cursor.fetchone()
+        with connection(row_factory=sqlite3.Row) as conn:
+            row = conn.execute(f"{SENTENCIA_COMPLETA_SQL} WHERE s.id = ?", (sentencia_id,)).fetchone()
         
         if not row:
-            conn.close()
             return jsonify({'error': 'Sentencia no encontrada'}), 404
         
-        sentencia = dict(row)
-        sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
-        conn.close()
+        sentencia = _row_to_sentencia(row)
         
         # Generar PDF
         with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
@@ -735,20 +2264,15 @@ def comparar_sentencias():
             return jsonify({'error': 'Se requieren exactamente 2 IDs de sentencias'}), 400
         
         # Obtener sentencias
-        conn = sqlite3.connect(config.DATABASE_NAME)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
         sentencias = []
-        for id in ids:
-            cursor.execute("SELECT * FROM sentencias WHERE id = ?", (id,))
-            row = cursor.fetchone()
-            if row:
-                sentencia = dict(row)
-                sentencia['fundamentos'] = sentencia['fundamentos'].split('\n') if sentencia['fundamentos'] else []
-                sentencias.append(sentencia)
-        
-        conn.close()
+        with connection(row_factory=sqlite3.Row) as conn:
+            cursor = conn.cursor()
+            for id in ids:
+                cursor.execute(f"{SENTENCIA_COMPLETA_SQL} WHERE s.id = ?", (id,))
+                row = cursor.fetchone()
+                if row:
+                    sentencia = _row_to_sentencia(row)
+                    sentencias.append(sentencia)
         
         if len(sentencias) != 2:
             return jsonify({'error': 'Una o más sentencias no encontradas'}), 404
@@ -774,13 +2298,14 @@ def comparar_sentencias():
         return jsonify({'error': str(e)}), 500
 
 @app.route("/api/favoritos", methods=['GET', 'POST', 'DELETE'])
+@cached_response
 def gestionar_favoritos():
     """Gestiona sentencias favoritas."""
     try:
         if request.method == 'GET':
             # Obtener todos los favoritos
-            favoritos = favorites_manager.get_favorites()
-            return jsonify(favoritos)
+            favoritos = favorites_manager.get_favorites(COLUMNAS_LISTADO)
+            return jsonify([_row_to_sentencia(f) for f in favoritos])
         
         elif request.method == 'POST':
             # Agregar a favoritos
@@ -830,6 +2355,7 @@ def actualizar_notas_favorito(sentencia_id):
         return jsonify({'error': str(e)}), 500
 
 @app.route("/api/favoritos/check/<int:sentencia_id>")
+@cached_response
 def check_favorito(sentencia_id):
     """Verifica si una sentencia está en favoritos."""
     try:
@@ -870,18 +2396,17 @@ def internal_error(error):
 if __name__ == "__main__":
     init_db()
     
+    # Mapear el índice de similitud guardado y ponerlo al día en segundo plano
+    text_analyzer.load(config.SIMILARITY_INDEX_DIR)
+    start_similarity_update()
+    
     # Cargar datos iniciales si la base está vacía
-    conn = sqlite3.connect(config.DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM sentencias")
-    count = cursor.fetchone()[0]
-    conn.close()
+    with connection() as conn:
+        count = conn.execute("SELECT COUNT(*) FROM sentencias").fetchone()[0]
     
     if count == 0:
         logger.info("Base de datos vacía, cargando datos iniciales...")
-        initial_data = fetch_data(max_pages_fetch=3)
-        if initial_data:
-            save_to_db(initial_data)
+        sync_sentencias('incremental', max_pages_fetch=3)
     
     # Iniciar actualización automática en segundo plano
     update_thread = threading.Thread(target=background_update, daemon=True)
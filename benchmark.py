@@ -0,0 +1,145 @@
+"""
+Benchmark de ingesta de punta a punta contra el servidor simulado de SEDETC.
+
+Levanta `fake_api.py` en un subproceso (o usa una URL ya en ejecución), ejecuta
+`fetch_data` + `save_to_db` sobre una base de datos temporal y reporta
+páginas/seg, registros/seg y el pico de memoria residente.
+
+Uso:
+    python benchmark.py --pages 200 --latency 0.1 --error-rate 0.02
+    python benchmark.py --replay-dir grabaciones/ --pages 100
+    python benchmark.py --modo streaming --pages 500
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from config import config
+
+def _wait_for_port(host, port, timeout=10.0):
+    """Espera a que el servidor simulado acepte conexiones."""
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def _peak_rss_mb():
+    """Pico de memoria residente del proceso actual en MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+def _server_stats(base_url):
+    try:
+        with urllib.request.urlopen(f"{base_url}/_stats", timeout=5) as response:
+            return json.load(response)
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de ingesta contra la API simulada')
+    parser.add_argument('--pages', type=int, default=100, help='páginas a descargar')
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.05, help='latencia media del servidor en segundos')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probabilidad de 429 del servidor')
+    parser.add_argument('--replay-dir', help='reproducir páginas grabadas en lugar de generarlas')
+    parser.add_argument('--api-url', help='usar un servidor ya iniciado en lugar de levantar fake_api.py')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--modo', choices=['lote', 'streaming'], default='lote',
+                        help="'lote' = fetch_data + save_to_db, 'streaming' = ingest_pages")
+    parser.add_argument('--rate', type=float, help='máximo de solicitudes por segundo (API_RATE_LIMIT)')
+    parser.add_argument('--concurrency', type=int, help='solicitudes simultáneas (API_MAX_CONCURRENT_REQUESTS)')
+    parser.add_argument('--db', help='base de datos a usar (por defecto un archivo temporal)')
+    args = parser.parse_args()
+
+    # Configurar antes de importar app, que abre la base de datos al cargarse
+    db_temporal = None
+    if args.db:
+        config.DATABASE_NAME = args.db
+    else:
+        db_temporal = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        config.DATABASE_NAME = db_temporal
+    config.LOG_LEVEL = 'WARNING'
+    config.API_RETRY_DELAY = 0.5
+    if args.rate:
+        config.API_RATE_LIMIT = args.rate
+    if args.concurrency:
+        config.API_MAX_CONCURRENT_REQUESTS = args.concurrency
+
+    servidor = None
+    base_url = None
+    api_url = args.api_url
+    if not api_url:
+        comando = [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_api.py'),
+            '--port', str(args.port), '--num-pages', str(args.pages),
+            '--page-size', str(args.page_size), '--latency', str(args.latency),
+            '--error-rate', str(args.error_rate)
+        ]
+        if args.replay_dir:
+            comando += ['--replay-dir', args.replay_dir]
+        servidor = subprocess.Popen(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        if not _wait_for_port('127.0.0.1', args.port):
+            servidor.terminate()
+            sys.exit('No se pudo iniciar el servidor simulado')
+        base_url = f"http://127.0.0.1:{args.port}"
+        api_url = f"{base_url}/api/visitor/sentencia/busqueda"
+
+    try:
+        import app
+        import fetcher
+        app.init_db()
+
+        rss_inicial = _peak_rss_mb()
+        inicio = time.perf_counter()
+        if args.modo == 'lote':
+            data = app.fetch_data(api_url, max_pages_fetch=args.pages)
+            fin_descarga = time.perf_counter()
+            app.save_to_db(data)
+            registros = len(data)
+            paginas = -(-registros // args.page_size)
+        else:
+            resultado = app.ingest_pages(api_url, max_pages_fetch=args.pages)
+            fin_descarga = None
+            registros = resultado['nuevas'] + resultado['actualizadas'] + resultado['sin_cambios']
+            paginas = resultado['paginas']
+        total = time.perf_counter() - inicio
+
+        print(f"Modo:               {args.modo}")
+        print(f"Páginas:            {paginas}")
+        print(f"Registros:          {registros}")
+        print(f"Tiempo total:       {total:.2f} s")
+        if fin_descarga is not None:
+            print(f"  descarga:         {fin_descarga - inicio:.2f} s")
+            print(f"  guardado:         {total - (fin_descarga - inicio):.2f} s")
+        print(f"Páginas/seg:        {paginas / total:.2f}")
+        print(f"Registros/seg:      {registros / total:.2f}")
+        print(f"Pico RSS:           {_peak_rss_mb():.1f} MB (inicial {rss_inicial:.1f} MB)")
+        controlador = fetcher.rate_controller.snapshot()
+        print(f"Tasa final:         {controlador['rate']} req/s, concurrencia {controlador['concurrency']} "
+              f"({controlador['throttle_events']} eventos 429)")
+        if base_url:
+            stats = _server_stats(base_url)
+            if stats:
+                print(f"Solicitudes:        {stats['solicitudes']} ({stats['errores_429']} respuestas 429)")
+    finally:
+        if servidor:
+            servidor.terminate()
+            servidor.wait()
+        if db_temporal:
+            for sufijo in ('', '-wal', '-shm'):
+                if os.path.exists(db_temporal + sufijo):
+                    os.remove(db_temporal + sufijo)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Descarga masiva del histórico de sentencias de SEDETC.
+
+Divide el rango de páginas de la API en shards contiguos y los recorre en
+paralelo, cada uno en su propio hilo. Todos los shards comparten el
+controlador de tasa del proceso, así que el límite de solicitudes por segundo
+y de solicitudes simultáneas es global. Cada shard guarda su checkpoint en
+`sync_state` (modo 'shard:<inicio>-<fin>') en la misma transacción que sus
+datos, de modo que una ejecución interrumpida se reanuda donde quedó si se
+vuelve a lanzar con el mismo rango y número de shards.
+
+Uso:
+    python bulk_downloader.py --shards 8
+    python bulk_downloader.py --start-page 1 --end-page 2000 --shards 4 --rate 3
+    python bulk_downloader.py --rebuild-derived
+    python bulk_downloader.py --solo-derivadas --rebuild-stats
+    python bulk_downloader.py --solo-derivadas --rebuild-index
+    python bulk_downloader.py --solo-derivadas --rebuild-similares
+"""
+import argparse
+import asyncio
+import threading
+import time
+from config import config
+from database import connection
+
+def plan_shards(start_page, end_page, shards):
+    """Divide el rango [start_page, end_page] en `shards` rangos contiguos."""
+    total = end_page - start_page + 1
+    shards = max(1, min(shards, total))
+    tamano, resto = divmod(total, shards)
+    rangos = []
+    inicio = start_page
+    for i in range(shards):
+        fin = inicio + tamano - 1 + (1 if i < resto else 0)
+        rangos.append((inicio, fin))
+        inicio = fin + 1
+    return rangos
+
+def shard_mode(inicio, fin):
+    """Nombre del checkpoint de un shard en `sync_state`."""
+    return f"shard:{inicio}-{fin}"
+
+def run_shard(app, inicio, fin, api_url=None, reiniciar=False):
+    """
+    Recorre un shard reanudando desde su checkpoint.
+
+    :return: dict de resultado de `ingest_pages` más el rango y si quedó completo.
+    """
+    modo = shard_mode(inicio, fin)
+    with connection() as conn:
+        if reiniciar:
+            conn.execute("DELETE FROM sync_state WHERE modo = ?", (modo,))
+        estado = app.get_sync_state(conn.cursor(), modo)
+
+    resultado = {'paginas': 0, 'nuevas': 0, 'actualizadas': 0, 'sin_cambios': 0,
+                 'ultima_pagina': estado['ultima_pagina'], 'agotado': False}
+    desde = max(inicio, estado['ultima_pagina'] + 1)
+    if not estado['completado'] and desde <= fin:
+        app.logger.info(f"Shard {modo}: descargando páginas {desde}-{fin}")
+        resultado = app.ingest_pages(api_url, desde, fin - desde + 1, checkpoint=modo)
+        # Completo solo si se guardaron todas las páginas de `desde` en adelante
+        # sin huecos, hasta `fin` o hasta la última página de la API
+        guardadas = (resultado['ultima_pagina'] is not None
+                     and resultado['paginas'] == resultado['ultima_pagina'] - desde + 1)
+        completado = guardadas and (resultado['agotado'] or resultado['ultima_pagina'] == fin)
+        if not completado:
+            app.logger.warning(f"Shard {modo} incompleto: se reanudará desde la página "
+                               f"{(resultado['ultima_pagina'] or desde - 1) + 1}")
+    else:
+        completado = True
+
+    if completado and not estado['completado']:
+        with connection() as conn:
+            conn.execute('''
+                INSERT INTO sync_state (modo, ultima_pagina, completado, actualizado) VALUES (?, ?, 1, ?)
+                ON CONFLICT(modo) DO UPDATE SET completado = 1, actualizado = excluded.actualizado
+            ''', (modo, fin, time.strftime('%Y-%m-%d %H:%M:%S')))
+        app.logger.info(f"Shard {modo} completado")
+
+    resultado.update({'inicio': inicio, 'fin': fin, 'completado': completado})
+    return resultado
+
+def run_sharded_backfill(app, start_page, end_page, shards, api_url=None, reiniciar=False):
+    """Recorre todos los shards en paralelo y retorna la lista de resultados por shard."""
+    rangos = plan_shards(start_page, end_page, shards)
+    resultados = [None] * len(rangos)
+
+    def worker(indice, inicio, fin):
+        try:
+            resultados[indice] = run_shard(app, inicio, fin, api_url, reiniciar)
+        except Exception as e:
+            app.logger.error(f"Error en el shard {shard_mode(inicio, fin)}: {e}")
+            resultados[indice] = {'paginas': 0, 'nuevas': 0, 'actualizadas': 0, 'sin_cambios': 0,
+                                  'inicio': inicio, 'fin': fin, 'completado': False, 'error': str(e)}
+
+    hilos = [threading.Thread(target=worker, args=(i, inicio, fin), daemon=True)
+             for i, (inicio, fin) in enumerate(rangos)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+def print_summary(resultados, transcurrido, controller):
+    """Imprime el resumen de rendimiento de la descarga."""
+    paginas = sum(r['paginas'] for r in resultados)
+    registros = sum(r['nuevas'] + r['actualizadas'] + r['sin_cambios'] for r in resultados)
+    segundos = max(transcurrido, 1e-9)
+
+    print(f"{'shard':>15} {'páginas':>8} {'nuevas':>8} {'actualiz.':>9} {'sin camb.':>9}  estado")
+    for r in resultados:
+        estado = 'error' if r.get('error') else ('completo' if r['completado'] else 'pendiente')
+        print(f"{r['inicio']:>7}-{r['fin']:<7} {r['paginas']:>8} {r['nuevas']:>8} "
+              f"{r['actualizadas']:>9} {r['sin_cambios']:>9}  {estado}")
+
+    snapshot = controller.snapshot()
+    print(f"Tiempo total:       {transcurrido:.1f} s")
+    print(f"Páginas:            {paginas} ({paginas / segundos:.2f} páginas/s)")
+    print(f"Registros:          {registros} ({registros / segundos:.1f} registros/s)")
+    print(f"Nuevas/actualizadas/sin cambios: {sum(r['nuevas'] for r in resultados)}/"
+          f"{sum(r['actualizadas'] for r in resultados)}/{sum(r['sin_cambios'] for r in resultados)}")
+    print(f"Tasa final:         {snapshot['rate']:.2f} req/s, concurrencia {snapshot['concurrency']:.0f}, "
+          f"{snapshot['throttle_events']} reducciones")
+    pendientes = [shard_mode(r['inicio'], r['fin']) for r in resultados if not r['completado']]
+    if pendientes:
+        print(f"Shards pendientes (vuelva a ejecutar para reanudar): {', '.join(pendientes)}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Descarga masiva del histórico de sentencias')
+    parser.add_argument('--start-page', type=int, default=1)
+    parser.add_argument('--end-page', type=int, help='última página (por defecto, todas las de la API)')
+    parser.add_argument('--shards', type=int, default=4, help='rangos de páginas recorridos en paralelo')
+    parser.add_argument('--api-url', help='URL de la API (por defecto config.API_URL)')
+    parser.add_argument('--rate', type=float, help='máximo global de solicitudes por segundo (API_RATE_LIMIT)')
+    parser.add_argument('--concurrency', type=int, help='máximo global de solicitudes simultáneas')
+    parser.add_argument('--db', help='base de datos a usar (por defecto config.DATABASE_NAME)')
+    parser.add_argument('--reiniciar', action='store_true', help='ignorar los checkpoints de los shards')
+    parser.add_argument('--rebuild-derived', action='store_true',
+                        help='recalcular palabras clave, resumen y entidades de toda la base de datos')
+    parser.add_argument('--solo-derivadas', action='store_true',
+                        help='no descargar; solo recalcular las columnas derivadas (o solo las estadísticas, '
+                             'el índice de similitud y/o los vecinos similares, con --rebuild-stats/'
+                             '--rebuild-index/--rebuild-similares)')
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help='recalcular las tablas de estadísticas materializadas')
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help='reconstruir y guardar el índice de similitud TF-IDF')
+    parser.add_argument('--rebuild-similares', action='store_true',
+                        help='recalcular la tabla de vecinos similares precalculados')
+    args = parser.parse_args()
+
+    # Configurar antes de importar app/fetcher, que crean el controlador de tasa al cargarse
+    if args.db:
+        config.DATABASE_NAME = args.db
+    if args.rate:
+        config.API_RATE_LIMIT = args.rate
+    if args.concurrency:
+        config.API_MAX_CONCURRENT_REQUESTS = args.concurrency
+
+    import app
+    from fetcher import fetch_num_pages, rate_controller
+
+    app.init_db()
+
+    if not args.solo_derivadas:
+        end_page = args.end_page
+        if end_page is None:
+            end_page = asyncio.run(fetch_num_pages(args.api_url))
+            if not end_page:
+                parser.error('no se pudo obtener el número de páginas de la API; indique --end-page')
+            print(f"La API reporta {end_page} páginas")
+        if end_page < args.start_page:
+            parser.error('--end-page debe ser mayor o igual que --start-page')
+
+        inicio = time.monotonic()
+        resultados = run_sharded_backfill(app, args.start_page, end_page, args.shards,
+                                          args.api_url, args.reiniciar)
+        print_summary(resultados, time.monotonic() - inicio, rate_controller)
+
+    if args.rebuild_derived or (args.solo_derivadas and not (args.rebuild_stats or args.rebuild_index
+                                                           or args.rebuild_similares)):
+        inicio = time.monotonic()
+        procesadas = app.rebuild_derived_columns(
+            on_progress=lambda n: print(f"  {n} sentencias recalculadas", end='\r', flush=True)
+        )
+        transcurrido = max(time.monotonic() - inicio, 1e-9)
+        print(f"\nColumnas derivadas recalculadas: {procesadas} sentencias en {transcurrido:.1f} s "
+              f"({procesadas / transcurrido:.1f} registros/s)")
+
+    if args.rebuild_stats:
+        inicio = time.monotonic()
+        app.rebuild_statistics()
+        print(f"Estadísticas recalculadas en {time.monotonic() - inicio:.1f} s")
+
+    if args.rebuild_index:
+        inicio = time.monotonic()
+        app.rebuild_similarity_index()
+        print(f"Índice de similitud reconstruido con {len(app.text_analyzer.sentencias_ids)} sentencias "
+              f"en {time.monotonic() - inicio:.1f} s")
+
+    if args.rebuild_similares:
+        inicio = time.monotonic()
+        procesadas = app.rebuild_similar_table(
+            on_progress=lambda n: print(f"  {n} sentencias procesadas", end='\r', flush=True)
+        )
+        print(f"\nVecinos similares recalculados para {procesadas} sentencias en {time.monotonic() - inicio:.1f} s")
+
+    app.enrichment_pool.shutdown()
+
+if __name__ == "__main__":
+    main()
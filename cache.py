@@ -0,0 +1,95 @@
+"""
+Caché en memoria con tamaño acotado, expulsión LRU y TTL.
+
+Cada entrada guarda la versión de datos (`database.data_version()`) con que se
+calculó; una entrada de una versión anterior ya no se entrega, así que basta
+con aumentar la versión al escribir para invalidar todo lo derivado. El TTL
+acota lo que puede durar una entrada si escribe otro proceso, cuyo contador
+de versión este no ve.
+"""
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+class VersionedCache:
+    """Caché LRU con TTL cuyas entradas se invalidan al cambiar la versión de datos."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self.invalidadas = 0
+
+    def get(self, clave, version):
+        """Valor vigente para `clave` en `version`, o None."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            version_guardada, instante, valor = entrada
+            if version_guardada != version or ahora - instante >= self.ttl:
+                # Se conserva para get_stale hasta que se reemplace o se expulse
+                self.invalidadas += 1
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def get_stale(self, clave):
+        """Último valor guardado para `clave` aunque esté vencido, o None."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            return entrada[2] if entrada else None
+
+    def set(self, clave, version, valor):
+        with self._lock:
+            self._entradas[clave] = (version, time.monotonic(), valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_size:
+                self._entradas.popitem(last=False)
+                self.expulsiones += 1
+
+    def clear(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def stats(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'entradas': len(self._entradas),
+                'tamano_maximo': self.max_size,
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'expulsiones': self.expulsiones,
+                'invalidadas': self.invalidadas,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else None,
+            }
+
+class CachedBody:
+    """
+    Cuerpo de una respuesta HTTP listo para reenviarse: su ETag (hash del
+    contenido) y su versión gzip se calculan una sola vez por entrada.
+    """
+
+    def __init__(self, datos, mimetype, headers=()):
+        self.datos = datos
+        self.mimetype = mimetype
+        self.headers = list(headers)
+        self.etag = hashlib.sha1(datos).hexdigest()[:20]
+        self._gzip = None
+
+    def gzip(self, nivel):
+        """Cuerpo comprimido con gzip (mtime fijo, para que sea reproducible)."""
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.datos, compresslevel=nivel, mtime=0)
+        return self._gzip
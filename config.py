@@ -3,6 +3,14 @@
 class Config:
     # Configuración de la base de datos
     DATABASE_NAME = "data.db"
+    DB_POOL_SIZE = 8  # conexiones abiertas reutilizables por base de datos
+    DB_JOURNAL_MODE = "WAL"  # los lectores no se bloquean detrás del escritor
+    DB_SYNCHRONOUS = "NORMAL"  # seguro con WAL; evita un fsync por transacción
+    DB_CACHE_SIZE_KB = 65536  # caché de páginas por conexión (64 MB)
+    DB_MMAP_SIZE = 268435456  # lectura mapeada en memoria (256 MB)
+    DB_BUSY_TIMEOUT = 30000  # milisegundos de espera ante una base bloqueada
+    DB_CACHED_STATEMENTS = 256  # sentencias preparadas en caché por conexión
+    TEXT_COMPRESSION_LEVEL = 6  # nivel zlib de los fundamentos guardados en sentencias_texto
     
     # Configuración de actualización automática
     UPDATE_INTERVAL = 3600  # segundos (1 hora) - Antes era 10 segundos
@@ -14,11 +22,53 @@ class Config:
     
     # Configuración de caché
     CACHE_TIMEOUT = 300  # segundos (5 minutos)
+    RESPONSE_CACHE_SIZE = 512  # respuestas GET en caché (listado, detalle, estadísticas)
+    RESPONSE_CACHE_MAX_BYTES = 2097152  # respuestas más grandes no se guardan
+    GZIP_MIN_SIZE = 1024  # bytes a partir de los cuales se comprime la respuesta
+    GZIP_LEVEL = 6  # nivel de compresión gzip de las respuestas
+    TOTAL_CACHE_SIZE = 1024  # conjuntos de filtros con total de resultados en caché
+    COUNT_ESTIMATE_LIMIT = 10000  # con conteo=estimado se cuenta solo hasta este número
+    
+    # Configuración del índice de similitud
+    SIMILARITY_INDEX_DIR = "indice_similitud"  # índice TF-IDF guardado (matriz mapeada en memoria)
+    SIMILARITY_REFIT_RATIO = 0.2  # fracción de sentencias vectorizadas sin reajustar el IDF que fuerza un reajuste completo
+    SIMILARITY_THRESHOLD = 0.3  # similitud coseno mínima de una sentencia similar
+    SIMILARITY_LIMIT = 5  # sentencias similares que retorna /api/sentencias/similares
+    SIMILARITY_NEIGHBORS = 20  # vecinos por sentencia guardados en la tabla similares
+    SIMILARITY_BLOCK_SIZE = 2000  # filas/columnas por bloque al calcular vecinos (memoria ~ bloque² floats)
+    SIMILARITY_BUILD_BATCH = 1000  # sentencias por lote al construir el índice
+    SIMILARITY_BUILD_WORKERS = 0  # procesos que vectorizan los lotes (0 = núm. de CPUs)
+    SIMILARITY_CHUNKED_MIN = 20000  # sentencias desde las que el índice se construye por lotes y en varios procesos
+    SIMILARITY_VOCAB_CANDIDATES = 50000  # n-gramas más frecuentes que se acumulan para elegir el vocabulario
+    SIMILARITY_TEXT_THRESHOLD = 0.05  # similitud mínima en /api/sentencias/similares/texto
+    SIMILARITY_TEXT_LIMIT = 10  # resultados por defecto de /api/sentencias/similares/texto
+    SIMILARITY_TEXT_MAX_LIMIT = 100  # máximo de `limite` en /api/sentencias/similares/texto
+    SIMILARITY_QUERY_MAX_CHARS = 20000  # caracteres del texto de consulta que se vectorizan
+    
+    # Configuración del registro de búsquedas
+    SEARCH_LOG_FLUSH_INTERVAL = 5  # segundos entre escrituras por lotes de las búsquedas
+    SEARCH_LOG_MAX_PENDING = 1000  # términos distintos en memoria que adelantan la escritura
+    SEARCH_TRENDING_HALF_LIFE = 86400  # segundos en que una búsqueda pierde la mitad de su peso en tendencias
     
     # Configuración de API externa
     API_URL = "https://jurisbackend.sedetc.gob.pe/api/visitor/sentencia/busqueda"
     API_TIMEOUT = 30  # segundos
-    API_DELAY = 1.0  # segundos entre solicitudes - Aumentado de 0.5 para ser más respetuoso
+    API_DELAY = 1.0  # pista inicial de segundos entre solicitudes; el controlador adaptativo la ajusta
+    API_MAX_CONCURRENT_REQUESTS = 4  # máximo de solicitudes simultáneas en vuelo
+    API_RATE_LIMIT = 2.0  # máximo de solicitudes por segundo (token bucket compartido)
+    API_MIN_RATE = 0.2  # mínimo de solicitudes por segundo tras reducciones
+    API_RATE_INCREASE = 0.2  # aumento aditivo (req/s por segundo de respuestas sanas)
+    API_RATE_DECREASE = 0.5  # factor multiplicativo ante 429/5xx/latencia alta
+    API_LATENCY_THRESHOLD = 2.0  # latencia sobre la base (en veces) que se considera degradación
+    API_MAX_RETRIES = 3  # reintentos ante 429/5xx/errores de red
+    API_RETRY_DELAY = 5  # segundos de espera inicial entre reintentos (se duplica)
+    API_RECORD_DIR = None  # directorio donde grabar las respuestas crudas (None = no grabar)
+    
+    # Configuración de ingesta
+    PIPELINE_BUFFER_PAGES = 2  # páginas descargadas en espera de ser guardadas
+    UPSERT_BATCH_SIZE = 1000  # registros por transacción en save_to_db
+    ENRICHMENT_WORKERS = 0  # procesos para palabras clave/resumen/entidades (0 = núm. de CPUs)
+    ENRICHMENT_MIN_BATCH = 64  # lotes más pequeños se enriquecen en serie
     
     # Headers para las solicitudes
     API_HEADERS = {
@@ -56,6 +106,7 @@ class Config:
     # Límites de análisis de texto
     MIN_WORD_LENGTH = 4  # longitud mínima de palabras para análisis
     MAX_KEYWORDS = 10  # máximo de palabras clave a extraer
+    MAX_FACETS = 20  # palabras clave con su conteo que retorna /api/sentencias/facetas
     SUMMARY_LENGTH = 200  # caracteres máximos del resumen
     
     # Configuración de notificaciones
@@ -69,6 +120,7 @@ class ProductionConfig(Config):
     DEBUG = False
     UPDATE_INTERVAL = 7200  # 2 horas en producción
     API_DELAY = 1.5  # Más conservador en producción
+    API_RATE_LIMIT = 1.0
     
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,179 @@
+"""
+Capa de conexiones SQLite compartida por la aplicación.
+
+Mantiene un pequeño pool de conexiones abiertas por base de datos, cada una
+configurada una sola vez con WAL y los PRAGMAs de rendimiento de `config`.
+Reutilizar conexiones conserva caliente la caché de páginas y la caché de
+sentencias preparadas de cada conexión; WAL permite que los lectores no se
+bloqueen mientras la ingesta escribe.
+
+Uso:
+    with connection() as conn:
+        conn.execute(...)
+
+    with connection(row_factory=sqlite3.Row) as conn:
+        row = conn.execute(...).fetchone()
+"""
+import queue
+import sqlite3
+import threading
+import logging
+import unicodedata
+import zlib
+from contextlib import contextmanager
+from config import config
+
+logger = logging.getLogger(__name__)
+
+def compress_text(texto):
+    """Comprime un texto largo (p. ej. fundamentos) para guardarlo como BLOB."""
+    if texto is None:
+        return None
+    return zlib.compress(texto.encode('utf-8'), config.TEXT_COMPRESSION_LEVEL)
+
+def decompress_text(blob):
+    """Inverso de `compress_text`; disponible en SQL como `descomprimir(blob)`."""
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        return blob
+    return zlib.decompress(blob).decode('utf-8')
+
+def strip_accents(texto):
+    """
+    Quita tildes, diéresis y virgulillas ('Pérez' -> 'Perez', 'Núñez' -> 'Nunez')
+    para comparar sin acentos; disponible en SQL como `sin_acentos(texto)`.
+    """
+    if not isinstance(texto, str) or texto.isascii():
+        return texto
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if not unicodedata.combining(c))
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite a un archivo de base de datos."""
+
+    def __init__(self, db_name, size=None):
+        self.db_name = db_name
+        self.size = size or config.DB_POOL_SIZE
+        self._idle = queue.LifoQueue(maxsize=self.size)
+        self._creadas = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=config.DB_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            cached_statements=config.DB_CACHED_STATEMENTS,
+        )
+        conn.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {config.DB_SYNCHRONOUS}")
+        # Valor negativo = tamaño en KiB en lugar de número de páginas
+        conn.execute(f"PRAGMA cache_size = -{int(config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+        conn.execute(f"PRAGMA busy_timeout = {int(config.DB_BUSY_TIMEOUT)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.create_function('descomprimir', 1, decompress_text, deterministic=True)
+        conn.create_function('sin_acentos', 1, strip_accents, deterministic=True)
+        with self._lock:
+            self._creadas += 1
+        return conn
+
+    def acquire(self):
+        """Toma una conexión libre o abre una nueva si no hay ninguna."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        """Devuelve la conexión al pool; si está lleno, la cierra."""
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        """Cierra las conexiones libres del pool."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {'db': self.db_name, 'libres': self._idle.qsize(), 'tamano': self.size,
+                'creadas': self._creadas}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_local = threading.local()
+_data_version = 0
+_data_version_lock = threading.Lock()
+
+def data_version():
+    """Contador que aumenta cada vez que este proceso modifica las sentencias."""
+    return _data_version
+
+def bump_data_version():
+    """Marca que las sentencias cambiaron, invalidando lo derivado de ellas."""
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+
+def get_pool(db_name=None):
+    """Obtiene (o crea) el pool de la base de datos indicada."""
+    db_name = db_name or config.DATABASE_NAME
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(db_name, ConnectionPool(db_name))
+    return pool
+
+@contextmanager
+def connection(db_name=None, row_factory=None):
+    """
+    Entrega una conexión del pool dentro de una transacción.
+
+    Al salir sin errores se confirma la transacción y ante una excepción se
+    revierte. Los bloques anidados en el mismo hilo reutilizan la conexión del
+    bloque externo y comparten su transacción, que solo el bloque externo
+    confirma.
+
+    :param row_factory: Opcional. `row_factory` a usar dentro del bloque (p. ej.
+                        `sqlite3.Row`); los cursores creados lo conservan.
+    """
+    pool = get_pool(db_name)
+    activas = getattr(_local, 'activas', None)
+    if activas is None:
+        activas = _local.activas = {}
+
+    anidada = pool.db_name in activas
+    conn = activas[pool.db_name] if anidada else pool.acquire()
+    anterior = conn.row_factory
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    if not anidada:
+        activas[pool.db_name] = conn
+
+    try:
+        yield conn
+        if not anidada and conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if not anidada and conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.row_factory = anterior
+        if not anidada:
+            del activas[pool.db_name]
+            pool.release(conn)
+
+def close_all():
+    """Cierra las conexiones libres de todos los pools."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
@@ -0,0 +1,153 @@
+"""
+Servidor local que imita la API de SEDETC para pruebas de carga de la ingesta.
+
+Sirve páginas grabadas con `PageRecorder` (modo replay) o generadas de forma
+sintética, con la misma forma `data`/`_source`/`pagination` que la API real,
+latencia configurable e inyección de respuestas 429.
+
+Uso:
+    python fake_api.py --record grabaciones/ --num-pages 50   # grabar la API real
+    python fake_api.py --port 8081 --num-pages 500 --latency 0.2 --error-rate 0.05
+    python fake_api.py --port 8081 --replay-dir grabaciones/
+"""
+import argparse
+import asyncio
+import os
+import random
+from datetime import date, timedelta
+from aiohttp import web
+from fetcher import PageFetcher, PAGE_OK, recorded_page_path
+
+# Vocabulario para generar fundamentos con apariencia de texto legal
+VOCABULARIO = (
+    'tribunal constitucional demanda amparo derecho fundamental debido proceso '
+    'tutela jurisdiccional efectiva recurso agravio constitucional resolución '
+    'sentencia fundamento jurídico libertad personal habeas corpus principio '
+    'igualdad pensión trabajador despido arbitrario reposición municipalidad '
+    'ministerio público plazo razonable motivación resoluciones judiciales '
+    'propiedad contrato administrativo seguridad social salud educación'
+).split()
+
+NOMBRES = ('Juan', 'María', 'Carlos', 'Rosa', 'Luis', 'Ana', 'Jorge', 'Carmen', 'Pedro', 'Elena')
+APELLIDOS = ('Pérez', 'Quispe', 'García', 'Mamani', 'Rodríguez', 'Flores', 'Huamán', 'Torres')
+DEMANDADOS = ('Municipalidad Distrital de Lima', 'ONP', 'Poder Judicial', 'SUNAT',
+              'Ministerio de Educación', 'EsSalud', 'Empresa de Transportes S.A.C.')
+
+def generate_page(page, page_size=10, num_pages=500, fundamentos=8, seed=0):
+    """Genera una página sintética determinista con la forma de la API real."""
+    rng = random.Random(seed * 1_000_003 + page)
+    fecha_base = date(2024, 12, 31)
+    data = []
+    for i in range(page_size):
+        numero = (page - 1) * page_size + i + 1
+        fecha = fecha_base - timedelta(days=numero // 5)
+        data.append({
+            '_source': {
+                'id': numero,
+                'numero_sentencia': f"{numero:05d}-{fecha.year}-AA/TC",
+                'fecha_publicacion': fecha.isoformat(),
+                'nombre_demandante': f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}",
+                'nombre_demandado': rng.choice(DEMANDADOS),
+                'numero_expediente': f"{rng.randint(1, 9999):05d}-{fecha.year - rng.randint(1, 4)}-PA/TC",
+                'fundamentos': [
+                    ' '.join(rng.choice(VOCABULARIO) for _ in range(rng.randint(60, 180))).capitalize() + '.'
+                    for _ in range(fundamentos)
+                ],
+                'url_archivo': f"https://tc.gob.pe/jurisprudencia/{fecha.year}/{numero:05d}.pdf",
+            }
+        })
+    return {
+        'error': False,
+        'data': data,
+        'pagination': {'page': page, 'num_pages': num_pages, 'page_size': page_size},
+    }
+
+def create_app(replay_dir=None, num_pages=500, page_size=10, latency=0.0,
+               error_rate=0.0, seed=0):
+    """
+    Crea la aplicación aiohttp del servidor simulado.
+
+    :param replay_dir: Opcional. Directorio con páginas grabadas; si una página no
+                       existe ahí se responde como fuera de rango.
+    :param latency: Latencia media por respuesta en segundos (±50% aleatorio).
+    :param error_rate: Probabilidad de responder 429 en una solicitud.
+    """
+    rng = random.Random(seed)
+    stats = {'solicitudes': 0, 'errores_429': 0}
+
+    async def busqueda(request):
+        stats['solicitudes'] += 1
+        try:
+            page = int(request.query.get('page', 1))
+        except ValueError:
+            return web.json_response({'error': True, 'message': 'Página inválida'}, status=400)
+
+        if latency:
+            await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+
+        if error_rate and rng.random() < error_rate:
+            stats['errores_429'] += 1
+            return web.json_response({'error': True, 'message': 'Too Many Requests'}, status=429)
+
+        if replay_dir:
+            path = recorded_page_path(replay_dir, page)
+            if not os.path.exists(path):
+                return web.json_response({'error': True, 'message': 'Página fuera de rango', 'data': []})
+            with open(path, encoding='utf-8') as f:
+                return web.Response(text=f.read(), content_type='application/json')
+
+        if page < 1 or page > num_pages:
+            return web.json_response({'error': True, 'message': 'Página fuera de rango', 'data': []})
+        return web.json_response(generate_page(page, page_size, num_pages, seed=seed))
+
+    async def estadisticas(request):
+        return web.json_response(stats)
+
+    app = web.Application()
+    app.router.add_get('/api/visitor/sentencia/busqueda', busqueda)
+    app.router.add_get('/_stats', estadisticas)
+    return app
+
+def record_pages(record_dir, num_pages, api_url=None):
+    """Descarga y graba en disco las primeras `num_pages` páginas de la API."""
+    async def run():
+        grabadas = 0
+        pages = PageFetcher(api_url, record_dir=record_dir).pages(1, num_pages)
+        try:
+            async for _, status, _ in pages:
+                if status == PAGE_OK:
+                    grabadas += 1
+        finally:
+            await pages.aclose()
+        return grabadas
+    return asyncio.run(run())
+
+def main():
+    parser = argparse.ArgumentParser(description='Servidor local que simula la API de SEDETC')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--replay-dir', help='directorio con páginas grabadas por PageRecorder')
+    parser.add_argument('--num-pages', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='latencia media en segundos')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probabilidad de responder 429')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', metavar='DIR', help='grabar --num-pages páginas de la API real en DIR y salir')
+    parser.add_argument('--api-url', help='URL a grabar (por defecto config.API_URL)')
+    args = parser.parse_args()
+
+    if args.record:
+        grabadas = record_pages(args.record, args.num_pages, args.api_url)
+        print(f"Se grabaron {grabadas} páginas en {args.record}")
+        return
+
+    if args.replay_dir:
+        grabadas = len([f for f in os.listdir(args.replay_dir) if f.endswith('.json')])
+        print(f"Reproduciendo {grabadas} páginas grabadas desde {args.replay_dir}")
+
+    app = create_app(args.replay_dir, args.num_pages, args.page_size,
+                     args.latency, args.error_rate, args.seed)
+    web.run_app(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+import logging
+from datetime import date, datetime
+import aiofiles
+import aiohttp
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Estados posibles del resultado de una página
+PAGE_OK = 'ok'
+PAGE_SKIPPED = 'skipped'
+PAGE_ERROR = 'error'
+
+class TokenBucket:
+    """
+    Limitador de tasa compartido entre todas las solicitudes en vuelo.
+
+    Es seguro entre hilos, de modo que varias descargas concurrentes (cada una
+    con su propio event loop) respetan un único límite global.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def set_rate(self, rate):
+        """Cambia la tasa conservando los tokens acumulados hasta ahora."""
+        with self._lock:
+            self._refill()
+            self.rate = float(rate)
+            self.capacity = max(1.0, self.rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def try_acquire(self):
+        """Consume un token si hay uno disponible; si no, retorna los segundos a esperar."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        """Espera hasta que haya un token disponible y lo consume."""
+        while True:
+            espera = self.try_acquire()
+            if not espera:
+                return
+            await asyncio.sleep(espera)
+
+class AdaptiveRateController:
+    """
+    Controlador AIMD de tasa y concurrencia frente a la API.
+
+    Con respuestas rápidas y correctas aumenta la tasa y la concurrencia de
+    forma aditiva (~`API_RATE_INCREASE` solicitudes/seg por segundo); ante un
+    429, un 5xx, un error de red o una latencia que supera
+    `API_LATENCY_THRESHOLD` veces la latencia base, las reduce de forma
+    multiplicativa. Es seguro entre hilos y se comparte entre ejecuciones para
+    que la tasa aprendida no se pierda de una actualización a otra.
+    """
+
+    def __init__(self, initial_rate=None, min_rate=None, max_rate=None, max_concurrency=None):
+        self.min_rate = min_rate or config.API_MIN_RATE
+        self.max_rate = max_rate or config.API_RATE_LIMIT
+        self.max_concurrency = max_concurrency or config.API_MAX_CONCURRENT_REQUESTS
+        # API_DELAY es solo la pista inicial: un segundo entre solicitudes = 1 req/s
+        rate = initial_rate or (1.0 / config.API_DELAY if config.API_DELAY else self.max_rate)
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.concurrency = 1.0
+        self.in_flight = 0
+        self.successes = 0
+        self.throttle_events = 0
+        self.server_errors = 0
+        self.network_errors = 0
+        self.latency_events = 0
+        self.latency_ewma = None
+        self.latency_base = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.bucket = TokenBucket(self.rate)
+
+    def try_acquire(self):
+        """Reserva un lugar para una solicitud si no se supera la concurrencia actual."""
+        with self._lock:
+            if self.in_flight < int(self.concurrency):
+                self.in_flight += 1
+                return True
+            return False
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def _decrease(self, now):
+        """Reducción multiplicativa, como máximo una vez por ventana de latencia."""
+        cooldown = max(1.0, self.latency_ewma or 0.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * config.API_RATE_DECREASE)
+        self.concurrency = max(1.0, self.concurrency * config.API_RATE_DECREASE)
+        self.bucket.set_rate(self.rate)
+        logger.warning(f"Reduciendo tasa de solicitudes a {self.rate:.2f}/s y concurrencia a {int(self.concurrency)}")
+
+    def on_success(self, latency):
+        """Registra una respuesta correcta y su latencia en segundos."""
+        with self._lock:
+            self.successes += 1
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+                self.latency_base = latency
+            else:
+                self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+                # La base sigue al mínimo pero se adapta lentamente hacia arriba
+                if self.latency_ewma < self.latency_base:
+                    self.latency_base = self.latency_ewma
+                else:
+                    self.latency_base += (self.latency_ewma - self.latency_base) * 0.01
+
+            if self.latency_ewma > self.latency_base * config.API_LATENCY_THRESHOLD:
+                self.latency_events += 1
+                self._decrease(time.monotonic())
+                return
+
+            # Incremento aditivo: ~API_RATE_INCREASE req/s por cada segundo de respuestas sanas
+            self.rate = min(self.max_rate, self.rate + config.API_RATE_INCREASE / max(self.rate, 1.0))
+            self.bucket.set_rate(self.rate)
+            self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency)
+
+    def on_throttle(self, motivo):
+        """Registra un 429, un 5xx o un error de red."""
+        with self._lock:
+            if motivo == '429':
+                self.throttle_events += 1
+            elif motivo == '5xx':
+                self.server_errors += 1
+            else:
+                self.network_errors += 1
+            self._decrease(time.monotonic())
+
+    def snapshot(self):
+        """Estado actual para monitoreo."""
+        with self._lock:
+            return {
+                'rate': round(self.rate, 3),
+                'concurrency': int(self.concurrency),
+                'in_flight': self.in_flight,
+                'successes': self.successes,
+                'throttle_events': self.throttle_events,
+                'server_errors': self.server_errors,
+                'network_errors': self.network_errors,
+                'latency_events': self.latency_events,
+                'latency_ewma': round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+                'latency_base': round(self.latency_base, 4) if self.latency_base is not None else None,
+            }
+
+# Controlador compartido por todas las descargas del proceso
+rate_controller = AdaptiveRateController()
+
+def recorded_page_path(record_dir, page):
+    """Ruta del archivo donde se guarda la respuesta cruda de una página."""
+    return os.path.join(record_dir, f"page_{page:06d}.json")
+
+class PageRecorder:
+    """Guarda en disco las respuestas crudas de la API para reproducirlas después."""
+
+    def __init__(self, record_dir):
+        self.record_dir = record_dir
+        os.makedirs(record_dir, exist_ok=True)
+
+    async def save(self, page, body):
+        """Escribe el cuerpo de la respuesta de una página."""
+        path = recorded_page_path(self.record_dir, page)
+        async with aiofiles.open(path + '.tmp', 'w', encoding='utf-8') as f:
+            await f.write(body)
+        os.replace(path + '.tmp', path)
+
+class PageFetcher:
+    """
+    Descarga páginas de la API de forma concurrente.
+
+    `concurrency` limita las páginas programadas a la vez; el número real de
+    solicitudes en vuelo y su tasa los decide el controlador adaptativo.
+    """
+
+    def __init__(self, api_url=None, concurrency=None, controller=None, record_dir=None):
+        self.api_url = api_url or config.API_URL
+        self.concurrency = max(1, concurrency or config.API_MAX_CONCURRENT_REQUESTS)
+        self.controller = controller or rate_controller
+        record_dir = record_dir or config.API_RECORD_DIR
+        self.recorder = PageRecorder(record_dir) if record_dir else None
+
+    async def _acquire_slot(self):
+        """Espera hasta que el controlador permita otra solicitud en vuelo."""
+        while not self.controller.try_acquire():
+            await asyncio.sleep(0.05)
+
+    async def _fetch_page(self, session, page):
+        """Obtiene una página con reintentos y espera exponencial ante 429/5xx."""
+        retries = config.API_MAX_RETRIES
+        delay = config.API_RETRY_DELAY
+        for i in range(retries):
+            await self.controller.bucket.acquire()
+            await self._acquire_slot()
+            inicio = time.monotonic()
+            try:
+                logger.info(f"Obteniendo página {page} (Intento {i+1}/{retries})")
+                async with session.get(self.api_url, params={'page': page}) as response:
+                    # Si el servidor nos pide que esperemos (Error 429)
+                    if response.status == 429:
+                        self.controller.on_throttle('429')
+                        logger.warning(f"Error 429: Límite de solicitudes alcanzado. Esperando {delay} segundos para reintentar.")
+                    # Si el servidor tiene otros problemas temporales
+                    elif response.status >= 500:
+                        self.controller.on_throttle('5xx')
+                        logger.warning(f"Error del servidor ({response.status}). Esperando {delay} segundos para reintentar.")
+                    elif response.status != 200:
+                        text = await response.text()
+                        logger.error(f"Error HTTP {response.status} no manejado al obtener la página {page}. Contenido: {text}")
+                        return PAGE_ERROR, None
+                    else:
+                        body = await response.text()
+                        self.controller.on_success(time.monotonic() - inicio)
+                        payload = json.loads(body)
+                        if self.recorder:
+                            await self.recorder.save(page, body)
+                        return PAGE_OK, payload
+
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.controller.on_throttle('red')
+                logger.error(f"Error de red al obtener página {page}: {e}. Reintentando en {delay} segundos...")
+            except ValueError as e:
+                logger.error(f"Respuesta inválida en página {page}: {e}")
+                return PAGE_ERROR, None
+            finally:
+                self.controller.release()
+
+            await asyncio.sleep(delay)
+            delay *= 2
+
+        logger.error(f"No se pudo obtener la página {page} después de {retries} intentos. Saltando a la siguiente página.")
+        return PAGE_SKIPPED, None
+
+    async def pages(self, start_page=1, max_pages=None, slow_start=False):
+        """
+        Genera tuplas (página, estado, payload) en orden de página.
+
+        Mantiene hasta `concurrency` solicitudes en vuelo; el consumidor puede
+        detenerse en cualquier momento y las solicitudes pendientes se cancelan
+        al cerrar el generador. Con `slow_start` la ventana empieza en una sola
+        página y se duplica con cada página consumida, para que un consumidor
+        que suele detenerse pronto no dispare solicitudes innecesarias.
+        """
+        window = 1 if slow_start else self.concurrency
+        last_page = start_page + max_pages - 1 if max_pages is not None else None
+        num_pages = None
+        pending = {}
+
+        timeout = aiohttp.ClientTimeout(total=config.API_TIMEOUT)
+        async with aiohttp.ClientSession(headers=config.API_HEADERS, timeout=timeout) as session:
+            next_page = start_page
+            current = start_page
+            try:
+                while True:
+                    # Llenar la ventana de solicitudes en vuelo
+                    while (len(pending) < window
+                           and (last_page is None or next_page <= last_page)
+                           and (num_pages is None or next_page <= num_pages)):
+                        pending[next_page] = asyncio.create_task(self._fetch_page(session, next_page))
+                        next_page += 1
+
+                    if current not in pending:
+                        break
+
+                    status, payload = await pending.pop(current)
+                    if status == PAGE_OK and isinstance(payload, dict):
+                        num_pages = payload.get('pagination', {}).get('num_pages', num_pages)
+                    yield current, status, payload
+                    current += 1
+                    window = min(self.concurrency, window * 2)
+            finally:
+                for task in pending.values():
+                    task.cancel()
+                await asyncio.gather(*pending.values(), return_exceptions=True)
+
+def parse_stop_date(stop_date_str):
+    """Convierte la fecha de corte 'YYYY-MM-DD' en date, o None si es inválida."""
+    if not stop_date_str:
+        return None
+    try:
+        return datetime.strptime(stop_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        logger.error(f"Formato de fecha inválido para stop_date_str: {stop_date_str}. Debe ser YYYY-MM-DD.")
+        return None
+
+def date_key(fecha):
+    """
+    Convierte una fecha 'YYYY-MM-DD' en el entero YYYYMMDD con que se indexa
+    (`sentencias.fecha_dia`); None si falta o no es una fecha ('N/A').
+    """
+    if not isinstance(fecha, str) or len(fecha) != 10:
+        return None
+    try:
+        dia = date.fromisoformat(fecha)
+    except ValueError:
+        return None
+    return dia.year * 10000 + dia.month * 100 + dia.day
+
+def parse_item(source):
+    """Normaliza un registro `_source` de la API."""
+    fecha = source.get('fecha_publicacion', 'N/A')
+    return {
+        'id': source.get('id'),
+        'numero_sentencia': source.get('numero_sentencia', 'N/A'),
+        'fecha_publicacion': fecha,
+        'fecha_dia': date_key(fecha),
+        'nombre_demandante': source.get('nombre_demandante', 'N/A'),
+        'nombre_demandado': source.get('nombre_demandado', 'N/A'),
+        'numero_expediente': source.get('numero_expediente', 'N/A'),
+        'fundamentos': source.get('fundamentos', []),
+        'url_archivo': source.get('url_archivo', 'N/A'),
+    }
+
+def extract_page_items(data, stop_date=None):
+    """
+    Extrae los registros de una página respetando la fecha de corte.
+
+    :return: tupla (items, detener) donde `detener` indica que se alcanzó
+             un registro más antiguo que `stop_date`.
+    """
+    items = []
+    limite = date_key(stop_date.isoformat()) if stop_date else None
+    for item in data['data']:
+        registro = parse_item(item.get('_source', {}))
+        if limite and registro['fecha_dia'] and registro['fecha_dia'] < limite:
+            logger.info(f"Se alcanzó un registro ({registro['fecha_publicacion']}) más antiguo que la fecha de corte ({stop_date}). Deteniendo la descarga.")
+            return items, True
+        items.append(registro)
+    return items, False
+
+async def iter_page_items(api_url=None, start_page=1, max_pages=None, stop_date=None, slow_start=False,
+                          stop_on_skip=False):
+    """
+    Genera tuplas (página, items, ultima) en orden hasta agotar la API, el
+    límite de páginas o la fecha de corte; `ultima` indica que la API no tiene
+    más páginas después de esta.
+
+    Con `stop_on_skip` se detiene en la primera página que no se pudo obtener
+    en lugar de saltarla, para que quien guarda un checkpoint por página no lo
+    avance más allá de ella y la vuelva a pedir al reanudar.
+    """
+    fetcher = PageFetcher(api_url)
+    pages = fetcher.pages(start_page, max_pages, slow_start)
+    try:
+        async for page, status, data in pages:
+            if status == PAGE_SKIPPED:
+                if stop_on_skip:
+                    logger.warning(f"Página {page} no disponible; se detiene la descarga para reanudarla desde ella.")
+                    break
+                continue
+            if status == PAGE_ERROR:
+                break
+
+            if not isinstance(data, dict) or data.get('error') or not data.get('data'):
+                message = data.get('message', 'Sin mensaje') if isinstance(data, dict) else 'Sin mensaje'
+                logger.warning(f"Respuesta de API sin datos o con error en página {page}: {message}")
+                break
+
+            try:
+                items, stop_fetching = extract_page_items(data, stop_date)
+            except Exception as e:
+                logger.error(f"Error inesperado al procesar la página {page}: {e}")
+                break
+
+            pagination = data.get('pagination', {})
+            ultima = page >= pagination.get('num_pages', page)
+            yield page, items, ultima
+            if stop_fetching:
+                break
+
+            if ultima:
+                logger.info("Se obtuvieron todas las páginas disponibles de la API.")
+                break
+    finally:
+        await pages.aclose()
+
+async def fetch_all(api_url=None, start_page=1, max_pages=None, stop_date=None):
+    """Descarga y acumula todos los registros de las páginas solicitadas."""
+    all_data = []
+    pages = iter_page_items(api_url, start_page, max_pages, stop_date)
+    try:
+        async for _, items, _ in pages:
+            all_data.extend(items)
+    finally:
+        await pages.aclose()
+    return all_data
+
+async def fetch_num_pages(api_url=None):
+    """Consulta la primera página y retorna el número total de páginas de la API."""
+    pages = PageFetcher(api_url).pages(1, 1)
+    try:
+        async for _, status, data in pages:
+            if status == PAGE_OK and isinstance(data, dict):
+                return data.get('pagination', {}).get('num_pages')
+    finally:
+        await pages.aclose()
+    return None
+
+def iter_pages(api_url=None, start_page=1, max_pages=None, stop_date=None, buffer_pages=None,
+               slow_start=False, stop_on_skip=False):
+    """
+    Versión síncrona de `iter_page_items` para consumidores en hilos normales.
+
+    La descarga corre en un hilo con su propio event loop y entrega las páginas
+    a través de una cola acotada, de modo que la memoria queda limitada a unas
+    pocas páginas aunque el consumidor sea más lento que la red.
+    """
+    buffer = queue.Queue(maxsize=buffer_pages or config.PIPELINE_BUFFER_PAGES)
+    stop_event = threading.Event()
+    done = object()
+
+    async def put(entry):
+        # No bloquear el event loop mientras la cola está llena
+        while not stop_event.is_set():
+            try:
+                buffer.put_nowait(entry)
+                return
+            except queue.Full:
+                await asyncio.sleep(0.05)
+
+    async def produce():
+        pages = iter_page_items(api_url, start_page, max_pages, stop_date, slow_start, stop_on_skip)
+        window = 1
+        try:
+            async for entry in pages:
+                await put(entry)
+                # Durante el arranque lento esperar a que el consumidor procese
+                # la página antes de ampliar la ventana de solicitudes
+                if slow_start and window < config.API_MAX_CONCURRENT_REQUESTS:
+                    window *= 2
+                    while buffer.unfinished_tasks and not stop_event.is_set():
+                        await asyncio.sleep(0.05)
+                if stop_event.is_set():
+                    break
+        finally:
+            await pages.aclose()
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except Exception as e:
+            logger.error(f"Error en la descarga de páginas: {e}")
+            asyncio.run(put(e))
+        finally:
+            asyncio.run(put(done))
+
+    producer = threading.Thread(target=run, daemon=True)
+    producer.start()
+    try:
+        while True:
+            entry = buffer.get()
+            if entry is done:
+                break
+            if isinstance(entry, Exception):
+                raise entry
+            yield entry
+            buffer.task_done()
+    finally:
+        stop_event.set()
+        producer.join()
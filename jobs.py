@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+class UpdateJob:
+    """Trabajo de actualización en segundo plano con su progreso."""
+
+    def __init__(self, tipo, paginas_objetivo=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.tipo = tipo
+        self.estado = 'en_curso'
+        self.paginas_objetivo = paginas_objetivo
+        self.paginas = 0
+        self.nuevas = 0
+        self.actualizadas = 0
+        self.sin_cambios = 0
+        self.error = None
+        self.inicio = datetime.now()
+        self.fin = None
+        self.version = 0
+        self._inicio_monotonic = time.monotonic()
+
+    @property
+    def terminado(self):
+        return self.estado in ('completado', 'error')
+
+    def eta(self):
+        """Segundos restantes estimados según el ritmo actual (cota superior)."""
+        if self.terminado or not self.paginas or not self.paginas_objetivo:
+            return None
+        transcurrido = time.monotonic() - self._inicio_monotonic
+        restantes = max(0, self.paginas_objetivo - self.paginas)
+        return round(transcurrido / self.paginas * restantes, 1)
+
+    def snapshot(self):
+        return {
+            'job_id': self.id,
+            'tipo': self.tipo,
+            'estado': self.estado,
+            'paginas': self.paginas,
+            'paginas_objetivo': self.paginas_objetivo,
+            'nuevas': self.nuevas,
+            'actualizadas': self.actualizadas,
+            'sin_cambios': self.sin_cambios,
+            'eta_segundos': self.eta(),
+            'inicio': self.inicio.isoformat(),
+            'fin': self.fin.isoformat() if self.fin else None,
+            'error': self.error,
+        }
+
+class UpdateJobManager:
+    """
+    Ejecuta actualizaciones como trabajos deduplicados en segundo plano.
+
+    Solo corre una descarga a la vez: si ya hay un trabajo en curso, las nuevas
+    solicitudes se adjuntan a él en lugar de iniciar otra descarga.
+    """
+
+    def __init__(self, max_historial=20):
+        self.max_historial = max_historial
+        self._jobs = OrderedDict()
+        self._actual = None
+        self._cond = threading.Condition()
+
+    def start(self, target, tipo='manual', paginas_objetivo=None):
+        """
+        Inicia `target(progreso)` en un hilo o se adjunta al trabajo en curso.
+
+        `target` recibe un callback `progreso(resultado)` que debe llamar con el
+        dict acumulado de la ingesta tras cada página.
+
+        :return: tupla (job, creado).
+        """
+        with self._cond:
+            if self._actual is not None and not self._actual.terminado:
+                logger.info(f"Actualización {tipo} adjuntada al trabajo en curso {self._actual.id}")
+                return self._actual, False
+
+            job = UpdateJob(tipo, paginas_objetivo)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_historial:
+                self._jobs.popitem(last=False)
+            self._actual = job
+
+        hilo = threading.Thread(target=self._run, args=(job, target), daemon=True)
+        hilo.start()
+        logger.info(f"Trabajo de actualización {job.id} ({tipo}) iniciado")
+        return job, True
+
+    def _run(self, job, target):
+        def progreso(resultado):
+            with self._cond:
+                job.paginas = resultado['paginas']
+                job.nuevas = resultado['nuevas']
+                job.actualizadas = resultado['actualizadas']
+                job.sin_cambios = resultado.get('sin_cambios', 0)
+                job.version += 1
+                self._cond.notify_all()
+
+        try:
+            resultado = target(progreso)
+            with self._cond:
+                if resultado:
+                    job.paginas = resultado['paginas']
+                    job.nuevas = resultado['nuevas']
+                    job.actualizadas = resultado['actualizadas']
+                    job.sin_cambios = resultado.get('sin_cambios', 0)
+                job.estado = 'completado'
+        except Exception as e:
+            logger.error(f"Error en el trabajo de actualización {job.id}: {e}")
+            with self._cond:
+                job.estado = 'error'
+                job.error = str(e)
+        finally:
+            with self._cond:
+                job.fin = datetime.now()
+                job.version += 1
+                self._cond.notify_all()
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def current(self):
+        """Trabajo en curso o, si no hay, el último ejecutado."""
+        with self._cond:
+            return self._actual
+
+    def wait(self, job, version=None, timeout=None):
+        """
+        Espera a que el trabajo cambie respecto de `version` (o a que termine si
+        `version` es None). Retorna la versión actual.
+        """
+        with self._cond:
+            if version is None:
+                self._cond.wait_for(lambda: job.terminado, timeout)
+            else:
+                self._cond.wait_for(lambda: job.version != version or job.terminado, timeout)
+            return job.version
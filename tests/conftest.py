@@ -0,0 +1,61 @@
+"""
+Configuración común de las pruebas.
+
+`app` abre la base de datos y el archivo de log de `config` al importarse, así
+que se redirigen a un directorio temporal antes de cualquier importación.
+Cada prueba que usa `db` trabaja sobre su propia base de datos.
+"""
+import os
+import sys
+import tempfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import config
+
+_tmp = tempfile.mkdtemp(prefix='ia-juris-tests-')
+config.LOG_FILE = os.path.join(_tmp, 'pruebas.log')
+config.DATABASE_NAME = os.path.join(_tmp, 'importacion.db')
+config.API_RETRY_DELAY = 0
+config.API_RATE_LIMIT = 1000
+config.ENRICHMENT_WORKERS = 1
+config.SIMILARITY_BUILD_WORKERS = 1
+
+import app as app_module
+import fetcher
+import fake_api
+from database import close_all
+from utils import TextAnalyzer
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base de datos vacía e inicializada, con índice de similitud en memoria vacío."""
+    monkeypatch.setattr(config, 'DATABASE_NAME', str(tmp_path / 'data.db'))
+    monkeypatch.setattr(config, 'SIMILARITY_INDEX_DIR', str(tmp_path / 'indice'))
+    monkeypatch.setattr(app_module, 'text_analyzer', TextAnalyzer())
+    app_module.response_cache.clear()
+    app_module.total_cache.clear()
+    app_module.init_db()
+    yield config.DATABASE_NAME
+    close_all()
+
+@pytest.fixture
+def fake_pages(monkeypatch):
+    """
+    Sustituye la descarga HTTP por páginas sintéticas de `fake_api`.
+
+    Retorna un dict configurable: `num_pages`, `page_size` y `fallan`
+    (páginas que agotan sus reintentos y se reportan como saltadas).
+    """
+    opciones = {'num_pages': 10, 'page_size': 5, 'fallan': set(), 'pedidas': []}
+
+    async def fetch_page(self, session, page):
+        opciones['pedidas'].append(page)
+        if page in opciones['fallan']:
+            return fetcher.PAGE_SKIPPED, None
+        return fetcher.PAGE_OK, fake_api.generate_page(page, opciones['page_size'], opciones['num_pages'],
+                                                       fundamentos=2)
+
+    monkeypatch.setattr(fetcher.PageFetcher, '_fetch_page', fetch_page)
+    return opciones
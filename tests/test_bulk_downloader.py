@@ -0,0 +1,42 @@
+"""Pruebas de la descarga masiva por shards."""
+import app
+import bulk_downloader
+from database import connection
+
+def _shard(inicio, fin):
+    with connection() as conn:
+        return app.get_sync_state(conn.cursor(), bulk_downloader.shard_mode(inicio, fin))
+
+def test_plan_shards_cubre_el_rango():
+    assert bulk_downloader.plan_shards(1, 10, 3) == [(1, 4), (5, 7), (8, 10)]
+    assert bulk_downloader.plan_shards(1, 2, 5) == [(1, 1), (2, 2)]
+
+def test_shard_con_pagina_saltada_queda_pendiente(db, fake_pages):
+    fake_pages['fallan'] = {3}
+    resultado = bulk_downloader.run_shard(app, 1, 5)
+    
+    assert not resultado['completado']
+    estado = _shard(1, 5)
+    assert estado['ultima_pagina'] == 2
+    assert not estado['completado']
+
+def test_shard_se_reanuda_desde_la_pagina_saltada(db, fake_pages):
+    fake_pages['fallan'] = {3}
+    bulk_downloader.run_shard(app, 1, 5)
+    
+    fake_pages['fallan'] = set()
+    fake_pages['pedidas'].clear()
+    resultado = bulk_downloader.run_shard(app, 1, 5)
+    
+    assert resultado['completado']
+    assert fake_pages['pedidas'][0] == 3
+    assert _shard(1, 5)['completado']
+    with connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sentencias").fetchone()[0] == 25
+
+def test_backfill_por_shards(db, fake_pages):
+    resultados = bulk_downloader.run_sharded_backfill(app, 1, 10, 3)
+    
+    assert all(r['completado'] for r in resultados)
+    with connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sentencias").fetchone()[0] == 50
@@ -0,0 +1,98 @@
+"""Pruebas del listado de sentencias: búsqueda por campo, filtros y cursores."""
+import pytest
+import app
+from database import connection, strip_accents
+
+@pytest.fixture
+def listado(db, fake_pages):
+    fake_pages['num_pages'] = 30
+    app.ingest_pages(None, 1, 30)
+    return app.app.test_client()
+
+def _ids_partes(palabra):
+    """Sentencias cuyo demandante o demandado contiene `palabra`, sin acentos ni mayúsculas."""
+    palabra = strip_accents(palabra).lower()
+    with connection() as conn:
+        return {id_ for id_, demandante, demandado in conn.execute(
+            "SELECT id, nombre_demandante, nombre_demandado FROM sentencias")
+            if palabra in strip_accents(demandante).lower() or palabra in strip_accents(demandado).lower()}
+
+def _buscar(cliente, **params):
+    params.setdefault('per_page', 1000)
+    return cliente.get('/api/sentencias', query_string=params).get_json()
+
+def test_strip_accents():
+    assert strip_accents('Pérez Núñez Güemes') == 'Perez Nunez Guemes'
+    assert strip_accents(None) is None
+
+@pytest.mark.parametrize('termino', ['perez', 'Pérez', 'GARCIA', 'garcía', 'huaman'])
+def test_busqueda_por_partes_sin_acentos(listado, termino):
+    esperados = _ids_partes(termino)
+    assert esperados
+    resultado = _buscar(listado, search=termino, campo='partes')
+    assert {s['id'] for s in resultado['sentencias']} == esperados
+
+def test_busqueda_por_partes_sin_indice_de_trigramas(listado, monkeypatch):
+    monkeypatch.setattr(app, 'trigram_disponible', False)
+    resultado = _buscar(listado, search='perez', campo='partes')
+    assert {s['id'] for s in resultado['sentencias']} == _ids_partes('perez')
+
+def test_indice_de_trigramas_anterior_se_recrea(db):
+    # Esquema anterior: trigramas sobre las columnas con acentos
+    with connection() as conn:
+        conn.execute("DROP TABLE sentencias_trigram")
+        conn.execute("DROP VIEW sentencias_trigram_contenido")
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE sentencias_trigram USING fts5(
+                {', '.join(app.TRIGRAM_COLUMNS)}, content='sentencias', content_rowid='id', tokenize='trigram'
+            )
+        """)
+    app.init_db()
+    with connection() as conn:
+        sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'sentencias_trigram'").fetchone()[0]
+    assert 'sentencias_trigram_contenido' in sql
+
+def _recorrer(cliente, **params):
+    """Ids de todas las páginas del listado siguiendo `next_cursor` hasta el final."""
+    params.setdefault('per_page', 7)
+    vistos = []
+    while True:
+        respuesta = cliente.get('/api/sentencias', query_string=params)
+        assert respuesta.status_code == 200
+        pagina = respuesta.get_json()
+        vistos.extend(s['id'] for s in pagina['sentencias'])
+        if not pagina.get('next_cursor'):
+            return vistos
+        params['cursor'] = pagina['next_cursor']
+
+def test_cursor_recorre_todo_sin_repetir(listado):
+    vistos = _recorrer(listado, ordenar='fecha_publicacion DESC')
+    assert len(vistos) == len(set(vistos)) == 150
+
+def test_cursor_relevancia_sin_busqueda(listado):
+    # Sin consulta de texto completo la relevancia cae al orden por fecha
+    vistos = _recorrer(listado, ordenar='relevancia')
+    assert len(vistos) == len(set(vistos)) == 150
+
+def test_cursor_relevancia_busqueda_por_partes(listado):
+    esperados = _ids_partes('perez')
+    assert len(esperados) > 7
+    vistos = _recorrer(listado, ordenar='relevancia', search='perez', campo='partes')
+    assert len(vistos) == len(set(vistos))
+    assert set(vistos) == esperados
+
+def test_cursor_de_otro_orden_se_rechaza(listado):
+    pagina = _buscar(listado, per_page=7, ordenar='fecha_publicacion DESC')
+    respuesta = listado.get('/api/sentencias', query_string={
+        'ordenar': 'numero_sentencia ASC', 'cursor': pagina['next_cursor']})
+    assert respuesta.status_code == 400
+
+@pytest.mark.parametrize('limite, esperado', [('0', 1), ('-5', 1), ('3', 3), ('1000', 100)])
+def test_facetas_limite_acotado(listado, limite, esperado):
+    filtros = {'search': 'perez', 'campo': 'partes'}
+    total = len(listado.get('/api/sentencias/facetas', query_string={**filtros, 'limite': 100}).get_json()['palabras'])
+    facetas = listado.get('/api/sentencias/facetas', query_string={**filtros, 'limite': limite}).get_json()
+    assert len(facetas['palabras']) == min(esperado, total)
+
+def test_facetas_limite_invalido(listado):
+    assert listado.get('/api/sentencias/facetas?limite=muchos').status_code == 400
@@ -0,0 +1,53 @@
+"""Pruebas de la caché de respuestas: ETag, 304, gzip e invalidación."""
+import pytest
+import app
+from database import connection
+
+@pytest.fixture
+def cliente(db, fake_pages):
+    app.ingest_pages(None, 1, 4)
+    return app.app.test_client()
+
+def test_etag_y_304(cliente):
+    respuesta = cliente.get('/api/sentencias?per_page=5')
+    etag = respuesta.headers['ETag']
+    assert respuesta.status_code == 200
+    
+    condicional = cliente.get('/api/sentencias?per_page=5', headers={'If-None-Match': etag})
+    assert condicional.status_code == 304
+    assert condicional.data == b''
+
+def test_gzip_con_etag_propio(cliente):
+    plano = cliente.get('/api/sentencias')
+    comprimido = cliente.get('/api/sentencias', headers={'Accept-Encoding': 'gzip'})
+    assert comprimido.headers['Content-Encoding'] == 'gzip'
+    assert comprimido.headers['ETag'] != plano.headers['ETag']
+    assert 'Accept-Encoding' in comprimido.headers['Vary']
+
+def test_escritura_invalida_la_respuesta(cliente):
+    antes = cliente.get('/api/sentencias?per_page=100').get_json()['total']
+    app.ingest_pages(None, 5, 1)
+    despues = cliente.get('/api/sentencias?per_page=100').get_json()['total']
+    assert despues == antes + 5
+
+def test_exportacion_no_se_cachea(cliente):
+    primera = cliente.get('/api/exportar/csv')
+    # Escritura de otro proceso: no cambia la versión de datos de este
+    with connection() as conn:
+        conn.execute("UPDATE sentencias SET nombre_demandado = 'Entidad Exportada' WHERE id = 1")
+    segunda = cliente.get('/api/exportar/csv')
+    
+    assert b'Entidad Exportada' not in primera.data
+    assert b'Entidad Exportada' in segunda.data
+    assert primera.headers['ETag'] != segunda.headers['ETag']
+    assert not any(clave[0] == '/api/exportar/csv' for clave in app.response_cache._entradas)
+
+def test_exportacion_con_gzip_y_etag(cliente):
+    comprimida = cliente.get('/api/exportar/json', headers={'Accept-Encoding': 'gzip'})
+    assert comprimida.status_code == 200
+    assert comprimida.headers['Content-Encoding'] == 'gzip'
+    assert comprimida.headers['Content-Disposition'].startswith('attachment;filename=sentencias_')
+    
+    condicional = cliente.get('/api/exportar/json', headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': comprimida.headers['ETag']})
+    assert condicional.status_code == 304
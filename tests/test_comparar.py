@@ -0,0 +1,19 @@
+"""Pruebas de la comparación de sentencias."""
+import app
+from database import connection
+
+def _palabras(sentencia_id):
+    with connection() as conn:
+        return {p for (p,) in conn.execute(
+            "SELECT palabra FROM sentencia_palabras WHERE sentencia_id = ?", (sentencia_id,))}
+
+def test_palabras_clave_desde_el_indice(db, fake_pages):
+    app.ingest_pages(None, 1, 2)
+    respuesta = app.app.test_client().post('/api/comparar', json={'ids': [1, 2]})
+    comparacion = respuesta.get_json()
+    
+    palabras1, palabras2 = _palabras(1), _palabras(2)
+    assert set(comparacion['common_keywords']) == palabras1 & palabras2
+    assert set(comparacion['unique_keywords']['sentencia1']) == palabras1 - palabras2
+    assert set(comparacion['unique_keywords']['sentencia2']) == palabras2 - palabras1
+    assert all(p and p == p.strip() for p in comparacion['common_keywords'])
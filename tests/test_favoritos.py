@@ -0,0 +1,27 @@
+"""Pruebas de la API de favoritos."""
+import pytest
+import app
+from utils import FavoritesManager
+
+@pytest.fixture
+def cliente(db, fake_pages, monkeypatch):
+    monkeypatch.setattr(app, 'favorites_manager', FavoritesManager(db))
+    app.ingest_pages(None, 1, 2)
+    return app.app.test_client()
+
+def test_favoritos_usan_las_columnas_del_listado(cliente):
+    assert cliente.post('/api/favoritos', json={'sentencia_id': 3, 'notas': 'revisar'}).get_json()['success']
+    
+    favoritos = cliente.get('/api/favoritos').get_json()
+    assert [f['id'] for f in favoritos] == [3]
+    assert favoritos[0]['notas'] == 'revisar'
+    esperadas = {c.strip()[2:] for c in app.COLUMNAS_LISTADO.split(',')} | {'fecha_agregado', 'notas', 'etiquetas'}
+    assert set(favoritos[0]) == esperadas
+
+def test_favoritos_se_invalidan_al_cambiar(cliente):
+    cliente.post('/api/favoritos', json={'sentencia_id': 3})
+    assert len(cliente.get('/api/favoritos').get_json()) == 1
+    
+    cliente.delete('/api/favoritos?sentencia_id=3')
+    assert cliente.get('/api/favoritos').get_json() == []
+    assert not cliente.get('/api/favoritos/check/3').get_json()['is_favorite']
@@ -0,0 +1,65 @@
+"""Pruebas de `save_to_db`: UPSERT por id o número de sentencia y deduplicación por hash."""
+import app
+import fake_api
+from fetcher import parse_item
+from database import connection, decompress_text
+
+def _registros(pagina, **cambios):
+    registros = [parse_item(d['_source']) for d in fake_api.generate_page(pagina, 5, fundamentos=2)['data']]
+    for registro in registros:
+        registro.update(cambios)
+    return registros
+
+def _fila(id_):
+    with connection() as conn:
+        return conn.execute("SELECT id, numero_sentencia, nombre_demandado, fecha_scraping, hash_contenido "
+                            "FROM sentencias WHERE id = ?", (id_,)).fetchone()
+
+def _contar():
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM sentencias").fetchone()[0]
+
+def test_inserta_y_omite_sin_cambios(db):
+    assert app.save_to_db(_registros(1)) == 5
+    antes = _fila(1)
+    
+    assert app.save_to_db(_registros(1)) == 0
+    assert _fila(1) == antes
+    with connection() as conn:
+        ultima = conn.execute("SELECT sin_cambios_sentencias FROM estadisticas ORDER BY id DESC LIMIT 1").fetchone()
+    assert ultima[0] == 5
+
+def test_actualiza_si_cambia_el_contenido(db):
+    app.save_to_db(_registros(1))
+    hash_anterior = _fila(2)[4]
+    registros = _registros(1)
+    registros[1]['nombre_demandado'] = 'Otra Entidad'
+    registros[1]['fundamentos'] = ['Nuevo fundamento.']
+    
+    assert app.save_to_db(registros) == 0
+    fila = _fila(2)
+    assert fila[2] == 'Otra Entidad'
+    assert fila[4] != hash_anterior
+    with connection() as conn:
+        texto = conn.execute("SELECT fundamentos FROM sentencias_texto WHERE id = 2").fetchone()[0]
+    assert decompress_text(texto) == 'Nuevo fundamento.'
+
+def test_mismo_numero_con_otro_id_actualiza_la_fila(db):
+    app.save_to_db(_registros(1))
+    registro = _registros(1)[0]
+    registro['id'] = 999
+    registro['nombre_demandado'] = 'Reasignada'
+    
+    assert app.save_to_db([registro]) == 0
+    assert _contar() == 5
+    with connection() as conn:
+        fila = conn.execute("SELECT nombre_demandado FROM sentencias WHERE numero_sentencia = ?",
+                            (registro['numero_sentencia'],)).fetchone()
+    assert fila[0] == 'Reasignada'
+
+def test_duplicados_dentro_del_lote(db):
+    registros = _registros(1)
+    repetido = dict(registros[0], nombre_demandado='Última versión')
+    
+    assert app.save_to_db(registros + [repetido]) == 5
+    assert _fila(1)[2] == 'Última versión'
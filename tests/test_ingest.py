@@ -0,0 +1,87 @@
+"""Pruebas de la ingesta por páginas y de la reanudación desde checkpoints."""
+import app
+from database import connection
+
+def _ids():
+    with connection() as conn:
+        return {row[0] for row in conn.execute("SELECT id FROM sentencias")}
+
+def _estado(modo):
+    with connection() as conn:
+        return app.get_sync_state(conn.cursor(), modo)
+
+def test_backfill_se_detiene_en_pagina_saltada(db, fake_pages):
+    fake_pages['fallan'] = {4}
+    resultado = app.sync_sentencias('backfill')
+    
+    assert resultado['ultima_pagina'] == 3
+    assert not resultado['agotado']
+    assert _ids() == set(range(1, 16))
+    estado = _estado('backfill')
+    assert estado['ultima_pagina'] == 3
+    assert not estado['completado']
+
+def test_backfill_reanuda_desde_la_pagina_saltada(db, fake_pages):
+    fake_pages['fallan'] = {4}
+    app.sync_sentencias('backfill')
+    
+    fake_pages['fallan'] = set()
+    fake_pages['pedidas'].clear()
+    resultado = app.sync_sentencias('backfill')
+    
+    assert fake_pages['pedidas'][0] == 4
+    assert resultado['agotado']
+    assert _ids() == set(range(1, 51))
+    assert _estado('backfill')['completado']
+
+def test_backfill_completado_no_vuelve_a_descargar(db, fake_pages):
+    app.sync_sentencias('backfill')
+    fake_pages['pedidas'].clear()
+    
+    resultado = app.sync_sentencias('backfill')
+    
+    assert resultado['paginas'] == 0
+    assert fake_pages['pedidas'] == []
+
+def test_ingesta_sin_checkpoint_salta_paginas(db, fake_pages):
+    fake_pages['fallan'] = {4}
+    resultado = app.ingest_pages(None, 1, 10)
+    
+    assert resultado['agotado']
+    assert _ids() == set(range(1, 51)) - set(range(16, 21))
+
+def test_reingesta_sin_cambios(db, fake_pages):
+    app.ingest_pages(None, 1, 3)
+    resultado = app.ingest_pages(None, 1, 3)
+    
+    assert resultado['nuevas'] == 0
+    assert resultado['actualizadas'] == 0
+    assert resultado['sin_cambios'] == 15
+
+def test_paginas_se_enriquecen_en_grupos(db, fake_pages, monkeypatch):
+    monkeypatch.setattr(app.config, 'ENRICHMENT_MIN_BATCH', 12)
+    lotes = []
+    original = app.enrichment_pool.map
+    
+    def map_registrado(fundamentos_list):
+        lotes.append(len(fundamentos_list))
+        return original(fundamentos_list)
+    monkeypatch.setattr(app.enrichment_pool, 'map', map_registrado)
+    
+    resultado = app.sync_sentencias('backfill')
+    
+    # Grupos de 3 páginas de 5 registros; el último grupo termina en la última página
+    assert lotes == [15, 15, 15, 5]
+    assert resultado['paginas'] == 10
+    assert _estado('backfill')['ultima_pagina'] == 10
+    with app.connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sentencias WHERE palabras_clave IS NOT NULL").fetchone()[0] == 50
+
+def test_incremental_se_detiene_en_pagina_conocida(db, fake_pages):
+    app.ingest_pages(None, 1, 4)
+    fake_pages['pedidas'].clear()
+    
+    resultado = app.sync_sentencias('incremental')
+    
+    assert resultado['paginas'] == 1
+    assert resultado['sin_cambios'] == 5
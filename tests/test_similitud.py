@@ -0,0 +1,178 @@
+"""Pruebas del índice de similitud TF-IDF y de sus rutas."""
+import os
+import sqlite3
+import numpy as np
+import pytest
+import app
+from utils import TextAnalyzer, EnrichmentPool
+from database import connection
+
+@pytest.fixture
+def corpus(db, fake_pages, monkeypatch):
+    """200 sentencias sintéticas, con un vocabulario sin empates en el corte de `max_features`."""
+    monkeypatch.setattr(TextAnalyzer, 'INDEX_MAX_FEATURES', 10 ** 6)
+    fake_pages['num_pages'] = 50
+    app.ingest_pages(None, 1, 40)
+    return fake_pages
+
+def _sentencias(ids=None):
+    consulta = app.SIMILARITY_CORPUS_SQL
+    with connection(row_factory=sqlite3.Row) as conn:
+        if ids is not None:
+            consulta += f" WHERE s.id IN ({','.join('?' * len(ids))})"
+        return [dict(row) for row in conn.execute(consulta, list(ids or ()))]
+
+def _vectores_por_id(analizador):
+    return {int(i): analizador.vectors[fila].toarray().ravel()
+            for fila, i in enumerate(analizador.sentencias_ids)}
+
+def test_indice_por_lotes_igual_a_build_index(corpus):
+    completo = TextAnalyzer()
+    completo.build_index(_sentencias(), 1)
+    por_lotes = TextAnalyzer()
+    por_lotes.build_index_chunked(lambda: app._iter_similarity_corpus(7), 1)
+    
+    assert por_lotes.vectorizer.vocabulary_ == completo.vectorizer.vocabulary_
+    assert np.array_equal(por_lotes.sentencias_ids, completo.sentencias_ids)
+    assert np.allclose(por_lotes.vectorizer.idf_, completo.vectorizer.idf_)
+    assert abs(por_lotes.vectors - completo.vectors).max() < 1e-5
+
+def test_actualizacion_incremental(corpus):
+    assert app.update_similarity_index() == 'completo'
+    version = app.text_analyzer.version
+    
+    # Sentencias nuevas: la ingesta actualiza el índice de este proceso
+    app.ingest_pages(None, 41, 3)
+    estado = app.text_analyzer.state
+    assert estado.version > version
+    assert estado.agregadas == 15
+    with connection() as conn:
+        ids = {row[0] for row in conn.execute("SELECT id FROM sentencias")}
+    assert set(estado.sentencias_ids.tolist()) == ids
+    
+    # Cada fila es el texto de su sentencia vectorizado con el ajuste original
+    vectores = _vectores_por_id(app.text_analyzer)
+    for sentencia in _sentencias([201, 215]):
+        texto = app.text_analyzer._texts([sentencia])[0]
+        esperado = estado.vectorizer.transform(texto).toarray().ravel()
+        assert np.allclose(vectores[sentencia['id']], esperado, atol=1e-6)
+
+def test_eliminacion_incremental(corpus):
+    app.update_similarity_index()
+    with connection() as conn:
+        conn.execute("DELETE FROM sentencias WHERE id = 7")
+    
+    assert app.update_similarity_index() == 'incremental'
+    assert 7 not in app.text_analyzer.state.posiciones
+    assert all(s['id'] != 7 for s in app.text_analyzer.find_similar(8, 0.0, 50))
+
+def test_find_similar_igual_a_fuerza_bruta(corpus):
+    app.update_similarity_index()
+    analizador = app.text_analyzer
+    fila = analizador.state.posiciones[10]
+    scores = (analizador.vectors @ analizador.vectors[fila].T).toarray().ravel()
+    scores[fila] = -1
+    esperados = [int(analizador.sentencias_ids[i]) for i in np.argsort(-scores, kind='stable')[:5]]
+    
+    assert [s['id'] for s in analizador.find_similar(10, 0.0, 5)] == esperados
+
+def test_ruta_no_construye_el_indice_en_la_solicitud(corpus, monkeypatch):
+    monkeypatch.setattr(app.config, 'SIMILARITY_THRESHOLD', 0.0)
+    cliente = app.app.test_client()
+    respuesta = cliente.get('/api/sentencias/similares/10')
+    assert respuesta.status_code == 503
+    assert respuesta.headers['Retry-After']
+    
+    app._similarity_thread.join(timeout=60)
+    respuesta = cliente.get('/api/sentencias/similares/10')
+    assert respuesta.status_code == 200
+    assert [s['id'] for s in respuesta.get_json()] == [s['id'] for s in app.text_analyzer.find_similar(10, 0.0, 5)]
+    assert len(respuesta.get_json()) == 5
+
+def test_busqueda_por_texto(corpus):
+    app.update_similarity_index()
+    texto = _sentencias([12])[0]['fundamentos']
+    cliente = app.app.test_client()
+    
+    resultados = cliente.post('/api/sentencias/similares/texto', json={'texto': texto}).get_json()
+    assert resultados[0]['id'] == 12
+    
+    filtrados = cliente.post('/api/sentencias/similares/texto',
+                             json={'texto': texto, 'fecha_desde': '2024-12-30', 'limite': 50}).get_json()
+    with connection() as conn:
+        fechas = dict(conn.execute("SELECT id, fecha_dia FROM sentencias"))
+    assert filtrados and all(fechas[s['id']] >= 20241230 for s in filtrados)
+    
+    assert cliente.post('/api/sentencias/similares/texto', json={}).status_code == 400
+
+def test_imap_en_serie_con_pocos_elementos():
+    pool = EnrichmentPool(workers=4)
+    assert list(pool.imap(pow, [3], 2)) == [9]
+    assert pool._executor is None
+
+def test_reconstruccion_pequena_sin_procesos(corpus, monkeypatch):
+    def sin_procesos(*args, **kwargs):
+        raise AssertionError("no debe arrancar procesos para un corpus pequeño")
+    monkeypatch.setattr(EnrichmentPool, '_get_executor', sin_procesos)
+    monkeypatch.setattr(app.config, 'SIMILARITY_BUILD_WORKERS', 4)
+    
+    app.rebuild_similarity_index()
+    assert len(app.text_analyzer.sentencias_ids) == 200
+
+def test_guardar_conserva_solo_el_indice_vigente(corpus, tmp_path):
+    app.update_similarity_index()
+    directorio = str(tmp_path / 'otro')
+    
+    # Dos reconstrucciones de la misma versión y luego una más nueva
+    assert app.text_analyzer.save(directorio)
+    assert app.text_analyzer.save(directorio)
+    conjuntos = {nombre.split('.', 1)[0] for nombre in os.listdir(directorio) if nombre != TextAnalyzer.INDEX_MANIFEST}
+    assert len(conjuntos) == 1
+    
+    app.ingest_pages(None, 41, 1)
+    assert app.text_analyzer.save(directorio)
+    conjuntos = {nombre.split('.', 1)[0] for nombre in os.listdir(directorio) if nombre != TextAnalyzer.INDEX_MANIFEST}
+    assert conjuntos == {app.text_analyzer.read_manifest(directorio)['prefijo']}
+    
+    cargado = TextAnalyzer()
+    assert cargado.load(directorio)
+    assert cargado.version == app.text_analyzer.version
+    assert np.array_equal(cargado.sentencias_ids, app.text_analyzer.sentencias_ids)
+    assert np.array_equal(cargado.state.fechas, app.text_analyzer.state.fechas)
+    assert abs(cargado.vectors - app.text_analyzer.vectors).max() == 0
+
+def _cambios():
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM sentencias_cambios").fetchone()[0]
+
+def test_registro_de_cambios_sin_indice_no_crece(db, fake_pages):
+    app.ingest_pages(None, 1, 4)
+    with connection() as conn:
+        version = app.stored_data_version(conn.cursor())
+    
+    assert _cambios() == 0
+    assert version >= 20
+
+def test_registro_de_cambios_conserva_lo_pendiente(corpus):
+    app.update_similarity_index()
+    assert _cambios() == 0
+    
+    # Otro proceso escribe: este no tiene cómo actualizar su índice todavía
+    version = app.text_analyzer.version
+    with connection() as conn:
+        conn.execute("UPDATE sentencias SET palabras_clave = 'amparo' WHERE id IN (1, 2)")
+    app.prune_change_log()
+    assert _cambios() == 2
+    
+    assert app.update_similarity_index() == 'incremental'
+    assert app.text_analyzer.version > version
+    assert _cambios() == 0
+
+def test_registro_de_cambios_se_vacia_si_forzaria_reajuste(corpus):
+    app.update_similarity_index()
+    with connection() as conn:
+        conn.execute("UPDATE sentencias SET palabras_clave = 'amparo' WHERE id <= 100")
+    app.prune_change_log()
+    
+    assert _cambios() == 0
+    assert app.update_similarity_index() == 'completo'
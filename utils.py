@@ -1,11 +1,20 @@
+import os
 import re
+import json
+import uuid
+import time
 import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from collections import Counter
+from collections import Counter, deque, namedtuple
+from itertools import chain, islice
 import difflib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
 import numpy as np
+from scipy.sparse import csr_matrix, diags, vstack as sp_vstack
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
@@ -13,80 +22,508 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
 from config import config
+from database import connection, bump_data_version
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Estado completo de un índice de similitud. Se reemplaza entero en cada
+# cambio, así que quien lo lee una vez ve vectorizador, matriz e ids coherentes.
+# `fechas` es la fecha de publicación (YYYYMMDD, 0 si no hay) de cada fila y
+# `posiciones` el mapa id -> fila de `vectors`.
+IndexState = namedtuple('IndexState',
+                        'vectorizer vectors sentencias_ids fechas posiciones version ajustadas agregadas')
+
+def _index_state(vectorizer, vectors, sentencias_ids, fechas, version, ajustadas, agregadas):
+    sentencias_ids = np.asarray(sentencias_ids, dtype=np.int64)
+    posiciones = {int(i): fila for fila, i in enumerate(sentencias_ids)}
+    return IndexState(vectorizer, vectors, sentencias_ids, np.asarray(fechas, dtype=np.int64), posiciones,
+                      version, ajustadas, agregadas)
+
+def _index_counter(vocabulary=None):
+    """Contador de n-gramas con el mismo análisis de texto que el vectorizador del índice."""
+    return CountVectorizer(ngram_range=TextAnalyzer.INDEX_NGRAM_RANGE, stop_words=list(config.STOPWORDS),
+                           vocabulary=vocabulary, dtype=np.float32)
+
+def count_index_terms(texts, candidatos):
+    """
+    Frecuencia total de los n-gramas de un lote de textos (primera pasada de
+    `build_index_chunked`), limitada a los `candidatos` más frecuentes del lote.
+    """
+    contador = _index_counter()
+    try:
+        conteos = contador.fit_transform(texts)
+    except ValueError:
+        # Lote sin ningún término (p. ej. textos vacíos)
+        return {}
+    totales = np.asarray(conteos.sum(axis=0)).ravel()
+    terminos = contador.get_feature_names_out()
+    if len(totales) > candidatos:
+        elegidos = np.argpartition(-totales, candidatos - 1)[:candidatos]
+        terminos, totales = terminos[elegidos], totales[elegidos]
+    return dict(zip(terminos.tolist(), totales.tolist()))
+
+def count_index_matrix(texts, vocabulario):
+    """Conteos de los términos de `vocabulario` en un lote de textos (segunda pasada de `build_index_chunked`)."""
+    return _index_counter(vocabulario).transform(texts).tocsr()
+
 class TextAnalyzer:
     """Clase para análisis avanzado de texto legal."""
     
+    # Cambiar si cambia la forma en que se guarda el índice en disco
+    INDEX_FORMAT = 2
+    INDEX_MANIFEST = 'manifiesto.json'
+    INDEX_MAX_FEATURES = 1000
+    INDEX_NGRAM_RANGE = (1, 3)
+    
     def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
-            ngram_range=(1, 3),
-            stop_words=list(config.STOPWORDS)
+        # ajustadas: sentencias con que se ajustó el vocabulario/IDF;
+        # agregadas: vectorizadas después con ese mismo ajuste (ver update_index)
+        self.state = _index_state(self._new_vectorizer(), None, [], [], None, 0, 0)
+    
+    @property
+    def vectorizer(self):
+        return self.state.vectorizer
+    
+    @property
+    def vectors(self):
+        return self.state.vectors
+    
+    @property
+    def sentencias_ids(self):
+        return self.state.sentencias_ids
+    
+    @property
+    def version(self):
+        """Versión de los datos con que se construyó el índice (None = sin índice)."""
+        return self.state.version
+    
+    @property
+    def drift(self):
+        """Fracción de sentencias vectorizadas sin reajustar el IDF desde el último ajuste completo."""
+        return self.state.agregadas / max(self.state.ajustadas, 1)
+    
+    @staticmethod
+    def _new_vectorizer(vocabulary=None):
+        return TfidfVectorizer(
+            max_features=TextAnalyzer.INDEX_MAX_FEATURES,
+            ngram_range=TextAnalyzer.INDEX_NGRAM_RANGE,
+            stop_words=list(config.STOPWORDS),
+            vocabulary=vocabulary
         )
-        self.vectors = None
-        self.sentencias_ids = []
     
-    def build_index(self, sentencias):
-        """Construye índice de vectores TF-IDF para búsqueda de similitud."""
-        if not sentencias:
-            return
-            
+    @staticmethod
+    def _texts(sentencias):
+        """Texto combinado, ids y fechas (`fecha_dia`) de cada sentencia, en el mismo orden."""
         texts = []
-        self.sentencias_ids = []
+        ids = []
+        fechas = []
         
         for sentencia in sentencias:
             # Combinar todos los campos relevantes
             text = f"{sentencia.get('numero_sentencia', '')} {sentencia.get('fundamentos', '')} {sentencia.get('palabras_clave', '')}"
             texts.append(text)
-            self.sentencias_ids.append(sentencia['id'])
+            ids.append(sentencia['id'])
+            fechas.append(sentencia.get('fecha_dia') or 0)
+        return texts, ids, fechas
+    
+    def _parameters(self):
+        """Parámetros del vectorizador que un índice guardado debe compartir para reutilizarse."""
+        return {
+            'formato': self.INDEX_FORMAT,
+            'max_features': self.vectorizer.max_features,
+            'ngram_range': list(self.vectorizer.ngram_range),
+            'stop_words': sorted(config.STOPWORDS),
+        }
+    
+    def build_index(self, sentencias, version=None):
+        """
+        Construye índice de vectores TF-IDF para búsqueda de similitud.
+        
+        Las filas quedan normalizadas (L2) y en float32, así que el producto
+        punto de dos filas es su similitud coseno.
+        
+        :param version: Opcional. Versión de los datos de `sentencias`; se
+                        guarda con el índice para saber si quedó desactualizado.
+        """
+        if not sentencias:
+            self.state = _index_state(self._new_vectorizer(), None, [], [], version, 0, 0)
+            return
         
+        texts, ids, fechas = self._texts(sentencias)
         try:
-            self.vectors = self.vectorizer.fit_transform(texts)
-            logger.info(f"Índice construido con {len(texts)} sentencias")
+            vectorizer = self._new_vectorizer()
+            vectors = vectorizer.fit_transform(texts).astype(np.float32).tocsr()
         except Exception as e:
             logger.error(f"Error al construir índice: {e}")
+            return
+        
+        self.state = _index_state(vectorizer, vectors, ids, fechas, version, len(ids), 0)
+        logger.info(f"Índice construido con {len(texts)} sentencias")
+    
+    def build_index_chunked(self, read_batches, version=None, pool=None):
+        """
+        Construye el índice recorriendo el corpus por lotes, sin tener todos
+        los textos en memoria a la vez.
+        
+        `read_batches()` debe retornar en cada llamada un iterable nuevo de
+        lotes (listas de sentencias como las de `build_index`), porque el
+        corpus se recorre dos veces:
+        
+        1. Se cuentan los n-gramas de cada lote y se acumulan solo los
+           `SIMILARITY_VOCAB_CANDIDATES` más frecuentes; de ahí salen los
+           `INDEX_MAX_FEATURES` términos del vocabulario, como con `max_features`.
+        2. Se cuentan esos términos en cada lote y se acumula la frecuencia de
+           documentos. Al final se aplica el IDF, se normaliza cada lote y se
+           apilan las matrices parciales.
+        
+        La memoria queda acotada por el tamaño de lote más la matriz final, no
+        por el texto del corpus. Con el mismo vocabulario el resultado es el
+        de `build_index`.
+        
+        :param pool: Opcional. `EnrichmentPool` cuyos procesos cuentan los lotes.
+        """
+        if pool is not None:
+            imap = pool.imap
+        else:
+            def imap(func, items, *args):
+                return (func(item, *args) for item in items)
+        
+        def textos(ids=None, fechas=None):
+            for lote in read_batches():
+                texts, lote_ids, lote_fechas = self._texts(lote)
+                if ids is not None:
+                    ids.extend(lote_ids)
+                    fechas.extend(lote_fechas)
+                yield texts
+        
+        candidatos = config.SIMILARITY_VOCAB_CANDIDATES
+        frecuencias = Counter()
+        for parcial in imap(count_index_terms, textos(), candidatos):
+            frecuencias.update(parcial)
+            if len(frecuencias) > 2 * candidatos:
+                frecuencias = Counter(dict(frecuencias.most_common(candidatos)))
+        if not frecuencias:
+            self.state = _index_state(self._new_vectorizer(), None, [], [], version, 0, 0)
+            return
+        
+        # Índices de columna en orden alfabético, como los asigna scikit-learn
+        terminos = sorted(termino for termino, _ in frecuencias.most_common(self.INDEX_MAX_FEATURES))
+        vocabulario = {termino: i for i, termino in enumerate(terminos)}
+        del frecuencias
+        
+        ids = []
+        fechas = []
+        matrices = []
+        documentos = np.zeros(len(vocabulario), dtype=np.int64)
+        for conteos in imap(count_index_matrix, textos(ids, fechas), vocabulario):
+            documentos += np.bincount(conteos.indices, minlength=len(vocabulario))
+            matrices.append(conteos)
+        
+        # IDF suavizado, igual que TfidfTransformer(smooth_idf=True)
+        idf = np.log((1 + len(ids)) / (1 + documentos)) + 1
+        escala = diags(idf.astype(np.float32))
+        for i, conteos in enumerate(matrices):
+            matrices[i] = normalize(conteos @ escala, norm='l2', copy=False).astype(np.float32, copy=False)
+        vectors = sp_vstack(matrices, format='csr')
+        del matrices
+        
+        vectorizer = self._new_vectorizer(vocabulario)
+        vectorizer.idf_ = idf
+        self.state = _index_state(vectorizer, vectors, ids, fechas, version, len(ids), 0)
+        logger.info(f"Índice construido por lotes con {len(ids)} sentencias")
+    
+    def update_index(self, sentencias, eliminadas=(), version=None):
+        """
+        Actualiza el índice sin reajustar el vocabulario ni el IDF.
+        
+        Las `sentencias` (nuevas o modificadas) se vectorizan con el ajuste
+        actual y se agregan al final, reemplazando la fila anterior de las que
+        ya estaban; los ids de `eliminadas` salen del índice. El estado nuevo
+        se publica de una vez, así que las búsquedas en curso siguen usando el
+        anterior sin mezclarlos.
+        
+        :return: False si no hay un índice que actualizar.
+        """
+        estado = self.state
+        if estado.vectors is None:
+            return False
+        
+        texts, ids, fechas = self._texts(sentencias)
+        quitar = set(ids) | set(eliminadas)
+        conservar = np.ones(len(estado.sentencias_ids), dtype=bool)
+        conservar[[estado.posiciones[i] for i in quitar if i in estado.posiciones]] = False
+        partes = [estado.vectors if conservar.all() else estado.vectors[conservar]]
+        if texts:
+            partes.append(estado.vectorizer.transform(texts).astype(np.float32))
+        vectors = sp_vstack(partes, format='csr')
+        sentencias_ids = np.concatenate([estado.sentencias_ids[conservar], np.asarray(ids, dtype=np.int64)])
+        fechas = np.concatenate([estado.fechas[conservar], np.asarray(fechas, dtype=np.int64)])
+        
+        self.state = _index_state(estado.vectorizer, vectors, sentencias_ids, fechas, version,
+                                  estado.ajustadas, estado.agregadas + len(ids))
+        logger.info(f"Índice actualizado: {len(ids)} sentencias vectorizadas, "
+                    f"{len(conservar) - int(conservar.sum())} filas reemplazadas o eliminadas")
+        return True
+    
+    def save(self, directorio):
+        """
+        Guarda el índice en `directorio`: vocabulario (JSON), IDF, ids, fechas y los
+        arreglos de la matriz dispersa como .npy sin comprimir, que `load`
+        mapea en memoria. El manifiesto se reemplaza al final de forma atómica,
+        así que otro proceso nunca lee un índice a medio escribir.
+        
+        :return: True si se guardó.
+        """
+        estado = self.state
+        if estado.vectors is None:
+            return False
+        
+        os.makedirs(directorio, exist_ok=True)
+        inicio = time.time()
+        prefijo = f"{estado.version or 0}-{uuid.uuid4().hex[:8]}"
+        arreglos = {
+            'data': estado.vectors.data,
+            'indices': estado.vectors.indices,
+            'indptr': estado.vectors.indptr,
+            'ids': np.asarray(estado.sentencias_ids, dtype=np.int64),
+            'fechas': estado.fechas,
+            'idf': estado.vectorizer.idf_,
+        }
+        for nombre, arreglo in arreglos.items():
+            np.save(os.path.join(directorio, f"{prefijo}.{nombre}.npy"), arreglo)
+        with open(os.path.join(directorio, f"{prefijo}.vocabulario.json"), 'w', encoding='utf-8') as f:
+            json.dump({termino: int(i) for termino, i in estado.vectorizer.vocabulary_.items()}, f, ensure_ascii=False)
+        
+        manifiesto = {
+            'version': estado.version,
+            'prefijo': prefijo,
+            'forma': list(estado.vectors.shape),
+            'ajustadas': estado.ajustadas,
+            'agregadas': estado.agregadas,
+            'parametros': self._parameters(),
+            'creado': datetime.now().isoformat(),
+        }
+        ruta = os.path.join(directorio, self.INDEX_MANIFEST)
+        with open(f"{ruta}.{prefijo}.tmp", 'w', encoding='utf-8') as f:
+            json.dump(manifiesto, f)
+        os.replace(f"{ruta}.{prefijo}.tmp", ruta)
+        
+        # Borrar todo índice que no sea el del manifiesto vigente (de cualquier
+        # versión, también reconstrucciones de la misma). Solo archivos
+        # anteriores a este guardado: los más nuevos pueden ser de otro proceso
+        # que aún está escribiendo. Los procesos que tengan mapeado un índice
+        # borrado conservan sus páginas hasta soltarlo.
+        vigente = (self.read_manifest(directorio) or {}).get('prefijo')
+        for nombre in os.listdir(directorio):
+            ruta_archivo = os.path.join(directorio, nombre)
+            if nombre == self.INDEX_MANIFEST or nombre.startswith(f"{vigente}."):
+                continue
+            try:
+                if os.path.getmtime(ruta_archivo) < inicio:
+                    os.remove(ruta_archivo)
+            except OSError:
+                pass
+        
+        logger.info(f"Índice de similitud guardado en {directorio} (versión {estado.version})")
+        return True
+    
+    def read_manifest(self, directorio):
+        """
+        Manifiesto del índice guardado en `directorio` (versión, prefijo de
+        sus archivos, ajustadas/agregadas...), o None si no hay índice o se
+        guardó con otros parámetros.
+        """
+        try:
+            with open(os.path.join(directorio, self.INDEX_MANIFEST), encoding='utf-8') as f:
+                manifiesto = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return manifiesto if manifiesto.get('parametros') == self._parameters() else None
+    
+    def load(self, directorio):
+        """
+        Carga el índice guardado por `save`. La matriz queda mapeada en
+        memoria (solo lectura), de modo que los procesos que cargan el mismo
+        índice comparten sus páginas.
+        
+        :return: True si se cargó; False si no hay índice o no es compatible.
+        """
+        ruta = os.path.join(directorio, self.INDEX_MANIFEST)
+        if not os.path.exists(ruta):
+            return False
+        
+        try:
+            with open(ruta, encoding='utf-8') as f:
+                manifiesto = json.load(f)
+            if manifiesto.get('parametros') != self._parameters():
+                logger.info("El índice de similitud guardado usa otros parámetros; se ignorará")
+                return False
+            
+            prefijo = manifiesto['prefijo']
+            
+            def cargar(nombre):
+                return np.load(os.path.join(directorio, f"{prefijo}.{nombre}.npy"), mmap_mode='r')
+            
+            vectors = csr_matrix((cargar('data'), cargar('indices'), cargar('indptr')),
+                                 shape=tuple(manifiesto['forma']), copy=False)
+            with open(os.path.join(directorio, f"{prefijo}.vocabulario.json"), encoding='utf-8') as f:
+                vectorizer = self._new_vectorizer(json.load(f))
+            vectorizer.idf_ = np.array(cargar('idf'))
+            ids = np.array(cargar('ids'))
+            fechas = np.array(cargar('fechas'))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No se pudo cargar el índice de similitud de {directorio}: {e}")
+            return False
+        
+        self.state = _index_state(vectorizer, vectors, ids, fechas, manifiesto['version'],
+                                  manifiesto.get('ajustadas', len(ids)), manifiesto.get('agregadas', 0))
+        logger.info(f"Índice de similitud cargado con {len(ids)} sentencias (versión {self.version})")
+        return True
+    
+    @staticmethod
+    def top_k(scores, sentencias_ids, threshold, limit):
+        """
+        Las `limit` mejores puntuaciones de `scores` (una por fila del índice)
+        que alcanzan `threshold`, de mayor a menor. Usa `argpartition`, así que
+        solo se ordenan las `limit` candidatas y no todo el índice.
+        """
+        limit = min(limit, len(scores))
+        if limit <= 0:
+            return []
+        candidatas = np.argpartition(-scores, limit - 1)[:limit]
+        candidatas = candidatas[np.argsort(-scores[candidatas], kind='stable')]
+        return [{'id': int(sentencias_ids[i]), 'similarity': float(scores[i])}
+                for i in candidatas if scores[i] >= threshold]
     
     def find_similar(self, sentencia_id, threshold=0.3, limit=5):
-        """Encuentra sentencias similares basándose en contenido."""
-        if self.vectors is None:
+        """
+        Encuentra sentencias similares basándose en contenido.
+        
+        Las filas del índice están normalizadas, así que la similitud coseno
+        con todas las sentencias es un único producto matriz dispersa-vector.
+        """
+        # Una sola lectura del estado: matriz, ids y posiciones del mismo índice
+        estado = self.state
+        if estado.vectors is None:
             return []
         
-        # Verificar si sentencia_id existe en la lista
-        if sentencia_id not in self.sentencias_ids:
+        fila = estado.posiciones.get(sentencia_id)
+        if fila is None:
             return []
         
         try:
-            idx = self.sentencias_ids.index(sentencia_id)
-            vector = self.vectors[idx:idx+1]  # Mantener como matriz 2D
-            
-            # Calcular similitudes
-            similarities = cosine_similarity(vector, self.vectors).flatten()
-            
-            # Crear lista de índices con sus similitudes
-            similarity_pairs = [(i, sim) for i, sim in enumerate(similarities)]
+            scores = estado.vectors @ estado.vectors[fila].toarray().ravel()
+            scores[fila] = -1  # excluir la misma sentencia
+            return self.top_k(scores, estado.sentencias_ids, threshold, limit)
+        except Exception as e:
+            logger.error(f"Error al buscar similares: {e}")
+            return []
+    
+    def find_similar_text(self, texto, threshold=0.0, limit=10, fecha_desde=None, fecha_hasta=None, ids=None):
+        """
+        Sentencias más parecidas a un texto libre (p. ej. un párrafo de un escrito).
+        
+        El texto se vectoriza con el vocabulario/IDF del índice y se puntúa
+        como `find_similar`. Los filtros se aplican como máscara de filas antes
+        de elegir el top-k; si dejan pocas filas, solo esas se multiplican.
+        
+        :param fecha_desde: Opcional. Cota YYYYMMDD inferior de la fecha de publicación.
+        :param fecha_hasta: Opcional. Cota YYYYMMDD superior de la fecha de publicación.
+        :param ids: Opcional. Ids permitidos (p. ej. los que tienen ciertas palabras clave).
+        """
+        estado = self.state
+        if estado.vectors is None or not texto or not texto.strip():
+            return []
+        
+        try:
+            consulta = estado.vectorizer.transform([texto])
+            if consulta.nnz == 0:
+                # Ningún término del texto está en el vocabulario del índice
+                return []
+            consulta = consulta.toarray().ravel().astype(np.float32)
             
-            # Ordenar por similitud (excluyendo la misma sentencia)
-            similarity_pairs.sort(key=lambda x: x[1], reverse=True)
+            mascara = None
+            if fecha_desde is not None or fecha_hasta is not None:
+                mascara = np.ones(len(estado.fechas), dtype=bool)
+                if fecha_desde is not None:
+                    mascara &= estado.fechas >= fecha_desde
+                if fecha_hasta is not None:
+                    mascara &= estado.fechas <= fecha_hasta
+            if ids is not None:
+                permitidas = np.zeros(len(estado.sentencias_ids), dtype=bool)
+                permitidas[[estado.posiciones[i] for i in ids if i in estado.posiciones]] = True
+                mascara = permitidas if mascara is None else mascara & permitidas
             
-            results = []
-            for i, sim_score in similarity_pairs:
-                if i != idx and sim_score >= threshold:
-                    results.append({
-                        'id': self.sentencias_ids[i],
-                        'similarity': float(sim_score)
-                    })
-                    if len(results) >= limit:
-                        break
+            if mascara is None:
+                scores = estado.vectors @ consulta
+                return self.top_k(scores, estado.sentencias_ids, threshold, limit)
             
-            return results
+            filas = np.flatnonzero(mascara)
+            scores = estado.vectors[filas] @ consulta
+            return self.top_k(scores, estado.sentencias_ids[filas], threshold, limit)
         except Exception as e:
-            logger.error(f"Error al buscar similares: {e}")
+            logger.error(f"Error al buscar sentencias similares a un texto: {e}")
             return []
-    
-    def extract_entities(self, text):
+
+    def iter_neighbors(self, k, filas=None, block_size=None):
+        """
+        Recorre los `k` vecinos más similares de cada sentencia del índice (o
+        solo de las `filas` indicadas).
+        
+        Cada bloque de filas se multiplica contra la matriz por bloques de
+        columnas y se conserva un top-k parcial por fila, así que la memoria
+        depende de `block_size` y no del cuadrado del número de sentencias.
+        Los bloques se densifican antes de multiplicarlos: con 1000 términos
+        por sentencia los productos son prácticamente densos y BLAS los
+        resuelve mucho más rápido que un producto disperso.
+        
+        :return: generador de listas, una por bloque de filas, de
+                 (sentencia_id, [(vecino_id, similitud), ...]) de mayor a menor
+                 similitud, solo con similitud positiva.
+        """
+        estado = self.state
+        if estado.vectors is None:
+            return
+        vectors = estado.vectors
+        n = vectors.shape[0]
+        k = min(k, n - 1)
+        if k <= 0:
+            return
+        block_size = block_size or config.SIMILARITY_BLOCK_SIZE
+        filas = np.arange(n) if filas is None else np.asarray(filas, dtype=np.int64)
+        
+        for inicio in range(0, len(filas), block_size):
+            bloque = filas[inicio:inicio + block_size]
+            izquierda = vectors[bloque].toarray()
+            mejores = np.full((len(bloque), k), -1.0, dtype=np.float32)
+            mejores_filas = np.zeros((len(bloque), k), dtype=np.int64)
+            
+            for columna in range(0, n, block_size):
+                derecha = vectors[columna:columna + block_size].toarray()
+                scores = izquierda @ derecha.T
+                # Excluir cada sentencia de sus propios vecinos
+                propias = np.nonzero((bloque >= columna) & (bloque < columna + len(derecha)))[0]
+                scores[propias, bloque[propias] - columna] = -1
+                
+                candidatas = np.concatenate([mejores, scores], axis=1)
+                candidatas_filas = np.concatenate(
+                    [mejores_filas, np.broadcast_to(np.arange(columna, columna + len(derecha)), scores.shape)], axis=1)
+                top = np.argpartition(-candidatas, k - 1, axis=1)[:, :k]
+                mejores = np.take_along_axis(candidatas, top, axis=1)
+                mejores_filas = np.take_along_axis(candidatas_filas, top, axis=1)
+            
+            orden = np.argsort(-mejores, axis=1, kind='stable')
+            mejores = np.take_along_axis(mejores, orden, axis=1)
+            mejores_filas = np.take_along_axis(mejores_filas, orden, axis=1)
+            yield [
+                (int(estado.sentencias_ids[fila]),
+                 [(int(estado.sentencias_ids[j]), float(s)) for j, s in zip(vecinas, puntuaciones) if s > 0])
+                for fila, vecinas, puntuaciones in zip(bloque, mejores_filas, mejores)
+            ]
+
+    @staticmethod
+    def extract_entities(text):
         """Extrae entidades nombradas del texto (versión simplificada)."""
         entities = {
             'personas': [],
@@ -266,93 +703,82 @@ class FavoritesManager:
     
     def init_favorites_table(self):
         """Crea la tabla de favoritos si no existe."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS favoritos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sentencia_id INTEGER,
-                fecha_agregado TEXT,
-                notas TEXT,
-                etiquetas TEXT,
-                FOREIGN KEY (sentencia_id) REFERENCES sentencias(id),
-                UNIQUE(sentencia_id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        with connection(self.db_name) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS favoritos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    sentencia_id INTEGER,
+                    fecha_agregado TEXT,
+                    notas TEXT,
+                    etiquetas TEXT,
+                    FOREIGN KEY (sentencia_id) REFERENCES sentencias(id),
+                    UNIQUE(sentencia_id)
+                )
+            ''')
     
     def add_favorite(self, sentencia_id, notas='', etiquetas=''):
         """Agrega una sentencia a favoritos."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
         try:
-            cursor.execute('''
-                INSERT INTO favoritos (sentencia_id, fecha_agregado, notas, etiquetas)
-                VALUES (?, ?, ?, ?)
-            ''', (sentencia_id, datetime.now().isoformat(), notas, etiquetas))
-            conn.commit()
-            return True
+            with connection(self.db_name) as conn:
+                conn.execute('''
+                    INSERT INTO favoritos (sentencia_id, fecha_agregado, notas, etiquetas)
+                    VALUES (?, ?, ?, ?)
+                ''', (sentencia_id, datetime.now().isoformat(), notas, etiquetas))
         except sqlite3.IntegrityError:
             return False
-        finally:
-            conn.close()
+        bump_data_version()
+        return True
     
     def remove_favorite(self, sentencia_id):
         """Elimina una sentencia de favoritos."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM favoritos WHERE sentencia_id = ?', (sentencia_id,))
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with connection(self.db_name) as conn:
+            affected = conn.execute('DELETE FROM favoritos WHERE sentencia_id = ?', (sentencia_id,)).rowcount
+        if affected:
+            bump_data_version()
         return affected > 0
     
-    def get_favorites(self):
-        """Obtiene todas las sentencias favoritas con sus datos."""
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT s.*, f.fecha_agregado, f.notas, f.etiquetas
-            FROM favoritos f
-            JOIN sentencias s ON f.sentencia_id = s.id
-            ORDER BY f.fecha_agregado DESC
-        ''')
-        
-        favorites = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+    def get_favorites(self, columnas):
+        """
+        Obtiene todas las sentencias favoritas con sus datos.
+        
+        :param columnas: Columnas de `sentencias s` a incluir (p. ej. las del listado).
+        """
+        with connection(self.db_name, row_factory=sqlite3.Row) as conn:
+            cursor = conn.execute(f'''
+                SELECT {columnas}, f.fecha_agregado, f.notas, f.etiquetas
+                FROM favoritos f
+                JOIN sentencias s ON f.sentencia_id = s.id
+                ORDER BY f.fecha_agregado DESC
+            ''')
+            favorites = [dict(row) for row in cursor.fetchall()]
         return favorites
     
     def is_favorite(self, sentencia_id):
         """Verifica si una sentencia está en favoritos."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM favoritos WHERE sentencia_id = ?', (sentencia_id,))
-        result = cursor.fetchone() is not None
-        conn.close()
+        with connection(self.db_name) as conn:
+            result = conn.execute('SELECT 1 FROM favoritos WHERE sentencia_id = ?', (sentencia_id,)).fetchone() is not None
         return result
     
     def update_notes(self, sentencia_id, notas):
         """Actualiza las notas de una sentencia favorita."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE favoritos SET notas = ? WHERE sentencia_id = ?
-        ''', (notas, sentencia_id))
-        affected = cursor.rowcount
-        conn.commit()
-        conn.close()
+        with connection(self.db_name) as conn:
+            affected = conn.execute('''
+                UPDATE favoritos SET notas = ? WHERE sentencia_id = ?
+            ''', (notas, sentencia_id)).rowcount
+        if affected:
+            bump_data_version()
         return affected > 0
 
 class ComparisonTool:
     """Herramienta para comparar sentencias."""
     
     @staticmethod
-    def compare_sentencias(sentencia1, sentencia2):
-        """Compara dos sentencias y retorna las diferencias."""
+    def compare_sentencias(sentencia1, sentencia2, db_name=None):
+        """
+        Compara dos sentencias y retorna las diferencias.
+        
+        Las palabras clave se leen de `sentencia_palabras`, de más a menos peso.
+        """
         comparison = {
             'metadata': {},
             'content_similarity': 0,
@@ -375,12 +801,17 @@ class ComparisonTool:
             }
         
         # Comparar palabras clave
-        keywords1 = set(sentencia1.get('palabras_clave', '').split(', '))
-        keywords2 = set(sentencia2.get('palabras_clave', '').split(', '))
-        
-        comparison['common_keywords'] = list(keywords1 & keywords2)
-        comparison['unique_keywords']['sentencia1'] = list(keywords1 - keywords2)
-        comparison['unique_keywords']['sentencia2'] = list(keywords2 - keywords1)
+        with connection(db_name) as conn:
+            filas = conn.execute('''
+                SELECT sentencia_id, palabra FROM sentencia_palabras
+                WHERE sentencia_id IN (?, ?) ORDER BY peso DESC, palabra
+            ''', (sentencia1['id'], sentencia2['id'])).fetchall()
+        keywords1 = [palabra for id_, palabra in filas if id_ == sentencia1['id']]
+        keywords2 = [palabra for id_, palabra in filas if id_ == sentencia2['id']]
+        
+        comparison['common_keywords'] = [p for p in keywords1 if p in keywords2]
+        comparison['unique_keywords']['sentencia1'] = [p for p in keywords1 if p not in keywords2]
+        comparison['unique_keywords']['sentencia2'] = [p for p in keywords2 if p not in keywords1]
         
         # Calcular similitud de contenido
         fundamentos1 = ' '.join(sentencia1.get('fundamentos', []) if isinstance(sentencia1.get('fundamentos'), list) else [sentencia1.get('fundamentos', '')])
@@ -401,6 +832,124 @@ class ComparisonTool:
         
         return comparison
 
+class EnrichmentPool:
+    """Etapa de enriquecimiento que reparte lotes de registros entre procesos."""
+    
+    def __init__(self, workers=None, min_batch=None):
+        self.workers = workers if workers is not None else config.ENRICHMENT_WORKERS
+        if self.workers <= 0:
+            self.workers = multiprocessing.cpu_count()
+        self.min_batch = min_batch if min_batch is not None else config.ENRICHMENT_MIN_BATCH
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def _get_executor(self):
+        """Crea el pool de procesos la primera vez que se necesita."""
+        with self._lock:
+            if self._executor is None:
+                # 'spawn' evita heredar locks de los hilos de Flask al hacer fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                logger.info(f"Pool de enriquecimiento iniciado con {self.workers} procesos")
+            return self._executor
+    
+    def map(self, fundamentos_list):
+        """
+        Enriquece una lista de fundamentos y retorna los resultados en el mismo orden.
+        
+        Los lotes pequeños se procesan en serie para no pagar el costo de
+        serialización entre procesos.
+        """
+        if self.workers <= 1 or len(fundamentos_list) < self.min_batch:
+            return [enrich_record(f) for f in fundamentos_list]
+        
+        chunksize = max(1, len(fundamentos_list) // (self.workers * 4))
+        try:
+            return list(self._get_executor().map(enrich_record, fundamentos_list, chunksize=chunksize))
+        except Exception as e:
+            logger.error(f"Error en el pool de enriquecimiento, procesando en serie: {e}")
+            self.shutdown()
+            return [enrich_record(f) for f in fundamentos_list]
+    
+    def imap(self, func, items, *args, min_items=2):
+        """
+        Aplica `func(item, *args)` a cada elemento de `items` en los procesos
+        del pool y genera los resultados en el mismo orden.
+        
+        Solo mantiene `2 * workers` elementos en vuelo, así que `items` puede
+        ser un generador grande (p. ej. lotes leídos de la base de datos) sin
+        que se cargue entero. Como en `map`, si hay menos de `min_items`
+        elementos se procesan en serie sin arrancar los procesos.
+        """
+        items = iter(items)
+        primeros = list(islice(items, min_items))
+        if self.workers <= 1 or len(primeros) < min_items:
+            for item in chain(primeros, items):
+                yield func(item, *args)
+            return
+        
+        executor = self._get_executor()
+        pendientes = deque()
+        for item in chain(primeros, items):
+            pendientes.append(executor.submit(func, item, *args))
+            if len(pendientes) >= 2 * self.workers:
+                yield pendientes.popleft().result()
+        while pendientes:
+            yield pendientes.popleft().result()
+
+    def shutdown(self):
+        """Detiene los procesos del pool."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+def extract_keywords(fundamentos):
+    """Extrae palabras clave de los fundamentos."""
+    if isinstance(fundamentos, list):
+        texto = ' '.join(fundamentos)
+    else:
+        texto = fundamentos
+    
+    # Extraer palabras relevantes
+    palabras = re.findall(r'\b[a-záéíóúñ]{' + str(config.MIN_WORD_LENGTH) + r',}\b', texto.lower())
+    palabras_filtradas = [p for p in palabras if p not in config.STOPWORDS]
+    
+    # Contar frecuencia
+    contador = Counter(palabras_filtradas)
+    
+    # Retornar las palabras más comunes
+    palabras_clave = [palabra for palabra, _ in contador.most_common(config.MAX_KEYWORDS)]
+    return ', '.join(palabras_clave)
+
+def generate_summary(fundamentos):
+    """Genera un resumen de los fundamentos."""
+    if isinstance(fundamentos, list):
+        texto = ' '.join(fundamentos[:3])  # Primeros 3 fundamentos
+    else:
+        texto = fundamentos
+    
+    # Limpiar texto
+    texto = re.sub(r'\s+', ' ', texto).strip()
+    
+    # Limitar longitud
+    if len(texto) > config.SUMMARY_LENGTH:
+        texto = texto[:config.SUMMARY_LENGTH-3] + '...'
+    
+    return texto
+
+def enrich_record(fundamentos):
+    """Calcula palabras clave, resumen y entidades (JSON) de unos fundamentos."""
+    texto = ' '.join(fundamentos) if isinstance(fundamentos, list) else (fundamentos or '')
+    entidades = TextAnalyzer.extract_entities(texto)
+    return (
+        extract_keywords(fundamentos),
+        generate_summary(fundamentos),
+        json.dumps(entidades, ensure_ascii=False)
+    )
+
 # Función auxiliar para limpiar texto legal
 def clean_legal_text(text):
     """Limpia y normaliza texto legal."""